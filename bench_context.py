@@ -0,0 +1,127 @@
+import io
+import os
+import sys
+import time
+import tempfile
+import contextlib
+
+# Benchmarks the per-webhook context path against a throwaway database.
+# Uses BENCH_DATABASE_URL if set (e.g. a scratch Postgres DB), otherwise a
+# temporary SQLite file. Never point it at the real database: it creates
+# and drops tables.
+# Usage: python bench_context.py [users ...]   (default: 10 100 1000)
+if "BENCH_DATABASE_URL" in os.environ:
+    os.environ["DATABASE_URL"] = os.environ["BENCH_DATABASE_URL"]
+else:
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+os.environ["SESSION_CACHE_ENABLED"] = "false" # Measure the DB path, not session_cache hits
+
+from sqlalchemy import event
+from models import Base, engine, read_engine, SessionLocal, User, Email, EmailBody
+from email_bodies import body_row
+import context_store
+
+EMAILS_PER_USER = 3
+BODY = "Hi, we'd like to invite you to an interview next week. " * 40
+REPEATS = 20
+
+_statements = [0]
+_written = [0] # bytes of bound parameters sent with INSERT/UPDATE statements
+
+def _count(conn, cursor, statement, parameters, context, executemany):
+    _statements[0] += 1
+    if statement.lstrip().upper().startswith(("INSERT", "UPDATE")):
+        _written[0] += len(repr(parameters))
+
+for _engine in {engine, read_engine}: # SQLite reads go through a separate reader engine
+    event.listen(_engine, "before_cursor_execute", _count)
+
+def seed(n_users):
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    session = SessionLocal()
+    for u in range(n_users):
+        phone = f"1555{u:07d}"
+        session.add(User(phone_number=phone, current_active_email_id=f"{phone}-1"))
+        for i in range(1, EMAILS_PER_USER + 1):
+            session.add(Email(
+                id=f"{phone}-{i}", user_phone=phone, menu_index=i, title=f"Email {i}",
+                subject="Interview", summary="Interview invite", action="Reply",
+                sender_info="HR <hr@example.com>"
+            ))
+    session.flush() # Bodies reference emails
+    for u in range(n_users):
+        for i in range(1, EMAILS_PER_USER + 1):
+            session.add(EmailBody(**body_row(f"1555{u:07d}-{i}", BODY)))
+    session.commit()
+    session.close()
+    return "15550000000"
+
+def measure(fn):
+    _statements[0] = 0
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()): # load_context prints per row
+        for _ in range(REPEATS):
+            fn()
+    return (time.perf_counter() - started) / REPEATS * 1000, _statements[0] / REPEATS
+
+def turn_whole(phone):
+    # What a webhook turn used to do
+    context = context_store.load_context()
+    user_ctx = context.get(phone, {})
+    user_ctx["current_active_index"] = "1"
+    context[phone] = user_ctx
+    context_store.save_context(context)
+
+def turn_user(phone):
+    user_ctx = context_store.load_user_context(phone)
+    user_ctx["current_active_index"] = "1"
+    context_store.save_user_context(phone, user_ctx)
+
+def legacy_save_user_context(phone, data):
+    # save_context's per-row ORM writes before dirty tracking, for comparison
+    session = SessionLocal()
+    try:
+        user = session.query(User).filter_by(phone_number=phone).first()
+        active_idx = data.get("current_active_index")
+        if active_idx and active_idx in data:
+            user.current_active_email_id = data[active_idx].get("id")
+        user.pending_draft = data.get("pending_draft")
+        for key, val in data.items():
+            if isinstance(val, dict) and val.get("id"):
+                email_obj = session.query(Email).filter_by(id=val["id"]).first()
+                email_obj.menu_index = int(key)
+                for field, (column, default) in context_store.EMAIL_COLUMNS.items():
+                    if column != "deadline":
+                        setattr(email_obj, column, val.get(field, default))
+        session.commit()
+    finally:
+        session.close()
+
+def save_turn(phone, save):
+    # A typical webhook turn: a draft is generated and kept pending
+    user_ctx = context_store.load_user_context(phone)
+    user_ctx["pending_draft"] = f"Thanks, I'd be glad to attend. ({time.perf_counter()})"
+    _statements[0], _written[0] = 0, 0
+    save(phone, user_ctx)
+    return _statements[0], _written[0]
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10, 100, 1000]
+    print(f"Backend: {engine.url.get_backend_name()}")
+    print(f"{'users':>6} | {'load_context':>18} | {'load_user_context':>18} | {'turn (whole DB)':>18} | {'turn (per user)':>18}")
+    for n in sizes:
+        phone = seed(n)
+        results = [
+            measure(lambda: context_store.load_context().get(phone)),
+            measure(lambda: context_store.load_user_context(phone)),
+            measure(lambda: turn_whole(phone)),
+            measure(lambda: turn_user(phone)),
+        ]
+        cells = " | ".join(f"{ms:8.2f}ms {queries:5.0f}q" for ms, queries in results)
+        print(f"{n:>6} | {cells}")
+
+    print("\nSaving one webhook turn (pending draft changed):")
+    for label, save in (("per-row ORM writes", legacy_save_user_context), ("dirty-tracking upsert", context_store.save_user_context)):
+        statements, written = save_turn(phone, save)
+        print(f"   {label:>22}: {statements} round trips, {written} bytes of INSERT/UPDATE parameters")
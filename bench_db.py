@@ -0,0 +1,101 @@
+import io
+import os
+import sys
+import time
+import tempfile
+import itertools
+import contextlib
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+# Throughput of the two DB-heavy paths, per backend:
+#   webhook turn: load_user_context + save_user_context (pending draft changed)
+#   poll cycle:   load_user_context, claim 20 message IDs (3 new), save 3 new emails
+# Each backend runs in its own process, since models.py builds its engine at
+# import time. SQLite always runs (temporary file, WAL); Postgres runs when
+# BENCH_POSTGRES_URL points at a scratch database. Never point it at the real
+# database: it creates and drops tables.
+# Usage: python bench_db.py [threads ...]   (default: 1 4 8)
+OPS_PER_THREAD = 50
+BODY = "Hi, we'd like to invite you to an interview next week. " * 40
+_ids = itertools.count()
+
+def seed(n_users):
+    from models import Base, engine, SessionLocal, User, Email, EmailBody
+    from email_bodies import body_row
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    session = SessionLocal()
+    for u in range(n_users):
+        phone = f"1555{u:07d}"
+        session.add(User(phone_number=phone))
+        for i in range(1, 4):
+            session.add(Email(
+                id=f"{phone}-{i}", user_phone=phone, menu_index=i, title=f"Email {i}",
+                subject="Interview", summary="Interview invite", action="Reply"
+            ))
+    session.flush() # Bodies reference emails
+    session.add_all(EmailBody(**body_row(f"1555{u:07d}-{i}", BODY)) for u in range(n_users) for i in range(1, 4))
+    session.commit()
+    session.close()
+    return [f"1555{u:07d}" for u in range(n_users)]
+
+def webhook_turn(phone):
+    from context_store import load_user_context, save_user_context
+    user_ctx = load_user_context(phone)
+    user_ctx["pending_draft"] = f"Thanks, I'd be glad to attend. ({next(_ids)})"
+    save_user_context(phone, user_ctx)
+
+def poll_cycle(phone):
+    from context_store import load_user_context, save_user_context
+    import processed_ids
+    user_ctx = load_user_context(phone)
+    seen = [f"seen-{i}" for i in range(17)]
+    new = [f"msg-{next(_ids)}" for _ in range(3)]
+    claimed = processed_ids.claim(seen + new)
+    for index, msg_id in enumerate(claimed, start=1):
+        user_ctx[str(index)] = {
+            "id": msg_id, "title": "New email", "subject": "Interview", "summary": "Interview invite",
+            "action": "Reply", "original_body": BODY, "deadline": None, "reminder_sent": False
+        }
+    save_user_context(phone, user_ctx)
+
+def measure(fn, phones, threads):
+    # Each thread works on its own users, like separate WhatsApp senders
+    def worker(t):
+        for i in range(OPS_PER_THREAD):
+            fn(phones[(t + i * threads) % len(phones)])
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(threads) as pool:
+        list(pool.map(worker, range(threads)))
+    return threads * OPS_PER_THREAD / (time.perf_counter() - started)
+
+def run_backend(thread_counts):
+    from models import engine
+    import processed_ids
+    phones = seed(64)
+    processed_ids.claim([f"seen-{i}" for i in range(17)])
+
+    print(f"\nBackend: {engine.url.get_backend_name()} (pool size {engine.pool.size()})")
+    print(f"{'threads':>8} | {'webhook turns/s':>16} | {'poll cycles/s':>14}")
+    for threads in thread_counts:
+        turns = measure(webhook_turn, phones, threads)
+        polls = measure(poll_cycle, phones, threads)
+        print(f"{threads:>8} | {turns:16.1f} | {polls:14.1f}")
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--backend"]:
+        run_backend([int(arg) for arg in sys.argv[2:]])
+        sys.exit(0)
+
+    thread_counts = sys.argv[1:] or ["1", "4", "8"]
+    backends = [("sqlite", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db"))]
+    if os.getenv("BENCH_POSTGRES_URL"):
+        backends.append(("postgresql", os.environ["BENCH_POSTGRES_URL"]))
+    else:
+        print("(Set BENCH_POSTGRES_URL to a scratch database to benchmark Postgres too.)")
+
+    for name, url in backends:
+        env = {**os.environ, "DATABASE_URL": url, "PROCESSED_IDS_RESET_FILE": os.path.join(tempfile.mkdtemp(), "reset")}
+        subprocess.run([sys.executable, __file__, "--backend", *thread_counts], env=env, check=True)
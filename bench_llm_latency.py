@@ -0,0 +1,59 @@
+import sys
+import time
+import statistics
+import requests
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import llm_clients
+from llm_clients import GROQ_API_URL, GROQ_API_KEY, GROQ_MODEL, GROQ_TIMEOUT
+
+# Compares classification-call latency with a fresh connection per request
+# (the old bare requests.post) against the pooled keep-alive session.
+# Usage: python bench_llm_latency.py [calls]
+
+MESSAGES = [
+    {"role": "system", "content": "You are an intelligent email summarizer. Always respond with valid JSON only."},
+    {"role": "user", "content": 'Is this email important? Return {"is_important": true|false}.\nEmail: """Your interview is scheduled for Monday 10am."""'}
+]
+
+def _payload():
+    return {
+        "model": GROQ_MODEL,
+        "messages": MESSAGES,
+        "temperature": 0,
+        "max_tokens": 20,
+        "response_format": {"type": "json_object"}
+    }
+
+def fresh_connection_call():
+    headers = {"Authorization": f"Bearer {GROQ_API_KEY}", "Content-Type": "application/json"}
+    return requests.post(GROQ_API_URL, headers=headers, json=_payload(), timeout=GROQ_TIMEOUT)
+
+def pooled_call():
+    return llm_clients.groq_session().post(GROQ_API_URL, json=_payload(), timeout=GROQ_TIMEOUT)
+
+def measure(label, fn, calls):
+    timings = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        res = fn()
+        timings.append((time.perf_counter() - started) * 1000)
+        if res.status_code != 200:
+            print(f"❌ {label}: HTTP {res.status_code} {res.text[:200]}")
+            return
+        time.sleep(0.5) # Stay under the free-tier rate limit
+    timings.sort()
+    p95 = timings[min(len(timings) - 1, int(round(0.95 * (len(timings) - 1))))]
+    print(f"{label:>18}: p50 {statistics.median(timings):7.1f} ms   p95 {p95:7.1f} ms   ({calls} calls)")
+
+if __name__ == "__main__":
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    if not GROQ_API_KEY:
+        print("❌ GROQ_API_KEY is required for the benchmark.")
+        sys.exit(1)
+
+    llm_clients.warm_up("groq")
+    measure("fresh connection", fresh_connection_call, calls)
+    measure("pooled keep-alive", pooled_call, calls)
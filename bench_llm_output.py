@@ -0,0 +1,153 @@
+# bench_llm_output.py
+import re
+import sys
+import json
+import time
+import random
+import unicodedata
+import llm_output
+
+# Checks llm_output against llm_output_corpus.jsonl (real malformed
+# responses we've seen), fuzzes it with random mutations, and times it
+# against the regex-based parser it replaced.
+#
+#   python bench_llm_output.py [iterations]
+
+CORPUS_FILE = "llm_output_corpus.jsonl"
+FUZZ_ROUNDS = 2000
+
+SCHEMAS = {
+    "classification": llm_output.CLASSIFICATION_SCHEMA,
+    "intent": llm_output.INTENT_SCHEMA,
+    "batch": llm_output.BATCH_ITEM_SCHEMA,
+}
+
+def legacy_clean_llm_output(output):
+    # The previous llm_processor.clean_llm_output, kept for comparison
+    try:
+        normalized_output = unicodedata.normalize("NFKD", output)
+        normalized_output = re.sub(r'```(?:json|python)?\s*', '', normalized_output)
+        normalized_output = re.sub(r'```', '', normalized_output)
+
+        match = re.search(r'\{[^{}]*"is_important"[^{}]*\}', normalized_output, re.DOTALL)
+        if not match:
+            match = re.search(r'\{.*?\}', normalized_output, re.DOTALL)
+            if not match:
+                return None
+        return json.loads(match.group(0))
+    except Exception:
+        return None
+
+def parse(case):
+    schema = SCHEMAS[case["schema"]]
+    if case["schema"] == "batch":
+        return llm_output.parse_list(case["output"], schema)
+    return llm_output.parse_object(case["output"], schema)
+
+def outcome(case, result):
+    if case["schema"] == "batch":
+        return len(result)
+    if result is None:
+        return None
+    return result["is_important"] if case["schema"] == "classification" else result["intent"]
+
+def check_corpus(corpus):
+    failures = 0
+    legacy_ok = 0
+    for case in corpus:
+        got = outcome(case, parse(case))
+        if got != case["expect"]:
+            failures += 1
+            print(f"❌ expected {case['expect']!r}, got {got!r}: {case['output'][:80]!r}")
+        if case["schema"] == "classification":
+            legacy = legacy_clean_llm_output(case["output"])
+            legacy_got = legacy.get("is_important") if isinstance(legacy, dict) and "is_important" in legacy else None
+            legacy_ok += legacy_got == case["expect"]
+    classification = sum(1 for c in corpus if c["schema"] == "classification")
+    print(f"Corpus: {len(corpus) - failures}/{len(corpus)} as expected "
+          f"(old parser: {legacy_ok}/{classification} classification cases)")
+    return failures
+
+def _mutate(text, rng):
+    choice = rng.randrange(6)
+    if choice == 0:
+        return text[:rng.randrange(len(text) + 1)] # Truncated stream
+    if choice == 1:
+        return "Sure! " + text + " Hope that helps {:" # Prose around it
+    if choice == 2:
+        i = rng.randrange(len(text) + 1)
+        return text[:i] + rng.choice('{}[]",:\'\\“”') + text[i:]
+    if choice == 3:
+        return "```json\n" + text + "\n```"
+    if choice == 4:
+        return text.replace("true", "True").replace("null", "None")
+    return text * 2
+
+def _valid_typed(result, schema):
+    for name, (field_type, _) in schema.items():
+        value = result.get(name)
+        if value is None:
+            continue
+        if field_type == "bool" and not isinstance(value, bool):
+            return False
+        if field_type in ("str", "datetime") and not isinstance(value, str):
+            return False
+        if isinstance(field_type, tuple) and value not in field_type:
+            return False
+    return True
+
+def fuzz(corpus, rounds=FUZZ_ROUNDS, seed=0):
+    rng = random.Random(seed)
+    for _ in range(rounds):
+        case = rng.choice(corpus)
+        mutated = dict(case, output=_mutate(case["output"], rng))
+        schema = SCHEMAS[case["schema"]]
+        try:
+            result = parse(mutated)
+        except Exception as e:
+            print(f"❌ Parser raised {e!r} on {mutated['output'][:80]!r}")
+            return 1
+        results = result if isinstance(result, list) else [result] if result else []
+        if not all(_valid_typed(r, schema) for r in results):
+            print(f"❌ Untyped result {result!r} from {mutated['output'][:80]!r}")
+            return 1
+    print(f"Fuzz: {rounds} mutated outputs parsed without errors or untyped values")
+    return 0
+
+TIMING_REPEATS = 5 # Best of, to keep scheduler noise out
+
+def _time(fn, outputs, iterations):
+    best = None
+    for _ in range(TIMING_REPEATS):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            for output in outputs:
+                fn(output)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best / (iterations * len(outputs)) * 1e6
+
+def benchmark(corpus, iterations):
+    # Well-formed: plain JSON, maybe fenced or with prose around it. The rest
+    # only parse after a repair pass (or not at all), so they cost more.
+    cases = [c for c in corpus if c["schema"] == "classification"]
+    groups = {
+        "well-formed": [c["output"] for c in cases if next(llm_output._iter_values(c["output"]), None) is not None],
+        "malformed": [c["output"] for c in cases if next(llm_output._iter_values(c["output"]), None) is None],
+        "all": [c["output"] for c in cases],
+    }
+    for name, outputs in groups.items():
+        if not outputs:
+            continue
+        new = _time(lambda o: llm_output.parse_object(o, llm_output.CLASSIFICATION_SCHEMA), outputs, iterations)
+        old = _time(legacy_clean_llm_output, outputs, iterations)
+        print(f"Per parse ({name}, {len(outputs)} cases): old {old:.1f}us, new {new:.1f}us")
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with open(CORPUS_FILE, encoding="utf-8") as f:
+        corpus = [json.loads(line) for line in f if line.strip()]
+
+    failures = check_corpus(corpus) + fuzz(corpus)
+    benchmark(corpus, iterations)
+    sys.exit(1 if failures else 0)
@@ -1,4 +1,5 @@
 from models import SessionLocal, ProcessedEmail, Base, engine
+import processed_ids
 from sqlalchemy import text
 import os
 
@@ -12,6 +13,10 @@ def clear_cache():
         session.commit()
         print(f"✅ Deleted {num_deleted} records from 'processed_emails' table.")
         
+        # Running servers keep seen IDs in memory; tell them to drop it
+        processed_ids.invalidate()
+        print("✅ Invalidated in-memory processed-ID cache.")
+        
         # 2. Clear File Cache (if exists - generic fallback)
         if os.path.exists("processed_ids.txt"):
             os.remove("processed_ids.txt")
@@ -1,4 +1,10 @@
-from models import SessionLocal, User, Email
+from models import SessionLocal, User, Email, EmailBody, PENDING_REMINDER
+import processed_ids
+import session_cache
+from email_bodies import body_row, load_body
+from sqlalchemy import and_
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 import json
 from datetime import datetime
 
@@ -12,6 +18,64 @@ from datetime import datetime
 #       "2": { ... email data ... }
 #   }
 # }
+# Email dicts loaded from the DB have no "original_body"; use email_body().
+
+MAX_MENU_EMAILS = 20
+
+# Context dict key -> (emails column, default when missing)
+EMAIL_COLUMNS = {
+    "threadId": ("thread_id", None),
+    "internet_message_id": ("internet_message_id", None),
+    "title": ("title", ""),
+    "subject": ("subject", ""),
+    "from": ("sender_info", None),
+    "summary": ("summary", ""),
+    "action": ("action", ""),
+    "reminder_sent": ("reminder_sent", False),
+    "deadline": ("deadline", None),
+}
+
+class UserContext(dict):
+    """
+    One user's context dict. Remembers what it looked like when it was
+    loaded (or last saved), so save_user_context only writes the users and
+    emails columns that actually changed.
+    """
+
+    def __init__(self, data=(), exists=False, generation=None):
+        super().__init__(data)
+        self.exists = exists # Whether the users row is known to exist
+        self.generation = generation # session_cache generation it was loaded at
+        self.mark_saved()
+
+    def mark_saved(self):
+        self._snapshot = {k: dict(v) if isinstance(v, dict) else v for k, v in self.items()}
+
+    def snapshot(self):
+        return self._snapshot
+
+def _email_to_dict(email):
+    return {
+        "id": email.id,
+        "threadId": email.thread_id,
+        "internet_message_id": email.internet_message_id,
+        "title": email.title,
+        "subject": email.subject,
+        "summary": email.summary,
+        "action": email.action,
+        "deadline": email.deadline.isoformat() if email.deadline else None,
+        "from": email.sender_info,
+        "reminder_sent": email.reminder_sent
+    }
+
+def email_body(email_data):
+    """
+    The body of an email from a context dict: the one it was fetched with,
+    if still there, otherwise loaded (and decompressed) on demand.
+    """
+    if email_data.get("original_body") is not None:
+        return email_data["original_body"]
+    return load_body(email_data.get("id"))
 
 def load_context():
     session = SessionLocal()
@@ -30,117 +94,299 @@ def load_context():
                 user_data["pending_draft"] = user.pending_draft
             
             # Load Emails
-            emails = session.query(Email).filter_by(user_phone=user.phone_number).limit(20).all()
+            emails = session.query(Email).filter_by(user_phone=user.phone_number).limit(MAX_MENU_EMAILS).all()
             print(f"   -> Loaded {len(emails)} emails for {user.phone_number}")
             for email in emails:
                 if email.menu_index:
                     print(f"      -> Email Index {email.menu_index} (ID: {email.id})")
-                    user_data[str(email.menu_index)] = {
-                        "id": email.id,
-                        "threadId": email.thread_id,
-                        "internet_message_id": email.internet_message_id,
-                        "title": email.title,
-                        "subject": email.subject,
-                        "summary": email.summary,
-                        "action": email.action,
-                        "deadline": email.deadline.isoformat() if email.deadline else None,
-                        "from": email.sender_info,
-                        "original_body": email.original_body,
-                        "reminder_sent": email.reminder_sent
-                    }
+                    user_data[str(email.menu_index)] = _email_to_dict(email)
             
-            context[user.phone_number] = user_data
+            context[user.phone_number] = UserContext(user_data, exists=True)
     except Exception as e:
         print(f"❌ DB Load Error: {e}")
     finally:
         session.close()
     return context
 
-def check_if_processed(msg_id):
+def user_context_query(session, phone):
+    # Served by ix_emails_user_menu (see migrations.py check)
+    return (
+        session.query(User, Email)
+        .outerjoin(Email, and_(Email.user_phone == User.phone_number, Email.menu_index.isnot(None)))
+        .filter(User.phone_number == phone)
+        .order_by(Email.menu_index)
+        .limit(MAX_MENU_EMAILS)
+    )
+
+def load_user_context(phone):
+    """
+    Same shape as load_context()[phone], for one user: the user row and
+    their menu emails come back in a single joined query, or from
+    session_cache when a recent turn already loaded or saved them.
+    Returns {} for unknown users.
+    """
+    cached = session_cache.get(phone)
+    if cached is not None:
+        data, exists, generation = cached
+        return UserContext(data, exists=exists, generation=generation)
+
+    generation = session_cache.generation(phone)
+    user_ctx, ok = _read_user_context(phone)
+    if ok:
+        user_ctx.generation = generation
+        session_cache.put(phone, user_ctx, user_ctx.exists, generation)
+    return user_ctx
+
+def _read_user_context(phone):
+    # Returns (context, ok); contexts from failed reads aren't cached
     session = SessionLocal()
-    from models import ProcessedEmail
-    exists = session.query(ProcessedEmail).filter_by(id=msg_id).first() is not None
-    session.close()
-    return exists
+    user_data = {}
+    try:
+        rows = user_context_query(session, phone).all()
+        if not rows:
+            return UserContext(), True
+
+        user = rows[0][0]
+        if user.pending_draft:
+            user_data["pending_draft"] = user.pending_draft
+
+        for _, email in rows:
+            if email is None or not email.menu_index:
+                continue
+            user_data[str(email.menu_index)] = _email_to_dict(email)
+            if email.id == user.current_active_email_id:
+                user_data["current_active_index"] = str(email.menu_index)
+    except Exception as e:
+        print(f"❌ DB Load Error for {phone}: {e}")
+        return UserContext(user_data), False
+    finally:
+        session.close()
+    return UserContext(user_data, exists=True), True
+
+# Processed-ID helpers; kept for callers of the old per-message API.
+# processed_ids batches the queries and keeps an in-memory front layer.
+
+def check_if_processed(msg_id):
+    return not processed_ids.filter_new([msg_id])
+
+def filter_unprocessed(msg_ids):
+    """
+    Returns the IDs from msg_ids that are not in processed_emails, in order.
+    """
+    return processed_ids.filter_new(msg_ids)
 
 def mark_as_processed(msg_id):
+    processed_ids.claim([msg_id])
+
+def load_history_id(account):
+    """
+    Returns the last synced Gmail historyId for an account, or None.
+    """
     session = SessionLocal()
-    from models import ProcessedEmail
+    from models import SyncState
     try:
-        new_entry = ProcessedEmail(id=msg_id)
-        session.add(new_entry)
+        state = session.query(SyncState).filter_by(account=account).first()
+        return state.history_id if state else None
+    finally:
+        session.close()
+
+def save_history_id(account, history_id):
+    session = SessionLocal()
+    from models import SyncState
+    try:
+        state = session.query(SyncState).filter_by(account=account).first()
+        if not state:
+            state = SyncState(account=account)
+            session.add(state)
+        state.history_id = str(history_id)
         session.commit()
-    except:
-        session.rollback() # Ignore duplicates
+    except Exception as e:
+        session.rollback()
+        print(f"❌ DB Error saving historyId: {e}")
     finally:
         session.close()
 
+def due_reminders_query(session, now, until):
+    # Served by the partial index ix_emails_pending_reminders (same predicate)
+    return session.query(Email.id, Email.user_phone, Email.menu_index, Email.title, Email.deadline).filter(
+        Email.deadline > now,
+        Email.deadline <= until,
+        PENDING_REMINDER,
+        Email.menu_index.isnot(None)
+    )
+
+def load_due_reminders(now, until):
+    """
+    Returns emails whose deadline falls in (now, until] and that have not had
+    a reminder yet, as dicts with phone, index, id, title and deadline.
+    Deadlines are stored as UTC, so this is a plain range query.
+    """
+    session = SessionLocal()
+    try:
+        rows = due_reminders_query(session, now, until).all()
+        return [
+            {"id": row.id, "phone": row.user_phone, "index": str(row.menu_index), "title": row.title, "deadline": row.deadline}
+            for row in rows
+        ]
+    finally:
+        session.close()
+
+def mark_reminders_sent(email_ids):
+    if not email_ids:
+        return
+    session = SessionLocal()
+    try:
+        phones = [row[0] for row in session.query(Email.user_phone).filter(Email.id.in_(email_ids)).distinct()]
+        session.query(Email).filter(Email.id.in_(email_ids)).update({Email.reminder_sent: True}, synchronize_session=False)
+        session.commit()
+        session_cache.invalidate(phones)
+    except Exception as e:
+        session.rollback()
+        print(f"❌ DB Error marking reminders: {e}")
+    finally:
+        session.close()
+
+def _user_values(data):
+    active_idx = data.get("current_active_index")
+    active = data.get(active_idx) if active_idx else None
+    return {
+        "current_active_email_id": active.get("id") if isinstance(active, dict) else None,
+        "pending_draft": data.get("pending_draft"),
+    }
+
+def _email_values(key, val, email_id):
+    row = {"id": email_id}
+    try:
+        row["menu_index"] = int(key)
+    except (TypeError, ValueError):
+        pass # Ignore Non-Integer keys like 'current_active_index'
+    for field, (column, default) in EMAIL_COLUMNS.items():
+        row[column] = val.get(field, default)
+
+    # Deadlines arrive normalized (UTC ISO) from deadline_parser
+    d_str = row["deadline"]
+    if d_str and not isinstance(d_str, datetime):
+        try:
+            row["deadline"] = datetime.fromisoformat(d_str)
+        except ValueError:
+            print(f"   -> ⚠️ Unparseable deadline {d_str!r} for {email_id}, not stored")
+            del row["deadline"]
+    return row
+
+def _changes(data):
+    """
+    Diffs a context dict against its snapshot. Returns (user columns that
+    changed, email rows, body rows) where each email row holds the id plus
+    only the changed columns, or every column for emails that weren't there
+    before. Bodies are written only when a dict carries a new one.
+    """
+    snapshot = data.snapshot() if isinstance(data, UserContext) else {}
+
+    user_now, user_then = _user_values(data), _user_values(snapshot)
+    user_changes = {k: v for k, v in user_now.items() if v != user_then[k] or not snapshot}
+    if user_changes.get("current_active_email_id", "") is None:
+        del user_changes["current_active_email_id"] # Never cleared, like before
+
+    email_rows = []
+    body_rows = []
+    for key, val in data.items():
+        if not isinstance(val, dict) or not val.get("id"):
+            continue
+        row = _email_values(key, val, val["id"])
+        old = snapshot.get(key)
+        body = val.get("original_body")
+        if body is not None and not (isinstance(old, dict) and old.get("id") == val["id"] and old.get("original_body") == body):
+            body_rows.append(body_row(val["id"], body))
+        if isinstance(old, dict) and old.get("id") == val["id"]:
+            old_row = _email_values(key, old, old["id"])
+            row = {k: v for k, v in row.items() if k == "id" or old_row.get(k) != v}
+            if len(row) == 1:
+                continue # Unchanged
+        else:
+            row["user_phone"] = None # Filled in by _save_user; marks a full (new) row
+        email_rows.append(row)
+    return user_changes, email_rows, body_rows
+
+def _upsert(session, model, rows, key):
+    """
+    One INSERT ... ON CONFLICT (key) DO UPDATE for rows sharing the same columns.
+    """
+    dialect = session.get_bind().dialect.name
+    if dialect not in ("postgresql", "sqlite"):
+        for row in rows:
+            session.merge(model(**row))
+        session.flush()
+        return
+
+    insert_fn = postgresql_insert if dialect == "postgresql" else sqlite_insert
+    stmt = insert_fn(model.__table__).values(rows)
+    update_columns = [c for c in rows[0] if c != key]
+    if update_columns:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[key], set_={c: stmt.excluded[c] for c in update_columns}
+        )
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=[key])
+    session.execute(stmt)
+
+def _save_user(session, phone, data):
+    """
+    Writes one user's changes: at most one statement for the users row and
+    one per distinct set of changed email columns, plus one for new bodies.
+    Returns True if anything was written.
+    """
+    user_changes, email_rows, body_rows = _changes(data)
+    exists = isinstance(data, UserContext) and data.exists
+    if exists and not user_changes and not email_rows and not body_rows:
+        return False
+
+    # 1. Users row first (emails reference it)
+    if user_changes or not exists:
+        _upsert(session, User, [{"phone_number": phone, **user_changes}], "phone_number")
+
+    # 2. Emails, grouped so each statement has a uniform column list
+    groups = {}
+    new_slots = {}
+    for row in email_rows:
+        if "user_phone" in row:
+            row["user_phone"] = phone
+            if row.get("menu_index") is not None:
+                new_slots[row["menu_index"]] = row["id"]
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+    for rows in groups.values():
+        _upsert(session, Email, rows, "id")
+    if body_rows:
+        _upsert(session, EmailBody, body_rows, "email_id")
+
+    # 3. An email moved into a menu slot takes it over from the previous one
+    if new_slots:
+        session.query(Email).filter(
+            Email.user_phone == phone,
+            Email.menu_index.in_(list(new_slots)),
+            Email.id.notin_(list(new_slots.values()))
+        ).update({Email.menu_index: None}, synchronize_session=False)
+    return True
+
 def save_context(context_dict):
     """
-    Syncs the Dictionary back to the DB.
+    Syncs the Dictionary back to the DB. Users whose UserContext hasn't
+    changed since load are skipped.
     """
     session = SessionLocal()
     try:
         print(f"💾 Saving Context for {len(context_dict)} users...")
-        for phone, data in context_dict.items():
-            if not phone: continue
-
-            # 1. Get or Create User
-            user = session.query(User).filter_by(phone_number=phone).first()
-            if not user:
-                print(f"   -> Creating NEW User: {phone}")
-                user = User(phone_number=phone)
-                session.add(user)
-                session.flush() # Flush to get it ready for relationships
-            
-            # 2. Update User Meta
-            active_idx = data.get("current_active_index")
-            if active_idx and active_idx in data:
-                email_id_target = data[active_idx].get("id")
-                user.current_active_email_id = email_id_target
-            
-            user.pending_draft = data.get("pending_draft")
-            
-            # 3. Upsert Emails
-            for key, val in data.items():
-                if isinstance(val, dict) and val.get("id"):
-                    email_id = val.get("id")
-                    
-                    email_obj = session.query(Email).filter_by(id=email_id).first()
-                    if not email_obj:
-                        print(f"   -> Saving NEW Email {key} (ID: {email_id})")
-                        email_obj = Email(id=email_id, user_phone=phone)
-                        session.add(email_obj)
-                    else:
-                        email_obj.user_phone = phone
-                    
-                    # Update fields
-                    try:
-                        email_obj.menu_index = int(key)
-                    except:
-                        pass # Ignore Non-Integer keys like 'current_active_index'
-
-                    email_obj.thread_id = val.get("threadId")
-                    email_obj.internet_message_id = val.get("internet_message_id")
-                    email_obj.title = val.get("title", "")
-                    email_obj.subject = val.get("subject", "")
-                    email_obj.sender_info = val.get("from")
-                    email_obj.summary = val.get("summary", "")
-                    email_obj.action = val.get("action", "")
-                    email_obj.original_body = val.get("original_body", "")
-                    email_obj.reminder_sent = val.get("reminder_sent", False)
-                    
-                    # Handle Deadline Parsing
-                    d_str = val.get("deadline")
-                    if d_str:
-                        try:
-                            # Try ISO format first
-                            email_obj.deadline = datetime.fromisoformat(d_str)
-                        except:
-                            pass
+        saved = {
+            phone: data for phone, data in context_dict.items()
+            if phone and _save_user(session, phone, data)
+        }
             
         session.commit()
-        print("✅ Context Saved Successfully.")
+        session_cache.invalidate(list(saved))
+        for data in saved.values():
+            if isinstance(data, UserContext):
+                data.exists = True
+                data.mark_saved()
+        print(f"✅ Context Saved Successfully ({len(saved)} changed).")
             
     except Exception as e:
         session.rollback()
@@ -149,3 +395,28 @@ def save_context(context_dict):
         traceback.print_exc()
     finally:
         session.close()
+
+def save_user_context(phone, user_data):
+    """
+    Writes back one user's context (as returned by load_user_context).
+    Only changed columns are written, in one transaction, and the saved
+    state then replaces the session_cache entry (write-through).
+    """
+    if not phone:
+        return
+    session = SessionLocal()
+    try:
+        with session_cache.save_lock(phone):
+            if _save_user(session, phone, user_data):
+                session.commit()
+                if isinstance(user_data, UserContext):
+                    user_data.exists = True
+                    user_data.mark_saved()
+                    user_data.generation = session_cache.saved(phone, user_data, user_data.generation)
+                else:
+                    session_cache.invalidate(phone)
+    except Exception as e:
+        session.rollback()
+        print(f"❌ DB Save Error for {phone}: {e}")
+    finally:
+        session.close()
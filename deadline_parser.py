@@ -0,0 +1,386 @@
+# deadline_parser.py
+import os
+import re
+import calendar
+import threading
+from datetime import datetime, timedelta, timezone, time as dt_time
+from zoneinfo import ZoneInfo
+from email_parser import MONTH_NAMES, DATE_PATTERNS
+
+# Local deadline extraction. Extends email_parser.extract_dates with
+# relative dates ("next Friday", "EOD tomorrow", "in 3 days"), times and
+# timezones, and turns the best match into a UTC datetime. That value is
+# computed once when the email is processed and stored in emails.deadline,
+# so reminders never re-parse text. The LLM's "deadline" is only
+# cross-checked against it.
+#
+# Weekdays: "Friday" / "this Friday" is the next Friday on or after today,
+# "coming Friday" the next one after today, and "next Friday" the Friday of
+# next week (weeks start on Monday). So on a Wednesday, "Friday" is in two
+# days and "next Friday" in nine.
+
+# Times without an explicit zone are read in the user's timezone (default:
+# the server's IANA zone, so DST changes are followed; UTC if it can't be found)
+USER_TIMEZONE = os.getenv("USER_TIMEZONE")
+# How to read ambiguous numeric dates like 03/04/2025: "DMY" or "MDY"
+DEADLINE_DATE_ORDER = os.getenv("DEADLINE_DATE_ORDER", "DMY").upper()
+
+END_OF_DAY = dt_time(23, 59)
+CLOSE_OF_BUSINESS = dt_time(17, 0)
+KEYWORD_WINDOW = 60 # chars before a date that are searched for "deadline", "by", ...
+TIME_WINDOW = 30 # chars around a date that are searched for a time
+PAST_YEAR_GRACE = timedelta(days=30) # "June 30" this far in the past means next year
+
+TZ_OFFSETS = {
+    "utc": 0, "gmt": 0, "z": 0,
+    "ist": 330, "sgt": 480, "jst": 540, "aest": 600, "cet": 60, "cest": 120, "bst": 60,
+    "est": -300, "edt": -240, "cst": -360, "cdt": -300, "mst": -420, "mdt": -360, "pst": -480, "pdt": -420,
+}
+WEEKDAYS = {name: i for i, name in enumerate(("mon", "tue", "wed", "thu", "fri", "sat", "sun"))}
+
+# Full names, plus abbreviations that aren't also common words ("sat", "sun").
+# "may" is also a verb, see _modal_may.
+_MONTH = (
+    r'(?P<month>' + '|'.join(calendar.month_name[1:]) + r'|sept|' + '|'.join(MONTH_NAMES) + r')\b\.?'
+)
+_WEEKDAY = r'(?P<weekday>' + '|'.join(calendar.day_name) + r'|mon|tues?|wed|thu(?:rs?)?|fri)\b\.?'
+# Weekday in front of a full date ("Tue, Mar 4") just names that date
+_LEADING_WEEKDAY = r'(?:(?:' + '|'.join(calendar.day_name) + r'|' + '|'.join(calendar.day_abbr) + r')\.?,?\s+)?'
+_TZ = r'(?:\s*\(?(?P<tz>' + '|'.join(k for k in TZ_OFFSETS if k != "z") + r'|[+-]\d{2}:?\d{2})\b\)?)?'
+_TIME = (
+    r'(?:(?P<hour>\d{1,2})(?:[:.](?P<minute>[0-5]\d))?\s*(?P<ampm>[ap])\.?m\b\.?'
+    r'|(?P<hour24>[01]?\d|2[0-3]):(?P<minute24>[0-5]\d)(?::[0-5]\d)?'
+    r'|(?P<noon>noon|midday|midnight)'
+    r'|(?P<eod>eod|end of (?:the )?(?:business )?day)|(?P<cob>cob|close of business))' + _TZ
+)
+TIME_AFTER_RE = re.compile(r'\s*(?:,|at|@|by|before|until|-)?\s*' + _TIME, re.IGNORECASE)
+TIME_BEFORE_RE = re.compile(_TIME + r'\s*(?:on\s+|,\s*)?$', re.IGNORECASE)
+
+ISO_RE = re.compile(
+    r'\b(?P<year>\d{4})-(?P<mon>\d{2})-(?P<day>\d{2})'
+    r'(?:[T ](?P<hour24>\d{2}):(?P<minute24>\d{2})(?::\d{2}(?:\.\d+)?)?(?P<tz>Z|[+-]\d{2}:?\d{2})?)?\b',
+    re.IGNORECASE
+)
+NUMERIC_RE = re.compile(r'\b(?P<a>\d{1,2})[/.-](?P<b>\d{1,2})[/.-](?P<year>\d{4}|\d{2})\b')
+DAY_MONTH_RE = re.compile(
+    r'\b' + _LEADING_WEEKDAY + r'(?P<day>\d{1,2})(?:st|nd|rd|th)?\s+(?:of\s+)?' + _MONTH + r'(?:,?\s*(?P<year>\d{4}))?\b',
+    re.IGNORECASE
+)
+MONTH_DAY_RE = re.compile(
+    r'\b' + _LEADING_WEEKDAY + _MONTH + r'\s+(?P<day>\d{1,2})(?:st|nd|rd|th)?\b(?:,?\s*(?P<year>\d{4}))?',
+    re.IGNORECASE
+)
+RELATIVE_RE = re.compile(
+    r'\b(?:(?P<day_after>day after tomorrow)|(?P<tomorrow>tomorrow|tmrw)|(?P<today>today|tonight)'
+    r'|(?:(?P<which>this|next|coming)\s+)?' + _WEEKDAY +
+    r'|(?:in|within)\s+(?P<count>\d{1,2}|a|one|two|three)\s+(?P<unit>day|week)s?'
+    r'|end of (?:the )?(?P<period>week|month)|(?P<eow>eow)'
+    r'|(?P<eod>eod|end of (?:the )?(?:business )?day)|(?P<cob>cob|close of business))\b',
+    re.IGNORECASE
+)
+RELATIVE_HINT_RE = re.compile(
+    r'\b(?:today|tonight|tomorrow|tmrw|eod|eow|cob|end of|close of|in \d|within|'
+    + '|'.join(calendar.day_name) + r'|mon|tues?|wed|thu|fri)\b',
+    re.IGNORECASE
+)
+STRONG_KEYWORD_RE = re.compile(
+    r'\b(?:deadline|due|last date|no later than|closes?|closing|expires?|submit|apply|register|rsvp)\b',
+    re.IGNORECASE
+)
+WEAK_KEYWORD_RE = re.compile(r'\b(?:by|before|until|till|latest)\b', re.IGNORECASE)
+WORD_NUMBERS = {"a": 1, "one": 1, "two": 2, "three": 3}
+ORDINAL_RE = re.compile(r'\d(?:st|nd|rd|th)\b', re.IGNORECASE)
+# Words that can follow a bare "May 3" / "3 May" that is really a date
+DATE_FOLLOWER_RE = re.compile(
+    r'\s+(?!(?:at|by|before|until|till|to|through|and|or|from|eod|cob|noon|midday|midnight)\b)[a-z]'
+)
+
+_stats = {"agree": 0, "mismatch": 0, "local_only": 0, "llm_only": 0, "none": 0}
+_lock = threading.Lock()
+_system_zone = None
+
+def _find_system_timezone():
+    name = os.getenv("TZ", "").lstrip(":")
+    if not name:
+        try:
+            with open("/etc/timezone") as f:
+                name = f.read().strip()
+        except OSError:
+            target = os.path.realpath("/etc/localtime")
+            name = target.split("zoneinfo/", 1)[1] if "zoneinfo/" in target else ""
+    try:
+        return ZoneInfo(name)
+    except Exception:
+        # A fixed offset from datetime.now().astimezone() would be wrong across DST
+        print("⚠️ Couldn't determine the server's timezone; reading deadlines in UTC. Set USER_TIMEZONE.")
+        return timezone.utc
+
+def user_timezone():
+    global _system_zone
+    if USER_TIMEZONE:
+        return ZoneInfo(USER_TIMEZONE)
+    if _system_zone is None:
+        _system_zone = _find_system_timezone()
+    return _system_zone
+
+def now_local():
+    return datetime.now(user_timezone())
+
+class _Candidate:
+    __slots__ = ("start", "end", "when", "has_time", "score")
+
+    def __init__(self, start, end, when, has_time):
+        self.start, self.end, self.when, self.has_time = start, end, when, has_time
+        self.score = 0
+
+def _tzinfo(name, default):
+    if not name:
+        return default
+    name = name.lower()
+    if name in TZ_OFFSETS:
+        return timezone(timedelta(minutes=TZ_OFFSETS[name]))
+    sign = -1 if name[0] == "-" else 1
+    digits = name[1:].replace(":", "")
+    return timezone(sign * timedelta(hours=int(digits[:2]), minutes=int(digits[2:])))
+
+def _time_from(match):
+    """Returns (time, tz name) for a TIME match, or None if the numbers are out of range."""
+    groups = match.groupdict()
+    if groups.get("eod"):
+        return END_OF_DAY, groups.get("tz")
+    if groups.get("cob"):
+        return CLOSE_OF_BUSINESS, groups.get("tz")
+    if groups.get("noon"):
+        return (dt_time(0, 0) if groups["noon"].lower() == "midnight" else dt_time(12, 0)), groups.get("tz")
+    if groups.get("hour24"):
+        return dt_time(int(groups["hour24"]), int(groups["minute24"])), groups.get("tz")
+    hour = int(groups["hour"])
+    if not 1 <= hour <= 12:
+        return None
+    hour = hour % 12 + (12 if groups["ampm"].lower() == "p" else 0)
+    return dt_time(hour, int(groups["minute"] or 0)), groups.get("tz")
+
+def _infer_year(month, day, reference):
+    year = reference.year
+    try:
+        if datetime(year, month, day) < reference.replace(tzinfo=None) - PAST_YEAR_GRACE:
+            year += 1
+    except ValueError:
+        pass
+    return year
+
+def _full_year(text):
+    year = int(text)
+    return year + 2000 if year < 100 else year
+
+def _relative_date(match, reference):
+    g = match.groupdict()
+    today = reference.date()
+    if g["today"] or g["eod"] or g["cob"]:
+        return today
+    if g["tomorrow"]:
+        return today + timedelta(days=1)
+    if g["day_after"]:
+        return today + timedelta(days=2)
+    if g["weekday"]:
+        weekday = WEEKDAYS[g["weekday"][:3].lower()]
+        which = (g["which"] or "").lower()
+        if which == "next":
+            return today + timedelta(days=7 - today.weekday() + weekday)
+        ahead = (weekday - today.weekday()) % 7
+        if ahead == 0 and which == "coming":
+            ahead = 7
+        return today + timedelta(days=ahead)
+    if g["count"]:
+        count = WORD_NUMBERS.get(g["count"].lower()) or int(g["count"])
+        return today + timedelta(days=count * (7 if g["unit"].lower() == "week" else 1))
+    if g["eow"] or (g["period"] and g["period"].lower() == "week"):
+        return today + timedelta(days=max(0, 4 - today.weekday())) # Friday
+    last_day = calendar.monthrange(today.year, today.month)[1]
+    return today.replace(day=last_day)
+
+def _absolute_date(pattern, match, reference):
+    g = match.groupdict()
+    if pattern is ISO_RE:
+        return datetime(int(g["year"]), int(g["mon"]), int(g["day"])).date()
+    if pattern is NUMERIC_RE:
+        a, b = int(g["a"]), int(g["b"])
+        day_first = a > 12 or (b <= 12 and DEADLINE_DATE_ORDER == "DMY")
+        day, month = (a, b) if day_first else (b, a)
+        return datetime(_full_year(g["year"]), month, day).date()
+    month = MONTH_NAMES.index(g["month"][:3].lower()) + 1
+    day = int(g["day"])
+    year = int(g["year"]) if g["year"] else _infer_year(month, day, reference)
+    return datetime(year, month, day).date()
+
+def _modal_may(text, match):
+    """
+    True when a "may" month match is really the verb ("you may 3 times
+    apply", "option 3 may be"). A "may" date needs an ordinal or a year,
+    or a capital M and no ordinary word right after it.
+    """
+    if match["month"].lower() != "may" or match["year"] or ORDINAL_RE.search(match.group(0)):
+        return False
+    return not match["month"][0].isupper() or bool(DATE_FOLLOWER_RE.match(text, match.end()))
+
+def _candidates(text, reference):
+    # Most emails have no date at all; two cheap scans rule them out
+    if not any(p.search(text) for p in (RELATIVE_HINT_RE, NUMERIC_RE, ISO_RE, *DATE_PATTERNS)):
+        return []
+
+    tz = reference.tzinfo
+    found = []
+    for pattern in (ISO_RE, NUMERIC_RE, DAY_MONTH_RE, MONTH_DAY_RE, RELATIVE_RE):
+        for match in pattern.finditer(text):
+            if pattern in (DAY_MONTH_RE, MONTH_DAY_RE) and _modal_may(text, match):
+                continue
+            try:
+                if pattern is RELATIVE_RE:
+                    date = _relative_date(match, reference)
+                else:
+                    date = _absolute_date(pattern, match, reference)
+            except (ValueError, IndexError):
+                continue # 31/02, month 13, ...
+
+            start, end = match.span()
+            clock, zone = None, None
+            if match.groupdict().get("hour24"): # ISO timestamp with its own time
+                clock, zone = dt_time(int(match["hour24"]), int(match["minute24"])), match["tz"]
+            elif match.groupdict().get("eod") or match.groupdict().get("cob"):
+                clock = END_OF_DAY if match.groupdict().get("eod") else CLOSE_OF_BUSINESS
+            else:
+                after = TIME_AFTER_RE.match(text, end, min(len(text), end + TIME_WINDOW))
+                before = TIME_BEFORE_RE.search(text, max(0, start - TIME_WINDOW), start)
+                time_match = after or before
+                parsed = _time_from(time_match) if time_match else None
+                if parsed:
+                    clock, zone = parsed
+                    start, end = min(start, time_match.start()), max(end, time_match.end())
+
+            when = datetime.combine(date, clock or END_OF_DAY, tzinfo=_tzinfo(zone, tz))
+            found.append(_Candidate(start, end, when, clock is not None))
+
+    # "EOD tomorrow" yields both "EOD" (today) and "tomorrow at EOD"; keep the wider match
+    found.sort(key=lambda c: (c.start, -(c.end - c.start)))
+    kept = []
+    for candidate in found:
+        if kept and candidate.end <= kept[-1].end:
+            continue
+        kept.append(candidate)
+    return kept
+
+def _score(text, candidate):
+    window = text[max(0, candidate.start - KEYWORD_WINDOW):candidate.start]
+    if STRONG_KEYWORD_RE.search(window):
+        return 2
+    # Weak words only count right before the date ("by Friday", "until June 30")
+    return 1 if WEAK_KEYWORD_RE.search(window[-15:]) else 0
+
+def _best_candidate(text, reference):
+    candidates = _candidates(text, reference)
+    for candidate in candidates:
+        candidate.score = _score(text, candidate)
+    if not candidates:
+        return None
+    return max(candidates, key=lambda c: (c.score, c.when >= reference, -c.when.timestamp()))
+
+def _reference(reference):
+    if reference is None:
+        return now_local()
+    if isinstance(reference, (int, float)):
+        reference = datetime.fromtimestamp(reference, timezone.utc)
+    if reference.tzinfo is None:
+        reference = reference.replace(tzinfo=timezone.utc) # Naive datetimes here are UTC, like the DB
+    return reference.astimezone(user_timezone())
+
+def _to_utc(when):
+    return when.astimezone(timezone.utc).replace(tzinfo=None, second=0, microsecond=0)
+
+def extract_deadline(text, reference=None):
+    """
+    Finds the most likely deadline in text (dates near "deadline", "due",
+    "by", ... win). reference is when the email was received (datetime or
+    epoch seconds) and anchors relative dates. Returns a naive UTC datetime
+    or None.
+    """
+    if not text:
+        return None
+    candidate = _best_candidate(text, _reference(reference))
+    return _to_utc(candidate.when) if candidate else None
+
+def parse_deadline(value, reference=None):
+    """
+    Normalizes a single deadline string (e.g. the LLM's) to a naive UTC
+    datetime. ISO strings without an offset are read in the user's timezone.
+    """
+    if not value:
+        return None
+    reference = _reference(reference)
+    try:
+        when = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=reference.tzinfo)
+        return _to_utc(when)
+    except ValueError:
+        candidate = _best_candidate(value, reference)
+        return _to_utc(candidate.when) if candidate else None
+
+def _record(outcome):
+    with _lock:
+        _stats[outcome] += 1
+
+def resolve_deadline(llm_value, text, reference=None):
+    """
+    Cross-checks the LLM's deadline against the local extraction and returns
+    the one to store, as a "YYYY-MM-DD HH:MM:SS" UTC string (or None).
+    Same day: local wins unless only the LLM found a time of day.
+    Different days: a local date next to a deadline keyword wins.
+    """
+    reference = _reference(reference)
+    candidate = _best_candidate(text or "", reference)
+    llm = parse_deadline(llm_value, reference)
+    local = _to_utc(candidate.when) if candidate else None
+
+    if local and llm:
+        tz = reference.tzinfo
+        llm_local = llm.replace(tzinfo=timezone.utc).astimezone(tz)
+        if candidate.when.astimezone(tz).date() == llm_local.date():
+            _record("agree")
+            # A bare midnight from the LLM usually means "no time given"
+            chosen = llm if not candidate.has_time and llm_local.time() != dt_time(0, 0) else local
+        else:
+            _record("mismatch")
+            chosen = local if candidate.score else llm
+            print(f"⚠️ Deadline mismatch: LLM said {llm}, email text says {local}; using {chosen}")
+    elif llm:
+        _record("llm_only")
+        chosen = llm
+    elif local and candidate.score:
+        # The LLM found no deadline; only trust a local date the email calls one
+        _record("local_only")
+        chosen = local
+    else:
+        _record("none")
+        chosen = None
+
+    return chosen.strftime("%Y-%m-%d %H:%M:%S") if chosen else None
+
+def format_deadline(value):
+    """
+    Renders a stored UTC deadline (datetime or ISO string) in the user's
+    timezone for WhatsApp, e.g. "Fri 14 Mar 2025, 17:00".
+    """
+    if not value:
+        return "N/A"
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return value
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(user_timezone()).strftime("%a %d %b %Y, %H:%M")
+
+def stats():
+    with _lock:
+        return dict(_stats)
@@ -0,0 +1,140 @@
+# email_bodies.py
+import io
+import os
+import sys
+import zlib
+import contextlib
+from models import SessionLocal, Email, EmailBody
+
+# Email bodies are stored apart from the emails table, zlib-compressed, and
+# loaded one at a time when a reply is drafted or a question is asked.
+# Context dicts (every webhook turn, every reminder check) no longer carry
+# them. Newly fetched emails still have "original_body" in their context
+# dict; save_user_context writes it here.
+#
+# Usage: python email_bodies.py report
+EMAIL_BODY_COMPRESSION_LEVEL = int(os.getenv("EMAIL_BODY_COMPRESSION_LEVEL", "6"))
+
+def compress(text):
+    """Returns (encoding, stored bytes, raw size) for a body."""
+    raw = (text or "").encode("utf-8")
+    packed = zlib.compress(raw, EMAIL_BODY_COMPRESSION_LEVEL)
+    if len(packed) >= len(raw):
+        return "none", raw, len(raw) # Short bodies can grow when compressed
+    return "zlib", packed, len(raw)
+
+def decompress(encoding, data):
+    if data is None:
+        return ""
+    if encoding == "zlib":
+        data = zlib.decompress(data)
+    return bytes(data).decode("utf-8")
+
+def body_row(email_id, text):
+    encoding, data, raw_size = compress(text)
+    return {"email_id": email_id, "encoding": encoding, "body": data, "raw_size": raw_size}
+
+def load_body(email_id):
+    """
+    Returns the body text for one email ("" if none is stored). Falls back
+    to the legacy emails.original_body column for rows not yet migrated.
+    """
+    session = SessionLocal()
+    try:
+        row = session.get(EmailBody, email_id)
+        if row is not None:
+            return decompress(row.encoding, row.body)
+        legacy = session.query(Email.original_body).filter(Email.id == email_id).scalar()
+        return legacy or ""
+    except Exception as e:
+        print(f"❌ DB Error loading body for {email_id}: {e}")
+        return ""
+    finally:
+        session.close()
+
+def move_legacy_bodies(conn, chunk=500):
+    """
+    Copies emails.original_body into email_bodies (compressed) and clears
+    the old column, chunk rows at a time. Used by migration 5.
+    """
+    emails = Email.__table__
+    moved = 0
+    while True:
+        rows = conn.execute(
+            emails.select().with_only_columns(emails.c.id, emails.c.original_body)
+            .where(emails.c.original_body.isnot(None)).limit(chunk)
+        ).all()
+        if not rows:
+            return moved
+        existing = {
+            row[0] for row in conn.execute(
+                EmailBody.__table__.select().with_only_columns(EmailBody.email_id)
+                .where(EmailBody.email_id.in_([row.id for row in rows]))
+            )
+        }
+        new_rows = [body_row(row.id, row.original_body) for row in rows if row.id not in existing]
+        if new_rows:
+            conn.execute(EmailBody.__table__.insert(), new_rows)
+        conn.execute(emails.update().where(emails.c.id.in_([row.id for row in rows])).values(original_body=None))
+        moved += len(rows)
+
+def _deep_size(obj, seen=None):
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_size(k, seen) + _deep_size(v, seen) for k, v in obj.items())
+    return size
+
+def size_report():
+    """
+    Stored vs raw body bytes, the average emails row size the menu queries
+    read, and the Python heap of every user's context with and without bodies.
+    """
+    from context_store import load_context
+    session = SessionLocal()
+    try:
+        rows = session.query(EmailBody.email_id, EmailBody.encoding, EmailBody.body, EmailBody.raw_size).all()
+        emails = session.query(Email).all()
+        row_bytes = [
+            sum(len(str(getattr(email, column.key) or "")) for column in Email.__table__.columns if column.key != "original_body")
+            for email in emails
+        ]
+    finally:
+        session.close()
+
+    raw = sum(row.raw_size or 0 for row in rows)
+    stored = sum(len(row.body or b"") for row in rows)
+    bodies = {row.email_id: decompress(row.encoding, row.body) for row in rows}
+
+    with contextlib.redirect_stdout(io.StringIO()): # load_context prints per row
+        contexts = load_context()
+    heap = sum(_deep_size(dict(ctx)) for ctx in contexts.values())
+    with_bodies = [
+        {k: ({**v, "original_body": bodies.get(v.get("id"), "")} if isinstance(v, dict) else v) for k, v in ctx.items()}
+        for ctx in contexts.values()
+    ]
+    heap_with_bodies = sum(_deep_size(ctx) for ctx in with_bodies)
+    avg_row = sum(row_bytes) / len(row_bytes) if row_bytes else 0
+    avg_body = raw / len(rows) if rows else 0
+    return {
+        "bodies": len(rows),
+        "body_bytes_raw": raw,
+        "body_bytes_stored": stored,
+        "compression_ratio": round(raw / stored, 2) if stored else None,
+        "emails_row_bytes_avg": round(avg_row),
+        "emails_row_bytes_avg_with_body": round(avg_row + avg_body),
+        "context_heap_bytes": heap,
+        "context_heap_bytes_with_bodies": heap_with_bodies,
+    }
+
+if __name__ == "__main__":
+    if sys.argv[1:2] != ["report"]:
+        print("Usage: python email_bodies.py report")
+        sys.exit(2)
+    report = size_report()
+    print(f"📦 {report['bodies']} stored bodies: {report['body_bytes_raw']:,} bytes raw -> {report['body_bytes_stored']:,} stored (x{report['compression_ratio']})")
+    print(f"📏 emails row (avg): {report['emails_row_bytes_avg']:,} bytes, was {report['emails_row_bytes_avg_with_body']:,} with the body inline")
+    print(f"🧠 context dicts: {report['context_heap_bytes']:,} bytes, would be {report['context_heap_bytes_with_bodies']:,} with bodies")
@@ -19,16 +19,20 @@ def extract_category(body):
                 return category
     return "general"
 
+MONTH_NAMES = ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec")
+
+# Compiled once; extract_dates runs on every email (see also deadline_parser)
+DATE_PATTERNS = [
+    re.compile(r'\b\d{1,2}[/-]\d{1,2}[/-]\d{2,4}\b'),  # 30/06/2025 or 30-06-2025
+    re.compile(r'\b(?:\d{1,2}\s)?(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*[\s,]*(?:\d{2,4})?\b', re.IGNORECASE),  # 30 June or June 30, 2025
+    re.compile(r'\b\d{4}-\d{2}-\d{2}\b'),  # ISO format: 2025-06-30
+]
+
 def extract_dates(text):
     """Extracts dates like 'June 30', '30 June', '2025-06-30', etc."""
-    date_patterns = [
-        r'\b\d{1,2}[/-]\d{1,2}[/-]\d{2,4}\b',  # 30/06/2025 or 30-06-2025
-        r'\b(?:\d{1,2}\s)?(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*[\s,]*(?:\d{2,4})?\b',  # 30 June or June 30, 2025
-        r'\b\d{4}-\d{2}-\d{2}\b',  # ISO format: 2025-06-30
-    ]
     matches = []
-    for pattern in date_patterns:
-        matches.extend(re.findall(pattern, text, re.IGNORECASE))
+    for pattern in DATE_PATTERNS:
+        matches.extend(pattern.findall(text))
     return matches
 
 def summarize_email(subject, body):
@@ -0,0 +1,194 @@
+# email_preprocess.py
+import re
+import threading
+from email_parser import extract_dates
+from deadline_parser import extract_deadline, STRONG_KEYWORD_RE
+
+# Shrinks email bodies before they go into a prompt: drops quoted reply
+# history, signatures, legal footers and long tracking URLs, then (if still
+# over budget) keeps the most informative sentences. We pay per token and
+# latency grows with prompt length.
+
+CHARS_PER_TOKEN = 4 # Same rough estimate llm_executor budgets with
+
+QUOTE_HEADER_RE = re.compile(
+    r'^\s*(?:On .{0,200}wrote:|-{2,}\s*Original Message\s*-{2,}|_{5,}|From:\s.+\n\s*(?:Sent|Date):\s)',
+    re.IGNORECASE | re.MULTILINE
+)
+FORWARD_RE = re.compile(r'^\s*-{5,}\s*Forwarded message\s*-{5,}\s*$', re.IGNORECASE | re.MULTILINE)
+QUOTED_LINE_RE = re.compile(r'^\s*>.*$\n?', re.MULTILINE)
+SIGNATURE_RE = re.compile(r'^--\s*$|^Sent from my \w+', re.MULTILINE)
+URL_RE = re.compile(r'https?://([^/\s<>"]+)[^\s<>"]*')
+DISCLAIMER_RE = re.compile(
+    r'confidential|intended (?:solely )?for the (?:use of the )?(?:named )?(?:addressee|recipient)|'
+    r'unsubscribe|privacy policy|this (?:e-?mail|message) was sent to|all rights reserved|©|'
+    r'do not reply to this (?:e-?mail|message)|manage (?:your )?(?:email )?preferences',
+    re.IGNORECASE
+)
+# Legal/marketing footers are usually one long block, so they are cut from
+# their first line rather than matched per paragraph. Both footers and
+# disclaimer paragraphs are only removed at the end of the message, and
+# never when the removed text mentions a date or deadline.
+FOOTER_START_RE = re.compile(
+    r'^(?:about [\w&. -]{2,40}$|this (?:e-?mail|communication|message) (?:contains|is|and any)|'
+    r'.*(?:©|copyright \d{4}|all rights reserved|unsubscribe|you are receiving this))',
+    re.IGNORECASE | re.MULTILINE
+)
+FOOTER_MIN_POSITION = 0.25 # Only trust a footer marker in the last 75% of the text
+# A "--" line is only a signature separator near the end; newsletters and
+# ticket notifications use it between sections too
+SIGNATURE_MAX_LINES = 10
+SIGNATURE_MIN_POSITION = 0.8
+IMAGE_RE = re.compile(r'\[image:[^\]]*\]')
+SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?])\s+|\n\s*\n')
+INFO_RE = re.compile(
+    r'\b(?:deadline|due|last date|apply|application|register|submit|interview|schedule|rsvp|'
+    r'confirm|offer|join|link|before|by|until|venue|location|time)\b',
+    re.IGNORECASE
+)
+
+MAX_DISCLAIMER_PARAGRAPH = 800 # Longer paragraphs are probably real content
+MAX_FOOTER = 2500 # A longer "footer" is probably the rest of the email
+LONG_URL = 40
+
+_stats = {"calls": 0, "tokens_in": 0, "tokens_out": 0}
+_lock = threading.Lock()
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN
+
+def _strip_quoted(text):
+    start = 0
+    forward = FORWARD_RE.search(text)
+    if forward:
+        # A forward's own From:/Date: block looks like a reply header, and the
+        # forwarded mail is the content we want; only look for quotes after it
+        header_end = text.find('\n\n', forward.end())
+        start = header_end if header_end >= 0 else len(text)
+
+    match = QUOTE_HEADER_RE.search(text, start)
+    # Keep the quote if it is all there is (e.g. a bare forward)
+    if match and text[:match.start()].strip():
+        text = text[:match.start()]
+    return QUOTED_LINE_RE.sub('', text)
+
+def _strip_signature(text):
+    for match in SIGNATURE_RE.finditer(text):
+        near_end = (
+            text.count('\n', match.start()) < SIGNATURE_MAX_LINES
+            or match.start() >= len(text) * SIGNATURE_MIN_POSITION
+        )
+        if near_end and text[:match.start()].strip():
+            return text[:match.start()]
+    return text
+
+def _shorten_url(match):
+    url = match.group(0)
+    return url if len(url) <= LONG_URL else f"[link: {match.group(1)}]"
+
+def _strip_links_and_images(text):
+    text = IMAGE_RE.sub('', text)
+    text = URL_RE.sub(_shorten_url, text)
+    text = re.sub(r'<(\[link: [^\]]+\])>', r'\1', text)
+    # Social/tracking icons leave the same link several times in a row
+    return re.sub(r'(\[link: [^\]]+\])(?:\s*\1)+', r'\1', text)
+
+def _mentions_deadline(text):
+    return bool(STRONG_KEYWORD_RE.search(text)) or extract_deadline(text) is not None
+
+def _strip_footer(text):
+    for match in FOOTER_START_RE.finditer(text):
+        if match.start() < len(text) * FOOTER_MIN_POSITION:
+            continue
+        tail = text[match.start():]
+        # Later markers only shorten the tail, so the first one that passes cuts the most
+        if len(tail) <= MAX_FOOTER and DISCLAIMER_RE.search(tail) and not _mentions_deadline(tail):
+            return text[:match.start()]
+    return text
+
+def _is_disclaimer(paragraph):
+    return (
+        len(paragraph) <= MAX_DISCLAIMER_PARAGRAPH
+        and DISCLAIMER_RE.search(paragraph)
+        and not _mentions_deadline(paragraph)
+    )
+
+def _drop_disclaimers(text):
+    # Trailing paragraphs only: a match in the middle of the body is content
+    paragraphs = re.split(r'\n\s*\n', text)
+    while len(paragraphs) > 1 and (not paragraphs[-1].strip() or _is_disclaimer(paragraphs[-1])):
+        paragraphs.pop()
+    return "\n\n".join(paragraphs)
+
+def _collapse_whitespace(text):
+    text = re.sub(r'[ \t\r\f\v]+', ' ', text)
+    text = re.sub(r'\n\s*\n+', '\n\n', text)
+    return re.sub(r' *\n *', '\n', text).strip()
+
+def _score_sentence(sentence, position):
+    score = 0.0
+    if extract_dates(sentence):
+        score += 3
+    score += 2 * len(INFO_RE.findall(sentence))
+    if any(ch.isdigit() for ch in sentence):
+        score += 1
+    if position < 3:
+        score += 1.5 # The opening usually says what the email is about
+    if len(sentence) < 20:
+        score -= 1
+    return score
+
+def _select_sentences(text, max_chars):
+    sentences = [
+        " ".join(s.split()) # Undo hard line wrapping inside a sentence
+        for s in SENTENCE_SPLIT_RE.split(text) if s and s.strip()
+    ]
+    ranked = sorted(range(len(sentences)), key=lambda i: _score_sentence(sentences[i], i), reverse=True)
+
+    chosen, used = set(), 0
+    for i in ranked:
+        cost = len(sentences[i]) + 1
+        if used + cost > max_chars:
+            continue
+        chosen.add(i)
+        used += cost
+    return " ".join(sentences[i] for i in sorted(chosen))
+
+def clean_email_text(text):
+    """
+    Removes quoted history, signatures, disclaimers and long URLs, and
+    collapses whitespace. No length limit.
+    """
+    text = text.replace('\r\n', '\n')
+    text = _strip_quoted(text)
+    text = _strip_signature(text)
+    text = _strip_links_and_images(text)
+    text = _strip_footer(text)
+    text = _drop_disclaimers(text)
+    return _collapse_whitespace(text)
+
+def prepare_for_prompt(text, max_tokens, call_site="llm"):
+    """
+    Cleans an email body and fits it into max_tokens, keeping the
+    highest-information sentences in their original order.
+    Logs and counts the tokens saved.
+    """
+    original_tokens = estimate_tokens(text or "")
+    cleaned = clean_email_text(text or "")
+
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(cleaned) > max_chars:
+        cleaned = _select_sentences(cleaned, max_chars) or cleaned[:max_chars]
+
+    final_tokens = estimate_tokens(cleaned)
+    with _lock:
+        _stats["calls"] += 1
+        _stats["tokens_in"] += original_tokens
+        _stats["tokens_out"] += final_tokens
+    if original_tokens > final_tokens:
+        print(f"✂️ {call_site}: {original_tokens} -> {final_tokens} tokens (saved {original_tokens - final_tokens})")
+    return cleaned
+
+def stats():
+    with _lock:
+        return {**_stats, "tokens_saved": _stats["tokens_in"] - _stats["tokens_out"]}
@@ -1,74 +1,137 @@
-from gmail_fetcher import fetch_emails
-from llm_processor import process_email_with_llm
+from gmail_fetcher import fetch_emails, sync_emails
+from llm_processor import process_emails_with_llm
+from triage import triage, record_verdicts
 from whatsapp_bot import send_whatsapp_message, TO_WHATSAPP
-from context_store import load_context, save_context, check_if_processed, mark_as_processed
-import time
+from context_store import load_user_context, save_user_context
+import processed_ids
+import session_cache
+from deadline_parser import resolve_deadline, format_deadline
+from email_preprocess import clean_email_text
 import os
+import threading
+
+# "incremental" = Gmail history deltas since the last poll, "full" = re-list the latest emails
+GMAIL_SYNC_MODE = os.getenv("GMAIL_SYNC_MODE", "incremental")
+
+# Only one sync runs at a time; push notifications arriving mid-sync are coalesced
+_sync_lock = threading.Lock()
+_sync_requested = threading.Event()
 
 def process_new_emails():
     """
     Fetches emails, uses LLM to identify actionable ones, and notifies via WhatsApp.
     """
+    with _sync_lock:
+        _sync_requested.clear()
+        try:
+            _process_new_emails()
+        except Exception as e:
+            print(f"❌ Email poll failed: {e}") # Cursor not advanced; the next poll retries
+
+def trigger_sync():
+    """
+    Runs a sync in the background (used by Gmail push notifications).
+    Bursts of notifications collapse into at most one extra sync.
+    """
+    _sync_requested.set()
+    threading.Thread(target=_run_requested_sync, daemon=True).start()
+
+def _run_requested_sync():
+    with _sync_lock:
+        if not _sync_requested.is_set():
+            return # An earlier sync already covered this notification
+        _sync_requested.clear()
+        try:
+            _process_new_emails()
+        except Exception as e:
+            print(f"❌ Push-triggered sync failed: {e}")
+
+def _process_new_emails():
     print("📬 Polling for new emails...")
     
-    # In a real daemon, we'd track "last_checked_id" to avoid duplicates.
-    # For now, we fetch latest 3 distinct emails.
-    emails = fetch_emails(3)
+    if GMAIL_SYNC_MODE == "incremental":
+        emails, save_cursor = sync_emails()
+    else:
+        # Legacy mode: fetch latest 3 distinct emails and rely on the processed cache.
+        emails, save_cursor = fetch_emails(3), lambda: None
     
     if not emails:
         print("No new emails found.")
+        save_cursor()
         return
 
     # Determine Sender Number
     if TO_WHATSAPP:
         sender_number = TO_WHATSAPP.replace("whatsapp:", "").replace("+", "")
     else:
+        save_cursor()
         return
 
-    context = load_context()
-    if sender_number not in context:
-        context[sender_number] = {}
+    user_ctx = load_user_context(sender_number)
     
     processed_count = 0
 
-    for index, email in enumerate(emails, start=1):
-        msg_id = email.get("id")
-        
-        # 1. Check DB Cache (Avoid re-processing known emails)
-        if check_if_processed(msg_id):
-            print(f"Skipping cached email ID: {msg_id}")
+    # 1. Dedupe (Avoid re-processing known emails). New IDs are marked as
+    # processed immediately, in one statement, to prevent retry loops
+    with_body = [(index, email) for index, email in enumerate(emails, start=1) if email.get("body", "")]
+    claimed = set(processed_ids.claim([email["id"] for _, email in with_body])) # Raises on a DB error
+    save_cursor()
+
+    pending = []
+    for index, email in with_body:
+        if email["id"] not in claimed:
+            print(f"Skipping cached email ID: {email['id']}")
             continue
+        pending.append((index, email))
+
+    if not pending:
+        print("Unknown or no new important emails.")
+        return
 
-        body = email.get("body", "")
-        if not body: continue
+    # 2. Local triage: obvious promotions/notifications never reach the LLM
+    to_llm, skipped = triage([email for _, email in pending])
 
-        print(f"🧠 Analyzing Email {index} (ID: {msg_id})...")
-        
-        # Mark as processed immediately to prevent retry loops
-        mark_as_processed(msg_id)
+    # 3. LLM Analysis, several emails per call
+    verdicts = {}
+    if to_llm:
+        print(f"🧠 Analyzing {len(to_llm)} email(s)...")
+        verdicts = process_emails_with_llm([(email["id"], email["body"]) for email in to_llm])
+        record_verdicts(verdicts)
 
-        # LLM Analysis
-        parsed = process_email_with_llm(body)
+    for index, email in pending:
+        msg_id = email["id"]
+        body = email["body"]
+        parsed = verdicts.get(msg_id)
         
         if not parsed: 
-            print(" -> Not important.")
+            print(f" -> Email {index} not important.")
             continue 
 
+        # Normalized to UTC once here; reminders use the stored value as-is
+        deadline = resolve_deadline(
+            parsed.get("deadline"),
+            f"{email.get('subject', '')}\n{clean_email_text(body)}",
+            email.get("received_at")
+        )
+
         # Notify User
         send_whatsapp_message(
             title=parsed.get("title", "No Title"),
-            deadline=parsed.get("deadline", "N/A"),
+            deadline=format_deadline(deadline),
             action=parsed.get("action", "N/A"),
             summary=parsed.get("summary", "N/A"),
             index=index
         )
 
         # Store in Context (using index 1-3 for simplicity in chat)
-        # We overwrite old slots "1", "2", "3" to keep the chat menu simple
-        context[sender_number][str(index)] = {
+        # We overwrite old slots "1", "2", "3" to keep the chat menu simple.
+        # sync_emails and fetch_emails return at most 3 (sync_emails only
+        # more for a single Gmail history record holding more than 3); a
+        # burst beyond that waits for the next sync instead of growing the menu.
+        user_ctx[str(index)] = {
             "summary": parsed.get("summary", ""),
             "title": parsed.get("title", ""),
-            "deadline": parsed.get("deadline", ""),
+            "deadline": deadline,
             "action": parsed.get("action", ""),
             "original_body": body,
             "id": msg_id,
@@ -80,10 +143,11 @@ def process_new_emails():
         }
         
         processed_count += 1
-        time.sleep(1.0) # Rate limit
 
     if processed_count > 0:
-        save_context(context)
+        save_user_context(sender_number, user_ctx)
+        # The menu changed; servers in other processes must not keep serving the old one
+        session_cache.invalidate(sender_number, other_processes=True)
         print(f"✅ Processed {processed_count} new important emails.")
     else:
         print("Unknown or no new important emails.")
@@ -0,0 +1,133 @@
+# gmail_client.py
+import os
+import os.path
+import queue
+import threading
+from datetime import datetime, timedelta
+import httplib2
+import google_auth_httplib2
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google_auth_oauthlib.flow import InstalledAppFlow
+from googleapiclient.discovery import build
+
+# Updated scopes to include sending permissions
+SCOPES = [
+    'https://www.googleapis.com/auth/gmail.readonly',
+    'https://www.googleapis.com/auth/gmail.send'
+]
+
+TOKEN_FILE = 'token.json'
+
+# Refresh the access token this long before it actually expires
+REFRESH_MARGIN = timedelta(minutes=5)
+HTTP_TIMEOUT = 30
+# Idle keep-alive connections kept for reuse (Flask, the poller and fetch workers share them)
+GMAIL_HTTP_POOL_SIZE = int(os.getenv("GMAIL_HTTP_POOL_SIZE", "8"))
+
+_creds = None
+_creds_lock = threading.Lock()
+_service = None
+_service_lock = threading.Lock()
+
+def authenticate_gmail():
+    """
+    Loads credentials from token.json (running the consent flow if needed).
+    Prefer get_credentials(), which caches the result in memory.
+    """
+    creds = None
+    if os.path.exists(TOKEN_FILE):
+        creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
+    if not creds or not creds.valid:
+        if creds and creds.expired and creds.refresh_token:
+            creds.refresh(Request())
+        else:
+            flow = InstalledAppFlow.from_client_secrets_file(
+                'credentials.json', SCOPES)
+            creds = flow.run_local_server(port=0)
+        with open(TOKEN_FILE, 'w') as token:
+            token.write(creds.to_json())
+    return creds
+
+def _needs_refresh(creds):
+    if not creds.valid:
+        return True
+    # google-auth stores expiry as naive UTC
+    return creds.expiry is not None and creds.expiry - datetime.utcnow() < REFRESH_MARGIN
+
+def get_credentials():
+    """
+    Process-wide credentials, read from disk once and refreshed proactively
+    shortly before the access token expires.
+    """
+    global _creds
+    with _creds_lock:
+        if _creds is None:
+            _creds = authenticate_gmail()
+        elif _needs_refresh(_creds) and _creds.refresh_token:
+            print("🔑 Refreshing Gmail access token...")
+            _creds.refresh(Request())
+            with open(TOKEN_FILE, 'w') as token:
+                token.write(_creds.to_json())
+        return _creds
+
+class _PooledHttp:
+    """
+    Thread-safe stand-in for httplib2.Http. httplib2 connections can't be
+    shared between threads, so every request (or batch) borrows an idle
+    keep-alive AuthorizedHttp and returns it afterwards. Werkzeug starts a
+    thread per webhook request, so per-thread connections would never be
+    reused.
+    """
+
+    def __init__(self, size):
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    @property
+    def credentials(self):
+        # Lets googleapiclient refresh tokens and retry 401s in batches
+        return get_credentials()
+
+    def request(self, *args, **kwargs):
+        try:
+            http = self._idle.get_nowait()
+        except queue.Empty:
+            http = google_auth_httplib2.AuthorizedHttp(get_credentials(), http=httplib2.Http(timeout=HTTP_TIMEOUT))
+        try:
+            return http.request(*args, **kwargs)
+        finally:
+            try:
+                self._idle.put_nowait(http)
+            except queue.Full:
+                http.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+def get_service():
+    """
+    Returns the process-wide Gmail service. It is built once from the
+    discovery document bundled with google-api-python-client, and is safe to
+    use from any thread: requests draw connections from a shared pool.
+    """
+    global _service
+    get_credentials() # Proactive refresh
+    with _service_lock:
+        if _service is None:
+            _service = build('gmail', 'v1', http=_PooledHttp(GMAIL_HTTP_POOL_SIZE), static_discovery=True)
+        return _service
+
+def warm_up():
+    """
+    Loads credentials and builds a service up front, so the first poll or
+    webhook reply doesn't pay for it.
+    """
+    try:
+        get_service()
+        print("✅ Gmail client ready.")
+    except Exception as e:
+        print(f"⚠️ Gmail client warm-up failed: {e}")
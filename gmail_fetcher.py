@@ -1,76 +1,340 @@
 # gmail_fetcher.py
+import os
 import os.path
-import base64
 import re
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from email import message_from_bytes
-
-# Updated scopes to include sending permissions
-SCOPES = [
-    'https://www.googleapis.com/auth/gmail.readonly',
-    'https://www.googleapis.com/auth/gmail.send'
-]
-
-def authenticate_gmail():
-    creds = None
-    if os.path.exists('token.json'):
-        creds = Credentials.from_authorized_user_file('token.json', SCOPES)
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file(
-                'credentials.json', SCOPES)
-            creds = flow.run_local_server(port=0)
-        with open('token.json', 'w') as token:
-            token.write(creds.to_json())
-    return creds
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from googleapiclient.errors import HttpError
+from gmail_client import get_service
+from mime_body import extract_body
 
-def fetch_emails(n=3):
-    creds = authenticate_gmail()
-    service = build('gmail', 'v1', credentials=creds)
-    
-    results = service.users().messages().list(userId='me', maxResults=20).execute()  # Fetch more than needed
-    messages = results.get('messages', [])
-    
+# Gmail userId the sync cursor is stored under ("me" = the token.json owner)
+GMAIL_ACCOUNT = os.getenv("GMAIL_ACCOUNT", "me")
+# Mailbox address push notifications are accepted for (optional)
+GMAIL_ADDRESS = os.getenv("GMAIL_ADDRESS")
+# Pub/Sub topic for Gmail push, e.g. "projects/my-project/topics/gmail-push"
+GMAIL_PUBSUB_TOPIC = os.getenv("GMAIL_PUBSUB_TOPIC")
+
+# Headers pulled in the cheap metadata phase (no body download)
+METADATA_HEADERS = ['Subject', 'From', 'Message-ID', 'List-Unsubscribe']
+
+# Gmail accepts up to 100 calls per batch, but recommends <= 50 to avoid rate limiting
+BATCH_SIZE = 50
+
+# Full listings (legacy "full" mode, resyncs) look at this many of the newest messages
+SYNC_LIST_SIZE = 20
+
+# Our own replies and drafts show up in messages().list too; never analyze them
+SKIP_LABELS = {'SENT', 'DRAFT'}
+
+# "batch" = HTTP batch requests, "concurrent" = parallel single requests on a thread pool
+GMAIL_FETCH_MODE = os.getenv("GMAIL_FETCH_MODE", "batch")
+GMAIL_FETCH_WORKERS = int(os.getenv("GMAIL_FETCH_WORKERS", "8"))
+GMAIL_ACCOUNT_CONCURRENCY = int(os.getenv("GMAIL_ACCOUNT_CONCURRENCY", "4")) # In-flight requests per mailbox
+GMAIL_MAX_RETRIES = 5
+
+_fetch_pool = None
+_account_slots = {}
+_pool_lock = threading.Lock()
+
+def _is_rate_limited(error):
+    if error.resp.status == 429:
+        return True
+    content = error.content.decode('utf-8', errors='ignore') if isinstance(error.content, bytes) else str(error.content)
+    return error.resp.status == 403 and 'ratelimitexceeded' in content.lower()
+
+def _is_gone(error):
+    # Deleted (or moved out of reach) between listing and fetching; nothing to retry
+    return isinstance(error, HttpError) and error.resp.status == 404
+
+def _backoff_delay(attempt, error=None):
+    retry_after = error.resp.get('retry-after') if error is not None else None
+    return float(retry_after) if retry_after and retry_after.isdigit() else (2 ** attempt) + random.random()
+
+def _execute_with_backoff(request):
+    """
+    Executes a Gmail request, backing off exponentially (with jitter, or per
+    Retry-After) on 429 / 403 rateLimitExceeded.
+    """
+    for attempt in range(GMAIL_MAX_RETRIES):
+        try:
+            return request.execute()
+        except HttpError as e:
+            if not _is_rate_limited(e) or attempt == GMAIL_MAX_RETRIES - 1:
+                raise
+            delay = _backoff_delay(attempt, e)
+            print(f"⏳ Gmail rate limit hit, retrying in {delay:.1f}s...")
+            time.sleep(delay)
+
+def _batch_get(service, msg_ids, account='me', **params):
+    """
+    Runs messages().get for many IDs as HTTP batch requests. Items that fail
+    with 429 / 403 rateLimitExceeded are retried in a new batch with the same
+    backoff as _execute_with_backoff.
+    Returns ({msg_id: response}, [IDs that still failed]); deleted messages
+    (404) are in neither.
+    """
+    results, failed = {}, []
+    pending = list(msg_ids)
+
+    for attempt in range(GMAIL_MAX_RETRIES):
+        retry, limited = [], None
+
+        def _collect(request_id, response, exception):
+            nonlocal limited
+            if exception is None:
+                results[request_id] = response
+            elif _is_gone(exception):
+                print(f"⚠️ Gmail message {request_id} no longer exists, skipping.")
+            elif isinstance(exception, HttpError) and _is_rate_limited(exception):
+                retry.append(request_id)
+                limited = exception
+            else:
+                print(f"❌ Gmail batch error for {request_id}: {exception}")
+                failed.append(request_id)
+
+        for start in range(0, len(pending), BATCH_SIZE):
+            batch = service.new_batch_http_request(callback=_collect)
+            for msg_id in pending[start:start + BATCH_SIZE]:
+                batch.add(service.users().messages().get(userId=account, id=msg_id, **params), request_id=msg_id)
+            _execute_with_backoff(batch)
+
+        if not retry:
+            return results, failed
+        if attempt == GMAIL_MAX_RETRIES - 1:
+            print(f"❌ Gmail still rate limiting {len(retry)} message(s), giving up for this sync.")
+            return results, failed + retry
+        delay = _backoff_delay(attempt, limited)
+        print(f"⏳ Gmail rate limit hit for {len(retry)} batch item(s), retrying in {delay:.1f}s...")
+        time.sleep(delay)
+        pending = retry
+
+def _get_pool(account):
+    global _fetch_pool
+    with _pool_lock:
+        if _fetch_pool is None:
+            _fetch_pool = ThreadPoolExecutor(max_workers=GMAIL_FETCH_WORKERS, thread_name_prefix="gmail-fetch")
+        if account not in _account_slots:
+            _account_slots[account] = threading.BoundedSemaphore(GMAIL_ACCOUNT_CONCURRENCY)
+        return _fetch_pool, _account_slots[account]
+
+def _concurrent_get(msg_ids, account='me', **params):
+    """
+    Runs messages().get for many IDs on the shared thread pool, at most
+    GMAIL_ACCOUNT_CONCURRENCY at a time per account.
+    Returns ({msg_id: response}, [IDs that failed]); deleted messages (404)
+    are in neither.
+    """
+    pool, slots = _get_pool(account)
+
+    def _get_one(msg_id):
+        with slots:
+            # The service is shared; each request borrows its own connection
+            request = get_service().users().messages().get(userId=account, id=msg_id, **params)
+            return _execute_with_backoff(request)
+
+    futures = {msg_id: pool.submit(_get_one, msg_id) for msg_id in msg_ids}
+    results, failed = {}, []
+    for msg_id, future in futures.items():
+        try:
+            results[msg_id] = future.result()
+        except Exception as e:
+            if _is_gone(e):
+                print(f"⚠️ Gmail message {msg_id} no longer exists, skipping.")
+                continue
+            print(f"❌ Gmail fetch error for {msg_id}: {e}")
+            failed.append(msg_id)
+    return results, failed
+
+def _get_many(service, msg_ids, account='me', **params):
+    if GMAIL_FETCH_MODE == "concurrent":
+        return _concurrent_get(msg_ids, account, **params)
+    return _batch_get(service, msg_ids, account, **params)
+
+def _headers(metadata):
+    headers = metadata.get('payload', {}).get('headers', [])
+    return {h['name'].lower(): h['value'] for h in headers}
+
+def _fetch_messages(service, messages, n, account='me', skip_processed=True):
+    """
+    Two-phase retrieval:
+    1. Drop IDs already in processed_emails (see processed_ids), then batch-fetch
+       headers only for the rest.
+    2. Batch-fetch full payloads for the survivors, just enough to fill `n`,
+       and pull a size-capped text body out of each (see mime_body).
+    Returns (email dicts in the same (inbox) order as `messages`, IDs that
+    couldn't be fetched after retries).
+    """
+    msg_ids = list(dict.fromkeys(m['id'] for m in messages))
+    thread_ids = {m['id']: m.get('threadId') for m in messages}
+
+    if skip_processed and msg_ids:
+        from processed_ids import filter_new
+        msg_ids = filter_new(msg_ids)
+
+    if not msg_ids:
+        return [], []
+
+    # Phase 1: headers only
+    metadata, failed = _get_many(service, msg_ids, account, format='metadata', metadataHeaders=METADATA_HEADERS)
+    candidates = [
+        msg_id for msg_id in msg_ids
+        if msg_id in metadata and not SKIP_LABELS.intersection(metadata[msg_id].get('labelIds', []))
+    ]
+
+    # Phase 2: full bodies, only as many as we still need
     emails = []
-    for msg in messages:
-        if len(emails) >= n:
-            break
-        msg_data = service.users().messages().get(userId='me', id=msg['id'], format='raw').execute()
-        raw_msg = base64.urlsafe_b64decode(msg_data['raw'])
-        mime_msg = message_from_bytes(raw_msg)
-        
-        subject = mime_msg.get('Subject', '')
-        from_email = mime_msg.get('From', '')
-        payload = mime_msg.get_payload()
-        
-        # Get Message-ID and Thread-ID for threading replies
-        msg_id = msg['id']
-        thread_id = msg['threadId']
-        # Also try to get the actual Message-ID header (useful for In-Reply-To)
-        internet_message_id = mime_msg.get('Message-ID', '')
-
-        body = ""
-        if mime_msg.is_multipart():
-            for part in mime_msg.walk():
-                if part.get_content_type() == 'text/plain':
-                    body = part.get_payload(decode=True).decode('utf-8', errors='ignore')
-                    break
-        else:
-            body = payload if isinstance(payload, str) else payload.decode('utf-8', errors='ignore')
-        
-        if body.strip():
+    while candidates and len(emails) < n:
+        chunk, candidates = candidates[:n - len(emails)], candidates[n - len(emails):]
+        full_messages, chunk_failed = _get_many(service, chunk, account, format='full')
+        failed.extend(chunk_failed)
+
+        for msg_id in chunk:
+            if msg_id not in full_messages:
+                continue
+            body = extract_body(full_messages[msg_id].get('payload', {}))
+            if not body.strip():
+                continue
+
+            meta = metadata[msg_id]
+            headers = _headers(meta)
             emails.append({
                 'id': msg_id,
-                'threadId': thread_id,
-                'internet_message_id': internet_message_id,
-                'subject': subject,
-                'from': from_email,
+                'threadId': thread_ids.get(msg_id) or meta.get('threadId'),
+                # Actual Message-ID header (useful for In-Reply-To)
+                'internet_message_id': headers.get('message-id', ''),
+                'subject': headers.get('subject', ''),
+                'from': headers.get('from', ''),
+                'list_unsubscribe': headers.get('list-unsubscribe', ''),
+                'received_at': int(meta.get('internalDate', 0)) // 1000 or None, # epoch seconds
                 'body': body
             })
-    
-    return emails
\ No newline at end of file
+
+    return emails, failed
+
+def fetch_emails(n=3):
+    service = get_service()
+
+    results = service.users().messages().list(userId='me', maxResults=SYNC_LIST_SIZE).execute()  # Fetch more than needed
+    messages = results.get('messages', [])
+
+    # Unclaimed failures come back in the next listing
+    emails, _ = _fetch_messages(service, messages, n)
+    return emails
+
+def _list_history(service, account, start_history_id):
+    """
+    Returns (added, latest_history_id) since start_history_id, where added
+    is a list of (history record id, message), oldest first.
+    """
+    added = []
+    seen = set()
+    latest_history_id = start_history_id
+    page_token = None
+
+    while True:
+        kwargs = {
+            'userId': account,
+            'startHistoryId': start_history_id,
+            'historyTypes': ['messageAdded'],
+            'labelId': 'INBOX'
+        }
+        if page_token:
+            kwargs['pageToken'] = page_token
+
+        results = service.users().history().list(**kwargs).execute()
+        latest_history_id = results.get('historyId', latest_history_id)
+
+        for record in results.get('history', []):
+            for added_msg in record.get('messagesAdded', []):
+                msg = added_msg.get('message', {})
+                if msg.get('id') and msg['id'] not in seen:
+                    seen.add(msg['id'])
+                    added.append((record['id'], msg))
+
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            break
+
+    return added, latest_history_id
+
+def _take_oldest(added, n, latest_history_id):
+    """
+    Splits history additions for one sync: returns (messages newest first,
+    cursor). With more than n, only the oldest n are taken, rounded down to
+    whole history records, and the cursor stops at the last taken record so
+    the next sync starts with the rest. A first record with more than n
+    messages is taken whole, or the cursor could never move past it.
+    """
+    if len(added) <= n:
+        return [msg for _, msg in reversed(added)], latest_history_id
+    split = added[n][0] # First record that doesn't fit completely
+    earlier = [history_id for history_id, _ in added[:n] if history_id != split]
+    cursor = earlier[-1] if earlier else split
+    taken = [msg for history_id, msg in added if int(history_id) <= int(cursor)]
+    print(f"📥 {len(added) - len(taken)} more message(s) left for the next sync")
+    return taken[::-1], cursor
+
+def sync_emails(n=3, resync_n=3, account=GMAIL_ACCOUNT):
+    """
+    Incremental fetch: only pulls messages added since the last stored historyId,
+    up to `n` per sync (the size of the chat menu); the rest wait for the next one.
+
+    The first run (no cursor yet) and expired cursors (history().list -> 404)
+    fall back to a full resync of the latest `resync_n` messages, and store a fresh cursor.
+
+    Returns (emails, save_cursor). The caller calls save_cursor() once the
+    emails are claimed (see processed_ids.claim), so a failed poll leaves
+    the cursor where it was and the next one fetches them again.
+    """
+    from context_store import load_history_id, save_history_id
+
+    service = get_service()
+
+    start_history_id = load_history_id(account)
+
+    if start_history_id:
+        try:
+            added, latest_history_id = _list_history(service, account, start_history_id)
+            if added:
+                print(f"🔁 Incremental sync: {len(added)} new message(s) since historyId {start_history_id}")
+            messages, cursor = _take_oldest(added, n, latest_history_id)
+            # Every taken message is fetched, so none is skipped behind the cursor
+            emails, failed = _fetch_messages(service, messages, len(messages), account)
+            if failed:
+                # The fetched ones get claimed as processed, so the retry only redoes the failures
+                print(f"⚠️ {len(failed)} message(s) couldn't be fetched; keeping historyId {start_history_id} to retry them.")
+            if failed or cursor == start_history_id:
+                return emails, lambda: None
+            return emails, lambda: save_history_id(account, cursor)
+        except HttpError as e:
+            if e.resp.status != 404:
+                raise
+            print(f"⚠️ historyId {start_history_id} expired, running full resync...")
+
+    # Full resync. Read the cursor first so nothing arriving mid-sync is missed.
+    profile = service.users().getProfile(userId=account).execute()
+    results = service.users().messages().list(userId=account, maxResults=SYNC_LIST_SIZE).execute()
+    emails, failed = _fetch_messages(service, results.get('messages', []), resync_n, account)
+    if failed:
+        print(f"⚠️ {len(failed)} message(s) couldn't be fetched; the next sync resyncs again.")
+        return emails, lambda: None
+    return emails, lambda: save_history_id(account, profile['historyId'])
+
+def start_watch(account=GMAIL_ACCOUNT):
+    """
+    Registers (or renews) Gmail push notifications for the inbox.
+    Gmail drops a watch after 7 days, so this should run at least daily.
+    """
+    if not GMAIL_PUBSUB_TOPIC:
+        return None
+    body = {
+        'topicName': GMAIL_PUBSUB_TOPIC,
+        'labelIds': ['INBOX'],
+        'labelFilterBehavior': 'INCLUDE'
+    }
+    response = get_service().users().watch(userId=account, body=body).execute()
+    print(f"📡 Gmail watch active (historyId {response.get('historyId')}, expires {response.get('expiration')})")
+    return response
@@ -1,7 +1,6 @@
 import base64
 from email.message import EmailMessage
-from googleapiclient.discovery import build
-from gmail_fetcher import authenticate_gmail
+from gmail_client import get_service
 
 def send_email(to, subject, body, thread_id=None, in_reply_to=None):
     """
@@ -15,8 +14,7 @@ def send_email(to, subject, body, thread_id=None, in_reply_to=None):
         in_reply_to (str, optional): Standard Message-ID header for threading.
     """
     try:
-        creds = authenticate_gmail()
-        service = build('gmail', 'v1', credentials=creds)
+        service = get_service()
 
         message = EmailMessage()
         message.set_content(body)
@@ -0,0 +1,86 @@
+# intent_rules.py
+import re
+import threading
+
+# Local intent rules for WhatsApp messages. A rule only fires when the whole
+# message fits it; anything mixed ("no, send it", "what should I reply?",
+# "say nothing, just tell me the deadline") is left to the LLM
+# (llm_processor.classify_intent).
+
+_POLITE = r'(?:(?:please|pls|ok(?:ay)?|yes|yeah|yep|sure|great|perfect|looks good|lgtm|go ahead|can you|could you|would you|will you|can u)[\s,]+)*'
+_OBJECT = r'(?:\s+(?:it|this|that|the (?:email|mail|reply|draft|message)))?'
+_END = r'[\s.!?]*$'
+
+SEND_PATTERN = re.compile(
+    rf'^{_POLITE}(?:send{_OBJECT}(?:\s+(?:now|please|then))?|yes|yep|yeah|confirm(?:ed)?|go ahead|ship it|👍|✅){_END}',
+    re.IGNORECASE
+)
+CANCEL_PATTERN = re.compile(
+    rf'^(?:no[\s,]+)?(?:please\s+|pls\s+)?(?:no|nope|cancel{_OBJECT}|stop|abort|never ?mind|forget (?:about )?it|'
+    rf'(?:do not|don\'?t|dont|never) (?:send|reply){_OBJECT}(?:\s+(?:yet|now|anymore))?|discard{_OBJECT}|❌){_END}',
+    re.IGNORECASE
+)
+THANKS_PATTERN = re.compile(
+    r'^(?:(?:ok(?:ay)?|great|perfect|cool|awesome|nice)[\s,!]+)?(?:thanks|thank you|thx|ty|cheers)(?:\s+(?:so much|a lot|again))?[\s.!🙏👍]*$',
+    re.IGNORECASE
+)
+DRAFT_PATTERN = re.compile(
+    r'^(?:(?:please|pls|can you|could you|would you|kindly)\s+)*'
+    r'(?:reply|respond|answer (?:them|him|her)|write|draft|compose|accept|decline|reject|confirm (?:my|the|that|attendance)|'
+    r'tell (?:them|him|her)|say|ask (?:them|him|her)|thank (?:them|him|her)|request|reschedule|make it)\b',
+    re.IGNORECASE
+)
+QUESTION_PATTERN = re.compile(
+    r'^(?:what|when|where|who|whom|whose|why|how|which|is|are|was|were|does|do|did|can|could|will|would|should|has|have)\b',
+    re.IGNORECASE
+)
+# Any of these in a message that isn't a whole CANCEL/SEND match makes it ambiguous
+NEGATED_ACTION_RE = re.compile(
+    r'\b(?:do not|don\'?t|dont|never|not|no need to|without)\s+(?:\w+\s+){0,2}?(?:send|reply|respond|draft|write|say|answer)\b|'
+    r'\bnothing\b|^no\b',
+    re.IGNORECASE
+)
+ACTION_RE = re.compile(r'\b(?:send|reply|respond|draft|write|compose|accept|decline|reject|cancel|discard|forward)\b', re.IGNORECASE)
+INFO_REQUEST_RE = re.compile(
+    r'\b(?:tell me|let me know|remind me|show me|what|when|where|who|which|why|how|explain|summari[sz]e)\b',
+    re.IGNORECASE
+)
+
+_stats = {"local": 0, "llm_fallback": 0}
+_lock = threading.Lock()
+
+def match_intent(text):
+    """
+    Returns "SEND", "CANCEL", "DRAFT" or "QUESTION" when the whole message
+    is unambiguous, otherwise None. A bare "thanks" counts as QUESTION
+    (general chat), so it never drafts or sends anything.
+    """
+    text = " ".join(text.split())
+    if not text:
+        return None
+    if CANCEL_PATTERN.match(text):
+        return "CANCEL"
+    if SEND_PATTERN.match(text):
+        return "SEND"
+    if THANKS_PATTERN.match(text):
+        return "QUESTION"
+    if NEGATED_ACTION_RE.search(text):
+        return None
+    # Checked before QUESTION: "can you reply saying yes?" is a draft request
+    if DRAFT_PATTERN.match(text):
+        return None if INFO_REQUEST_RE.search(text) else "DRAFT"
+    if (text.endswith("?") or QUESTION_PATTERN.match(text)) and not ACTION_RE.search(text):
+        return "QUESTION"
+    return None
+
+def record(local):
+    with _lock:
+        _stats["local" if local else "llm_fallback"] += 1
+
+def stats():
+    with _lock:
+        total = _stats["local"] + _stats["llm_fallback"]
+        return {
+            **_stats,
+            "fallback_rate": round(_stats["llm_fallback"] / total, 3) if total else 0.0
+        }
@@ -0,0 +1,197 @@
+# llm_cache.py
+import os
+import json
+import hashlib
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy import update, bindparam, func
+from models import SessionLocal, LLMCacheEntry
+
+# Content-addressed cache for LLM responses: same provider + model + prompt +
+# params => same answer. In-process LRU in front of the llm_cache table.
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_TTL_HOURS = int(os.getenv("LLM_CACHE_TTL_HOURS", "168")) # 7 days
+LLM_CACHE_MAX_ROWS = int(os.getenv("LLM_CACHE_MAX_ROWS", "5000"))
+LLM_CACHE_MEMORY_ITEMS = int(os.getenv("LLM_CACHE_MEMORY_ITEMS", "256"))
+
+# Trim the table back to LLM_CACHE_MAX_ROWS every this many writes
+EVICT_EVERY = 50
+# Memory hits update last_used_at/hits in the table in batches: every this
+# many hit keys, or once the oldest pending one is this old
+TOUCH_FLUSH_EVERY = 20
+TOUCH_FLUSH_SECONDS = 60
+
+_memory = OrderedDict() # key -> (response, latency, expires_at)
+_lock = threading.Lock()
+_writes = 0
+_touched = {} # key -> [last hit (utc), hits since last flush]
+_touched_since = None # monotonic time of the oldest pending touch
+_stats = {"hits": 0, "memory_hits": 0, "misses": 0, "seconds_saved": 0.0}
+
+def make_key(provider, model, messages, **params):
+    payload = json.dumps({
+        "provider": provider,
+        "model": model,
+        "messages": messages,
+        "params": params
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _record_hit(latency, memory):
+    with _lock:
+        _stats["hits"] += 1
+        if memory:
+            _stats["memory_hits"] += 1
+        _stats["seconds_saved"] += latency or 0.0
+
+def _remember(key, response, latency, expires_at):
+    with _lock:
+        _memory[key] = (response, latency, expires_at)
+        _memory.move_to_end(key)
+        while len(_memory) > LLM_CACHE_MEMORY_ITEMS:
+            _memory.popitem(last=False)
+
+def _touch(key, now):
+    """Queues a memory hit's recency for the table. Returns True when a flush is due."""
+    global _touched_since
+    with _lock:
+        pending = _touched.setdefault(key, [now, 0])
+        pending[0] = now
+        pending[1] += 1
+        if _touched_since is None:
+            _touched_since = time.monotonic()
+        return len(_touched) >= TOUCH_FLUSH_EVERY or time.monotonic() - _touched_since >= TOUCH_FLUSH_SECONDS
+
+def flush_touches(session=None):
+    """Writes queued memory-hit recency to the table in one executemany UPDATE."""
+    global _touched, _touched_since
+    with _lock:
+        if not _touched:
+            return
+        batch, _touched, _touched_since = _touched, {}, None
+
+    table = LLMCacheEntry.__table__
+    stmt = (
+        update(table)
+        .where(table.c.key == bindparam("k"))
+        .values(last_used_at=bindparam("used"), hits=func.coalesce(table.c.hits, 0) + bindparam("n"))
+    )
+    own_session = session is None
+    session = session or SessionLocal()
+    try:
+        session.execute(stmt, [{"k": key, "used": used, "n": n} for key, (used, n) in batch.items()])
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        print(f"⚠️ LLM cache recency update failed: {e}")
+    finally:
+        if own_session:
+            session.close()
+
+def get(key, record_miss=True):
+    """
+    Returns the cached response for key, or None. record_miss=False when
+    the caller will try another key next (counted once, by that lookup).
+    """
+    if not LLM_CACHE_ENABLED:
+        return None
+
+    now = datetime.utcnow()
+    with _lock:
+        entry = _memory.get(key)
+        if entry and entry[2] > now:
+            _memory.move_to_end(key)
+        else:
+            entry = None
+            _memory.pop(key, None)
+
+    if entry:
+        _record_hit(entry[1], memory=True)
+        if _touch(key, now):
+            flush_touches()
+        return entry[0]
+
+    session = SessionLocal()
+    try:
+        row = session.query(LLMCacheEntry).filter_by(key=key).first()
+        if row and row.expires_at > now:
+            row.last_used_at = now
+            row.hits = (row.hits or 0) + 1
+            session.commit()
+            _remember(key, row.response, row.latency, row.expires_at)
+            _record_hit(row.latency, memory=False)
+            return row.response
+    except Exception as e:
+        session.rollback()
+        print(f"⚠️ LLM cache read failed: {e}")
+    finally:
+        session.close()
+
+    if record_miss:
+        with _lock:
+            _stats["misses"] += 1
+    return None
+
+def put(key, response, latency):
+    """
+    Stores a response along with how long the real call took (for stats).
+    """
+    global _writes
+    if not LLM_CACHE_ENABLED or not response:
+        return
+
+    now = datetime.utcnow()
+    expires_at = now + timedelta(hours=LLM_CACHE_TTL_HOURS)
+    _remember(key, response, latency, expires_at)
+
+    session = SessionLocal()
+    try:
+        session.merge(LLMCacheEntry(
+            key=key,
+            response=response,
+            latency=latency,
+            created_at=now,
+            last_used_at=now,
+            expires_at=expires_at,
+            hits=0
+        ))
+        session.commit()
+
+        with _lock:
+            _writes += 1
+            evict = _writes % EVICT_EVERY == 0
+        if evict:
+            _evict(session, now)
+    except Exception as e:
+        session.rollback()
+        print(f"⚠️ LLM cache write failed: {e}")
+    finally:
+        session.close()
+
+def _evict(session, now):
+    """
+    Drops expired rows, then the least recently used ones beyond LLM_CACHE_MAX_ROWS.
+    """
+    flush_touches(session) # So rows only hit in memory don't look stale
+    session.query(LLMCacheEntry).filter(LLMCacheEntry.expires_at <= now).delete(synchronize_session=False)
+    overflow = session.query(LLMCacheEntry).count() - LLM_CACHE_MAX_ROWS
+    if overflow > 0:
+        stale_keys = [
+            row.key for row in session.query(LLMCacheEntry.key)
+            .order_by(LLMCacheEntry.last_used_at.asc())
+            .limit(overflow)
+        ]
+        session.query(LLMCacheEntry).filter(LLMCacheEntry.key.in_(stale_keys)).delete(synchronize_session=False)
+    session.commit()
+
+def stats():
+    with _lock:
+        lookups = _stats["hits"] + _stats["misses"]
+        return {
+            **_stats,
+            "seconds_saved": round(_stats["seconds_saved"], 2),
+            "hit_rate": round(_stats["hits"] / lookups, 3) if lookups else 0.0,
+            "memory_items": len(_memory)
+        }
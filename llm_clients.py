@@ -0,0 +1,212 @@
+# llm_clients.py
+import os
+import json
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+import google.generativeai as genai
+
+load_dotenv()
+
+# Provider client layer: one pooled keep-alive HTTP session for Groq and one
+# reused GenerativeModel per Gemini model, so calls skip TCP/TLS setup and
+# model construction.
+
+# Groq Config
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
+GROQ_MODELS_URL = "https://api.groq.com/openai/v1/models"
+GROQ_MODEL = "llama-3.1-8b-instant"
+GROQ_TEMPERATURE = 0.3
+GROQ_TIMEOUT = float(os.getenv("GROQ_TIMEOUT", "30"))
+
+# Gemini Config
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_MODEL = "gemini-2.0-flash"
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "30"))
+if GEMINI_API_KEY:
+    genai.configure(api_key=GEMINI_API_KEY)
+
+# Flask worker threads + the poller share this pool
+HTTP_POOL_SIZE = int(os.getenv("LLM_HTTP_POOL_SIZE", "10"))
+
+_groq_session = None
+_gemini_models = {}
+_lock = threading.Lock()
+
+def groq_session():
+    global _groq_session
+    with _lock:
+        if _groq_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount("https://", adapter)
+            session.headers.update({
+                "Authorization": f"Bearer {GROQ_API_KEY}",
+                "Content-Type": "application/json"
+            })
+            _groq_session = session
+        return _groq_session
+
+def gemini_model(name=GEMINI_MODEL):
+    with _lock:
+        if name not in _gemini_models:
+            _gemini_models[name] = genai.GenerativeModel(name)
+        return _gemini_models[name]
+
+class RateLimitError(Exception):
+    """Provider answered 429 / quota exhausted. retry_after is in seconds, if the provider said."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class TransientError(Exception):
+    """5xx or connection trouble; worth retrying."""
+
+def _retry_after(res):
+    value = res.headers.get("retry-after")
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+def request_groq(messages, json_mode=False):
+    """
+    Calls Groq and returns the completion text.
+    Raises RateLimitError / TransientError for retryable failures.
+    """
+    payload = {
+        "model": GROQ_MODEL,
+        "messages": messages,
+        "temperature": GROQ_TEMPERATURE
+    }
+
+    if json_mode:
+        payload["response_format"] = {"type": "json_object"}
+
+    try:
+        res = groq_session().post(GROQ_API_URL, json=payload, timeout=GROQ_TIMEOUT)
+    except requests.RequestException as e:
+        raise TransientError(f"Groq Connection Error: {e}")
+
+    if res.status_code == 429:
+        raise RateLimitError(f"Groq rate limited: {res.text}", _retry_after(res))
+    if res.status_code >= 500:
+        raise TransientError(f"Groq Error {res.status_code}: {res.text}")
+    if res.status_code != 200:
+        raise RuntimeError(f"Groq Error: {res.text}")
+    return res.json()["choices"][0]["message"]["content"]
+
+def request_gemini(messages, json_mode=False):
+    """
+    Calls Gemini and returns the response text.
+    Raises RateLimitError / TransientError for retryable failures.
+    """
+    from google.api_core import exceptions as google_exceptions
+
+    model = gemini_model()
+
+    # Convert OpenAI "messages" format to Gemini "history" format (simplified)
+    prompt = messages[-1]['content'] # Just taking the last user prompt for simplicity in this context
+
+    generation_config = {"response_mime_type": "application/json"} if json_mode else None
+    try:
+        response = model.generate_content(
+            prompt,
+            generation_config=generation_config,
+            request_options={"timeout": GEMINI_TIMEOUT}
+        )
+    except google_exceptions.ResourceExhausted as e:
+        raise RateLimitError(f"Gemini rate limited: {e}")
+    except (google_exceptions.ServiceUnavailable, google_exceptions.InternalServerError, google_exceptions.DeadlineExceeded) as e:
+        raise TransientError(str(e))
+    return response.text
+
+def stream_groq(messages):
+    """
+    Yields the completion text piece by piece (server-sent events).
+    Raises like request_groq if the call fails before streaming starts.
+    """
+    payload = {
+        "model": GROQ_MODEL,
+        "messages": messages,
+        "temperature": GROQ_TEMPERATURE,
+        "stream": True
+    }
+
+    try:
+        res = groq_session().post(GROQ_API_URL, json=payload, timeout=GROQ_TIMEOUT, stream=True)
+    except requests.RequestException as e:
+        raise TransientError(f"Groq Connection Error: {e}")
+
+    with res:
+        if res.status_code == 429:
+            raise RateLimitError(f"Groq rate limited: {res.text}", _retry_after(res))
+        if res.status_code != 200:
+            raise TransientError(f"Groq Error {res.status_code}: {res.text}")
+
+        res.encoding = "utf-8"
+        for line in res.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data: "):
+                continue
+            data = line[len("data: "):]
+            if data == "[DONE]":
+                break
+            try:
+                frame = json.loads(data)
+            except ValueError:
+                continue # Keep-alive or other non-JSON frame
+            if frame.get("error"):
+                raise TransientError(f"Groq stream error: {frame['error']}")
+            choices = frame.get("choices") or [{}]
+            delta = (choices[0].get("delta") or {}).get("content")
+            if delta:
+                yield delta
+
+def stream_gemini(messages):
+    model = gemini_model()
+    prompt = messages[-1]['content'] # Same simplification as request_gemini
+
+    response = model.generate_content(prompt, stream=True, request_options={"timeout": GEMINI_TIMEOUT})
+    for chunk in response:
+        # chunk.text raises on chunks without text parts (the final one, or a blocked answer)
+        candidate = chunk.candidates[0] if chunk.candidates else None
+        if candidate is None:
+            raise RuntimeError(f"Gemini stream blocked: {chunk.prompt_feedback}")
+        text = "".join(part.text for part in candidate.content.parts if part.text)
+        if text:
+            yield text
+        elif candidate.finish_reason.name not in ("FINISH_REASON_UNSPECIFIED", "STOP", "MAX_TOKENS"):
+            raise RuntimeError(f"Gemini stream stopped: {candidate.finish_reason.name}")
+
+REQUEST_FUNCTIONS = {
+    "groq": request_groq,
+    "gemini": request_gemini,
+}
+
+STREAM_FUNCTIONS = {
+    "groq": stream_groq,
+    "gemini": stream_gemini,
+}
+
+# Sampling parameters each provider's requests actually send (part of the LLM cache key)
+REQUEST_PARAMS = {
+    "groq": {"temperature": GROQ_TEMPERATURE},
+    "gemini": {}, # Model defaults
+}
+
+def warm_up(provider):
+    """
+    Opens the provider connection (or builds the model) ahead of the first
+    real call, so it doesn't pay the handshake.
+    """
+    try:
+        if provider == "gemini":
+            gemini_model()
+        else:
+            groq_session().get(GROQ_MODELS_URL, timeout=GROQ_TIMEOUT)
+        print(f"✅ LLM client ready ({provider}).")
+    except Exception as e:
+        print(f"⚠️ LLM client warm-up failed: {e}")
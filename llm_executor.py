@@ -0,0 +1,359 @@
+# llm_executor.py
+import os
+import time
+import random
+import asyncio
+import threading
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from llm_clients import REQUEST_FUNCTIONS, STREAM_FUNCTIONS, RateLimitError, TransientError, GROQ_TIMEOUT, GEMINI_TIMEOUT, GROQ_API_KEY, GEMINI_API_KEY
+
+# Asyncio engine every LLM call goes through. It runs on its own background
+# loop so the sync code (Flask, scheduler) can submit work and block on it.
+# Each provider has token buckets for requests/min and tokens/min, so calls
+# go out as fast as the quota allows and no faster.
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "4"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+BACKOFF_BASE = 1.0 # seconds
+BACKOFF_CAP = 30.0
+# Upper bound on one call, quota waits, retries and backoff included, so a
+# webhook request never blocks for minutes behind a struggling provider
+LLM_CALL_DEADLINE = float(os.getenv("LLM_CALL_DEADLINE", "45"))
+
+PROVIDER_LIMITS = {
+    # Defaults match the free tiers; raise them for paid plans
+    "groq": {
+        "rpm": int(os.getenv("GROQ_RPM", "30")),
+        "tpm": int(os.getenv("GROQ_TPM", "6000")),
+        "timeout": GROQ_TIMEOUT,
+    },
+    "gemini": {
+        "rpm": int(os.getenv("GEMINI_RPM", "15")),
+        "tpm": int(os.getenv("GEMINI_TPM", "1000000")),
+        "timeout": GEMINI_TIMEOUT,
+    },
+}
+
+# "single" = only the requested provider; "hedged" = if it hasn't answered by
+# its p95 latency, also ask the other provider and take the first valid answer
+LLM_ROUTING = os.getenv("LLM_ROUTING", "single")
+HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "5")) # Until we have latency samples
+HEDGE_MIN_DELAY = 1.0
+LATENCY_WINDOW = 50 # Recent successful calls kept per provider
+MIN_LATENCY_SAMPLES = 5
+
+# Circuit breaker: this many failures in a row takes a provider out of rotation
+BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "3"))
+BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "60")) # seconds before a trial call
+
+CONFIGURED_PROVIDERS = [name for name, key in (("groq", GROQ_API_KEY), ("gemini", GEMINI_API_KEY)) if key]
+
+# Rough completion size we reserve from the tokens/min bucket per call
+COMPLETION_TOKEN_ESTIMATE = 256
+
+# A call's result, the provider that produced it (text is None on failure)
+# and how long that one call took, retries included
+Answer = namedtuple("Answer", ["provider", "text", "seconds"], defaults=(None,))
+
+class TokenBucket:
+    """
+    Classic token bucket refilled continuously at `per_minute` / 60 per second.
+    Only touched from the executor loop, so it needs no lock.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount=1):
+        amount = min(amount, self.capacity)
+        while True:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+            await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def drain(self):
+        """Empty the bucket (the provider just told us we're over quota)."""
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+
+class _Provider:
+    def __init__(self, name, limits):
+        self.name = name
+        self.requests = TokenBucket(limits["rpm"])
+        self.tokens = TokenBucket(limits["tpm"])
+        self.timeout = limits["timeout"]
+        self.paused_until = 0.0 # Set from Retry-After
+
+        # Health, for hedging and the circuit breaker
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.calls = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+
+    def record_success(self, latency):
+        self.calls += 1
+        self.latencies.append(latency)
+        if self.consecutive_failures >= BREAKER_THRESHOLD:
+            print(f"✅ {self.name} recovered, back in rotation.")
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+
+    def record_failure(self):
+        self.calls += 1
+        self.errors += 1
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= BREAKER_THRESHOLD:
+            if time.monotonic() >= self.open_until:
+                print(f"🔌 {self.name} failed {self.consecutive_failures}x in a row, taking it out of rotation for {BREAKER_COOLDOWN:.0f}s.")
+            self.open_until = time.monotonic() + BREAKER_COOLDOWN
+
+    def pause(self, delay, drain=False):
+        self.paused_until = max(self.paused_until, time.monotonic() + delay)
+        if drain:
+            self.requests.drain() # No hint from the provider; assume our budget is spent
+
+    def available(self):
+        # Once the cooldown passes, calls act as trials: one success closes the breaker
+        return time.monotonic() >= self.open_until
+
+    def percentile(self, fraction):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def hedge_delay(self):
+        if len(self.latencies) < MIN_LATENCY_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        return min(max(self.percentile(0.95), HEDGE_MIN_DELAY), self.timeout)
+
+    async def wait_for_quota(self, token_estimate):
+        delay = self.paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await self.requests.acquire(1)
+        await self.tokens.acquire(token_estimate)
+
+_loop = None
+_loop_lock = threading.Lock()
+_semaphore = None
+_providers = {}
+_hedge_stats = {"hedged": 0, "secondary_wins": 0, "failovers": 0}
+# Provider SDKs are blocking; they run here while the loop keeps scheduling
+_io_pool = ThreadPoolExecutor(max_workers=max(LLM_CONCURRENCY, 1) * 2, thread_name_prefix="llm-io")
+
+def _get_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, daemon=True, name="llm-executor").start()
+            _loop = loop
+        return _loop
+
+def _provider(name):
+    if name not in _providers:
+        _providers[name] = _Provider(name, PROVIDER_LIMITS[name])
+    return _providers[name]
+
+def _estimate_tokens(messages):
+    # ~4 chars per token is close enough for budgeting
+    return sum(len(m.get("content", "")) for m in messages) // 4 + COMPLETION_TOKEN_ESTIMATE
+
+def _backoff_delay(attempt, retry_after=None):
+    if retry_after:
+        return retry_after
+    # Exponential backoff with full jitter
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+
+def _get_semaphore():
+    # Created on the executor loop
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
+    return _semaphore
+
+async def _attempt(provider, request_fn, messages, json_mode):
+    await provider.wait_for_quota(_estimate_tokens(messages))
+    async with _semaphore:
+        started = time.monotonic()
+        call = asyncio.get_running_loop().run_in_executor(_io_pool, request_fn, messages, json_mode)
+        # Give up on (and stop waiting for) calls that hang past the provider timeout
+        result = await asyncio.wait_for(call, timeout=provider.timeout + 5)
+    return result, time.monotonic() - started
+
+async def _run_one(provider_name, messages, json_mode, deadline):
+    _get_semaphore()
+    provider = _provider(provider_name)
+    request_fn = REQUEST_FUNCTIONS[provider_name]
+
+    for attempt in range(LLM_MAX_RETRIES):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            print(f"❌ {provider_name}: no answer within {LLM_CALL_DEADLINE:.0f}s, giving up.")
+            return Answer(provider_name, None)
+        try:
+            result, latency = await asyncio.wait_for(
+                _attempt(provider, request_fn, messages, json_mode), timeout=remaining
+            )
+            provider.record_success(latency)
+            return Answer(provider_name, result)
+        except RateLimitError as e:
+            delay = _backoff_delay(attempt, e.retry_after)
+            provider.pause(delay, drain=not e.retry_after)
+            print(f"⏳ {provider_name} rate limited, backing off {delay:.1f}s...")
+        except (TransientError, asyncio.TimeoutError) as e:
+            if time.monotonic() >= deadline:
+                continue # Out of time (maybe still waiting for quota); reported at the top
+            provider.record_failure()
+            delay = min(_backoff_delay(attempt), deadline - time.monotonic())
+            print(f"⚠️ {provider_name} call failed ({e or 'timeout'}), retrying in {delay:.1f}s...")
+            await asyncio.sleep(delay)
+        except Exception as e:
+            provider.record_failure()
+            print(f"❌ {provider_name} Error: {e}")
+            return Answer(provider_name, None)
+
+    print(f"❌ {provider_name}: giving up after {LLM_MAX_RETRIES} attempts.")
+    return Answer(provider_name, None)
+
+def _secondary(primary):
+    return next((name for name in CONFIGURED_PROVIDERS if name != primary), None)
+
+def candidate_providers(primary):
+    """Providers whose answers a call for primary may come back from."""
+    secondary = _secondary(primary) if LLM_ROUTING == "hedged" else None
+    return [primary] + ([secondary] if secondary else [])
+
+async def _run_hedged(primary_name, messages, json_mode, deadline):
+    """
+    Asks the primary provider; if it hasn't answered within its p95 latency
+    (or fails), also asks the secondary and returns the first valid answer.
+    Providers with an open circuit breaker are skipped. Both share one deadline.
+    """
+    secondary_name = _secondary(primary_name)
+    if not secondary_name or not _provider(secondary_name).available():
+        return await _run_one(primary_name, messages, json_mode, deadline)
+
+    primary = _provider(primary_name)
+    if not primary.available():
+        _hedge_stats["failovers"] += 1
+        return await _run_one(secondary_name, messages, json_mode, deadline)
+
+    tasks = {asyncio.ensure_future(_run_one(primary_name, messages, json_mode, deadline)): primary_name}
+    done, _ = await asyncio.wait(tasks, timeout=primary.hedge_delay())
+
+    if not done or next(iter(done)).result().text is None:
+        _hedge_stats["hedged"] += 1
+        print(f"🏎️ {primary_name} slow or failing, hedging with {secondary_name}...")
+        tasks[asyncio.ensure_future(_run_one(secondary_name, messages, json_mode, deadline))] = secondary_name
+
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                answer = task.result()
+                if answer.text is not None:
+                    if answer.provider != primary_name:
+                        _hedge_stats["secondary_wins"] += 1
+                    return answer
+        return Answer(primary_name, None)
+    finally:
+        for task in pending:
+            task.cancel() # The loser's blocking call finishes in the background; we just stop waiting
+
+async def _timed(runner, provider_name, messages, json_mode, deadline):
+    started = time.monotonic()
+    answer = await runner(provider_name, messages, json_mode, deadline)
+    return answer._replace(seconds=time.monotonic() - started)
+
+async def _run_many(provider_name, calls):
+    runner = _run_hedged if LLM_ROUTING == "hedged" else _run_one
+    deadline = time.monotonic() + LLM_CALL_DEADLINE
+    return await asyncio.gather(*(_timed(runner, provider_name, messages, json_mode, deadline) for messages, json_mode in calls))
+
+def run_many_answers(provider_name, calls):
+    """
+    Runs (messages, json_mode) calls concurrently within the provider's quota.
+    Returns an Answer per call, in the same order; with hedging, the
+    provider may be the secondary.
+    """
+    if not calls:
+        return []
+    future = asyncio.run_coroutine_threadsafe(_run_many(provider_name, calls), _get_loop())
+    return future.result()
+
+def run_many(provider_name, calls):
+    """Like run_many_answers, returning just the texts (None for failures)."""
+    return [answer.text for answer in run_many_answers(provider_name, calls)]
+
+def run(provider_name, messages, json_mode=False):
+    return run_many(provider_name, [(messages, json_mode)])[0]
+
+async def _acquire_stream_slot(provider, messages):
+    async def acquire():
+        await provider.wait_for_quota(_estimate_tokens(messages))
+        await _get_semaphore().acquire()
+    await asyncio.wait_for(acquire(), timeout=LLM_CALL_DEADLINE)
+
+def _stream(provider, stream_fn, messages, loop):
+    started = time.monotonic()
+    try:
+        yield from stream_fn(messages)
+    except RateLimitError as e:
+        loop.call_soon_threadsafe(provider.pause, _backoff_delay(0, e.retry_after), not e.retry_after)
+        raise
+    except Exception:
+        loop.call_soon_threadsafe(provider.record_failure)
+        raise
+    else:
+        loop.call_soon_threadsafe(provider.record_success, time.monotonic() - started)
+    finally:
+        loop.call_soon_threadsafe(_semaphore.release)
+
+def open_stream(provider_name, messages):
+    """
+    Starts a streamed completion under the same token buckets, concurrency
+    limit and circuit breaker as run(). With hedged routing, a provider whose
+    circuit is open fails over to the other one (a stream can't be hedged
+    once text is flowing). Returns (provider that answers, iterator of text
+    pieces); provider errors propagate from the iterator.
+    """
+    if LLM_ROUTING == "hedged" and not _provider(provider_name).available():
+        secondary = _secondary(provider_name)
+        if secondary and _provider(secondary).available():
+            _hedge_stats["failovers"] += 1
+            provider_name = secondary
+
+    provider = _provider(provider_name)
+    loop = _get_loop()
+    try:
+        asyncio.run_coroutine_threadsafe(_acquire_stream_slot(provider, messages), loop).result()
+    except asyncio.TimeoutError:
+        raise TransientError(f"{provider_name}: no quota within {LLM_CALL_DEADLINE:.0f}s")
+    return provider_name, _stream(provider, STREAM_FUNCTIONS[provider_name], messages, loop)
+
+def stats():
+    providers = {}
+    for name, provider in list(_providers.items()):
+        p50, p95 = provider.percentile(0.5), provider.percentile(0.95)
+        providers[name] = {
+            "calls": provider.calls,
+            "error_rate": round(provider.errors / provider.calls, 3) if provider.calls else 0.0,
+            "p50_seconds": round(p50, 3) if p50 is not None else None,
+            "p95_seconds": round(p95, 3) if p95 is not None else None,
+            "circuit": "closed" if provider.available() else "open",
+        }
+    return {"routing": LLM_ROUTING, "providers": providers, **_hedge_stats}
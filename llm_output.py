@@ -0,0 +1,197 @@
+# llm_output.py
+import re
+import json
+from datetime import datetime, timezone
+
+# Shared parser for structured LLM output. It scans the text once, trying
+# json.JSONDecoder.raw_decode at each "{" / "[", so prose, code fences and
+# nested objects around the JSON don't matter, then checks the result
+# against a per-call schema and coerces the values to the declared types.
+#
+# A schema maps field name -> (type, required). Types:
+#   "bool", "str", "datetime", or a tuple of allowed (upper-case) string values.
+# "datetime" values are ISO 8601 normalized to "YYYY-MM-DD HH:MM:SS" (with
+# an offset, converted to UTC and kept as "+00:00", so deadline_parser
+# doesn't read them in the user's zone); other text such as "next Friday"
+# is passed through for deadline_parser's free-text fallback.
+# Missing, null or invalid optional fields are left out, so callers' .get()
+# defaults apply; an invalid required field rejects the object.
+
+CLASSIFICATION_SCHEMA = {
+    "is_important": ("bool", True),
+    "title": ("str", False),
+    "deadline": ("datetime", False),
+    "action": ("str", False),
+    "summary": ("str", False),
+}
+
+BATCH_ITEM_SCHEMA = {
+    "id": ("str", False),
+    **CLASSIFICATION_SCHEMA,
+}
+
+INTENT_SCHEMA = {
+    "intent": (("DRAFT", "QUESTION", "SEND", "CANCEL"), True),
+}
+
+_decoder = json.JSONDecoder()
+_START_RE = re.compile(r'[\[{]')
+
+# Only used when nothing in the text decodes as-is
+_SMART_QUOTES = (('“', '"'), ('”', '"'), ('‘', "'"), ('’', "'")) # str.replace beats str.translate on non-ASCII text
+_TRAILING_COMMA_RE = re.compile(r',\s*([}\]])')
+_PY_LITERAL_RE = re.compile(r'([:\[,]\s*)(True|False|None)\b') # Value positions only
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_SINGLE_QUOTED_RE = re.compile(r"'([^'\\]*)'(?=\s*[:,}\]])")
+
+_TRUE_STRINGS = {"true", "yes", "1"}
+_FALSE_STRINGS = {"false", "no", "0"}
+_NULL_STRINGS = {"", "null", "none", "n/a", "na", "tbd", "not specified"}
+
+def _coerce(value, field_type):
+    """
+    Returns (ok, value) with value converted to field_type.
+    """
+    if field_type == "bool":
+        if isinstance(value, bool):
+            return True, value
+        if isinstance(value, (int, float)):
+            return True, bool(value)
+        if isinstance(value, str):
+            text = value.strip().lower()
+            if text in _TRUE_STRINGS:
+                return True, True
+            if text in _FALSE_STRINGS:
+                return True, False
+        return False, None
+
+    if field_type == "str":
+        if isinstance(value, str):
+            return True, value.strip()
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return True, str(value)
+        return False, None
+
+    if field_type == "datetime":
+        if not isinstance(value, str):
+            return False, None
+        text = value.strip()
+        if text.lower() in _NULL_STRINGS:
+            return True, None
+        try:
+            parsed = datetime.fromisoformat(text.replace("Z", "+00:00"))
+        except ValueError:
+            return True, text # Free text ("next Friday"); deadline_parser reads it
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc)
+            return True, parsed.replace(tzinfo=None, microsecond=0).isoformat(sep=" ") + "+00:00"
+        if len(text) == 19 and text[10] == " ":
+            return True, text # Already in the normalized form
+        return True, parsed.replace(microsecond=0).isoformat(sep=" ")
+
+    # Enum
+    if isinstance(value, str) and value.strip().upper() in field_type:
+        return True, value.strip().upper()
+    return False, None
+
+def validate(obj, schema):
+    """
+    Checks obj against schema. Returns the coerced dict, or None if a
+    required field is missing or invalid. Unknown keys are dropped, and so
+    are optional fields that are missing, null or invalid.
+    """
+    if not isinstance(obj, dict):
+        return None
+
+    result = {}
+    for name, (field_type, required) in schema.items():
+        value = obj.get(name)
+        if value is None:
+            if required:
+                return None
+            continue
+        ok, coerced = _coerce(value, field_type)
+        if not ok:
+            if required:
+                return None
+            continue
+        if coerced is not None:
+            result[name] = coerced
+    return result
+
+def _iter_values(text):
+    """
+    Yields every JSON value that decodes starting at a "{" or "[" in text,
+    outermost first. Decoded spans are skipped, so each char is visited once.
+    """
+    pos = 0
+    while True:
+        match = _START_RE.search(text, pos)
+        if not match:
+            return
+        try:
+            value, end = _decoder.raw_decode(text, match.start())
+        except ValueError:
+            pos = match.start() + 1
+            continue
+        yield value
+        pos = end
+
+def _repair(text):
+    # Each pass only runs if its trigger is in the text; most responses need none
+    for smart, plain in _SMART_QUOTES:
+        if smart in text:
+            text = text.replace(smart, plain)
+    if "True" in text or "False" in text or "None" in text:
+        text = _PY_LITERAL_RE.sub(lambda m: m.group(1) + _PY_LITERALS[m.group(2)], text)
+    if "'" in text:
+        text = _SINGLE_QUOTED_RE.sub(lambda m: json.dumps(m.group(1)), text)
+    if "," in text:
+        text = _TRAILING_COMMA_RE.sub(r'\1', text)
+    return text
+
+def _candidates(text):
+    yield from _iter_values(text)
+    if not _START_RE.search(text):
+        return # No object or array to repair (e.g. a refusal)
+    repaired = _repair(text)
+    if repaired != text:
+        yield from _iter_values(repaired)
+
+def _nested_objects(value):
+    """The value itself plus any objects nested one level down (e.g. {"result": {...}})."""
+    yield value
+    if isinstance(value, dict):
+        for inner in value.values():
+            if isinstance(inner, dict):
+                yield inner
+
+def parse_object(text, schema):
+    """
+    Returns the first JSON object in text that satisfies schema (coerced),
+    or None.
+    """
+    if not text:
+        return None
+    for value in _candidates(text):
+        for candidate in _nested_objects(value):
+            result = validate(candidate, schema)
+            if result is not None:
+                return result
+    return None
+
+def parse_list(text, item_schema):
+    """
+    Returns the validated items of the first JSON array in text (bare, or
+    wrapped in an object such as {"results": [...]}). Items that fail the
+    schema are left out. Returns [] if there is no array.
+    """
+    if not text:
+        return []
+    for value in _candidates(text):
+        if isinstance(value, dict):
+            value = next((v for v in value.values() if isinstance(v, list)), None)
+        if isinstance(value, list):
+            items = (validate(item, item_schema) for item in value)
+            return [item for item in items if item is not None]
+    return []
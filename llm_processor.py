@@ -1,101 +1,124 @@
 import os
-import requests
-import json
-import re
-import unicodedata
 import time
 from dotenv import load_dotenv
-import google.generativeai as genai
+import llm_cache
+import llm_output
+import intent_rules
+from email_preprocess import prepare_for_prompt, CHARS_PER_TOKEN
+from deadline_parser import now_local
+import llm_executor
+from llm_clients import GROQ_MODEL, GEMINI_MODEL, REQUEST_PARAMS
 
 load_dotenv()
 
 # Configuration
 LLM_PROVIDER = os.getenv("LLM_PROVIDER", "groq") # "groq" or "gemini"
 
-# Groq Config
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
-
-# Gemini Config
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-
 MAX_BODY_LENGTH = 1000
+# Per-call prompt budgets for the email body (see email_preprocess)
+CLASSIFY_TOKEN_BUDGET = MAX_BODY_LENGTH // CHARS_PER_TOKEN
+QA_TOKEN_BUDGET = 500
+LLM_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", "5")) # Emails per classification call
 
 def clean_llm_output(output):
     """
-    Extract and parse JSON-like string from LLM response safely.
+    Extract and validate the classification JSON from an LLM response.
+    Returns the typed dict (deadline normalized to ISO) or None.
     """
-    try:
-        normalized_output = unicodedata.normalize("NFKD", output)
-        normalized_output = re.sub(r'```(?:json|python)?\s*', '', normalized_output)
-        normalized_output = re.sub(r'```', '', normalized_output)
-        
-        match = re.search(r'\{[^{}]*"is_important"[^{}]*\}', normalized_output, re.DOTALL)
-        if not match:
-            match = re.search(r'\{.*?\}', normalized_output, re.DOTALL)
-            if not match:
-                return None
+    parsed = llm_output.parse_object(output, llm_output.CLASSIFICATION_SCHEMA)
+    if parsed is None:
+        print("❌ JSON Parsing Error: no valid classification object in response")
+    return parsed
 
-        dict_str = match.group(0)
-        dict_str = dict_str.replace('true', 'true').replace('false', 'false') # Safety
-        return json.loads(dict_str)
+def _cache_key(messages, json_mode, provider=LLM_PROVIDER):
+    # Keyed by the provider that answered, so hedged answers aren't attributed to the primary
+    model_name = GEMINI_MODEL if provider == "gemini" else GROQ_MODEL
+    return llm_cache.make_key(provider, model_name, messages, json_mode=json_mode, **REQUEST_PARAMS[provider])
 
-    except Exception as e:
-        print(f"❌ JSON Parsing Error: {e}")
-        return None
+def _cache_lookup(messages, json_mode):
+    # The primary's answer first, then one a hedged call got from the secondary
+    providers = llm_executor.candidate_providers(LLM_PROVIDER)
+    for n, provider in enumerate(providers, start=1):
+        cached = llm_cache.get(_cache_key(messages, json_mode, provider), record_miss=n == len(providers))
+        if cached is not None:
+            return cached
+    return None
 
-def call_llm(messages, json_mode=False):
+def call_llm(messages, json_mode=False, use_cache=True, refresh=False):
     """
-    Unified function to call either Groq or Gemini
+    Unified function to call either Groq or Gemini.
+    Identical requests are answered from llm_cache when use_cache is set;
+    refresh=True skips the lookup but still stores the new answer (used when
+    a cached answer turned out to be unusable).
     """
-    if LLM_PROVIDER == "gemini":
-        model = genai.GenerativeModel('gemini-2.0-flash')
-        
-        # Convert OpenAI "messages" format to Gemini "history" format (simplified)
-        prompt = messages[-1]['content'] # Just taking the last user prompt for simplicity in this context
-        
-        try:
-            if json_mode:
-                response = model.generate_content(prompt, generation_config={"response_mime_type": "application/json"})
-            else:
-                response = model.generate_content(prompt)
-            return response.text
-        except Exception as e:
-            print(f"❌ Gemini Error: {e}")
-            return None
-
-    else: # Default to Groq
-        headers = {
-            "Authorization": f"Bearer {GROQ_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
-        payload = {
-            "model": "llama-3.1-8b-instant",
-            "messages": messages,
-            "temperature": 0.3
-        }
-        
-        if json_mode:
-            payload["response_format"] = {"type": "json_object"}
+    return call_llm_many([messages], json_mode, use_cache, refresh)[0]
+
+def call_llm_many(messages_list, json_mode=False, use_cache=True, refresh=False):
+    """
+    Like call_llm for several prompts at once. Cache misses run concurrently
+    on llm_executor, within the provider's rate limits. Results keep input order.
+    """
+    results = [None] * len(messages_list)
+
+    misses = []
+    for i, messages in enumerate(messages_list):
+        cached = _cache_lookup(messages, json_mode) if use_cache and not refresh else None
+        if cached is not None:
+            results[i] = cached
+        else:
+            misses.append(i)
 
-        try:
-            res = requests.post(GROQ_API_URL, headers=headers, json=payload, timeout=30)
-            if res.status_code != 200:
-                print(f"❌ Groq Error: {res.text}")
-                return None
-            return res.json()["choices"][0]["message"]["content"]
-        except Exception as e:
-            print(f"❌ Groq Connection Error: {e}")
-            return None
+    answers = llm_executor.run_many_answers(LLM_PROVIDER, [(messages_list[i], json_mode) for i in misses])
 
+    for i, answer in zip(misses, answers):
+        results[i] = answer.text
+        if use_cache and answer.text:
+            # Each call's own latency, not the whole batch's, so seconds_saved isn't multiplied
+            llm_cache.put(_cache_key(messages_list[i], json_mode, answer.provider), answer.text, answer.seconds)
+    return results
+
+class StreamInterrupted(Exception):
+    """The provider failed after part of a streamed answer was yielded."""
+
+def stream_llm(messages, use_cache=True):
+    """
+    Yields the completion in pieces as the provider generates it, through
+    llm_executor's rate limiting. Falls back to a regular call_llm if
+    streaming fails before any text arrived; raises StreamInterrupted if it
+    fails after, so the partial text is never taken as the answer.
+    """
+    if use_cache:
+        cached = _cache_lookup(messages, False)
+        if cached is not None:
+            yield cached
+            return
+
+    pieces = []
+    started = time.time()
+    try:
+        provider, stream = llm_executor.open_stream(LLM_PROVIDER, messages)
+        for piece in stream:
+            pieces.append(piece)
+            yield piece
+    except Exception as e:
+        print(f"❌ Streaming Error: {e}")
+        if pieces:
+            raise StreamInterrupted(str(e)) from e
+        # Nothing delivered yet, so the retrying/hedged path is still an option
+        content = call_llm(messages, use_cache=use_cache, refresh=True)
+        if content:
+            yield content
+        return
+
+    if use_cache and pieces:
+        llm_cache.put(_cache_key(messages, False, provider), "".join(pieces), time.time() - started)
 
 def process_email_with_llm(email_text, retries=3):
-    safe_body = email_text.strip()[:MAX_BODY_LENGTH]
+    safe_body = prepare_for_prompt(email_text, CLASSIFY_TOKEN_BUDGET, "classify")
     
-    current_time_str = time.strftime("%Y-%m-%d %H:%M:%S")
+    # Hour resolution is enough for date math and keeps the prompt cacheable.
+    # User's timezone, so naive deadlines come back in the zone deadline_parser reads them in
+    current_time_str = now_local().strftime("%Y-%m-%d %H:00:00")
 
     prompt = f"""
     You are an assistant that processes emails.
@@ -104,7 +127,7 @@ def process_email_with_llm(email_text, retries=3):
     If the email is important (internship, interview, job offer, etc.), return valid JSON.
 
     CRITICAL: Respond ONLY with a valid JSON object.
-    1. "deadline": EXTRACT the exact deadline if present. CONVERT relative dates (e.g., 'next Friday') to absolute ISO 8601 (YYYY-MM-DD HH:MM:SS) based on the Current Date. If none, return null.
+    1. "deadline": EXTRACT the exact deadline if present. CONVERT relative dates to absolute ISO 8601 (YYYY-MM-DD HH:MM:SS) based on the Current Date ('Friday' = the next Friday on or after today, 'next Friday' = Friday of next week). If none, return null.
 
     Required format:
     {{
@@ -124,17 +147,112 @@ def process_email_with_llm(email_text, retries=3):
         {"role": "user", "content": prompt}
     ]
 
-    for _ in range(retries):
-        content = call_llm(messages, json_mode=True)
+    for attempt in range(retries):
+        content = call_llm(messages, json_mode=True, refresh=attempt > 0)
         if content:
             parsed = clean_llm_output(content)
             if parsed:
                 return parsed if parsed.get("is_important") else None
-        time.sleep(1)
+        # No sleep: llm_executor already backs off on rate limits
         
     return None
 
+def _parse_batch_output(output):
+    """
+    Pulls the list of per-email results out of a batch response.
+    Accepts a bare JSON array or an object wrapping one (json_mode forces an object).
+    """
+    items = llm_output.parse_list(output, llm_output.BATCH_ITEM_SCHEMA)
+    if not items:
+        print("❌ Batch JSON Parsing Error: no valid results in response")
+    return items
+
+def process_emails_with_llm(emails, batch_size=LLM_BATCH_SIZE):
+    """
+    Batch version of process_email_with_llm.
+
+    Args:
+        emails (list): (msg_id, email_text) pairs.
+    Returns:
+        dict: msg_id -> parsed result, or None if not important.
+    Items the model skips or mangles are retried one by one.
+    """
+    batches = [emails[start:start + batch_size] for start in range(0, len(emails), batch_size)]
+    prompts = [_batch_messages(batch) for batch in batches]
+
+    # All batch calls go out together; llm_executor paces them to the quota
+    contents = call_llm_many(prompts, json_mode=True)
+
+    results = {}
+    for batch, content in zip(batches, contents):
+        results.update(_map_batch_results(batch, content))
+    return results
+
+def _batch_messages(batch):
+    # Short local labels are easier for the model to echo back than Gmail IDs
+    email_blocks = "\n".join(
+        f'[E{i}]\n\"\"\"{prepare_for_prompt(text, CLASSIFY_TOKEN_BUDGET, "classify-batch")}\"\"\"'
+        for i, (_, text) in enumerate(batch, start=1)
+    )
+    current_time_str = now_local().strftime("%Y-%m-%d %H:00:00")
+
+    prompt = f"""
+    You are an assistant that processes emails.
+    Current Date/Time: {current_time_str}
+
+    Below are {len(batch)} emails, each labelled [E1], [E2], ...
+    For EACH email decide if it is important (internship, interview, job offer, etc.).
+
+    CRITICAL: Respond ONLY with a valid JSON object containing one result per email, in order.
+    "deadline": EXTRACT the exact deadline if present. CONVERT relative dates to absolute ISO 8601 (YYYY-MM-DD HH:MM:SS) based on the Current Date ('Friday' = the next Friday on or after today, 'next Friday' = Friday of next week). If none, return null.
+
+    Required format:
+    {{
+      "results": [
+        {{"id": "E1", "is_important": true, "title": "...", "deadline": "YYYY-MM-DD HH:MM:SS", "action": "...", "summary": "..."}},
+        {{"id": "E2", "is_important": false}}
+      ]
+    }}
+
+    Emails:
+    {email_blocks}
+    """
+
+    messages = [
+        {"role": "system", "content": "You are an intelligent email summarizer. Always respond with valid JSON only."},
+        {"role": "user", "content": prompt}
+    ]
+    return messages
+
+def _map_batch_results(batch, content):
+    labels = {f"E{i}": msg_id for i, (msg_id, _) in enumerate(batch, start=1)}
+    results = {}
+    items = _parse_batch_output(content) if content else []
+
+    for position, item in enumerate(items, start=1):
+        label = item.get("id", "").strip("[] ").upper()
+        if label not in labels and len(items) == len(batch):
+            label = f"E{position}" # Model dropped/garbled the label; fall back to order
+        if label not in labels or labels[label] in results:
+            continue
+        results[labels[label]] = item if item.get("is_important") else None
+
+    # Retry only what the batch didn't answer
+    for msg_id, text in batch:
+        if msg_id not in results:
+            print(f"   -> Batch missed {msg_id}, retrying on its own...")
+            results[msg_id] = process_email_with_llm(text)
+
+    return results
+
+
 def classify_intent(user_input):
+    # Common cases ("send", "cancel", "reply ...", "when ...?") are resolved locally
+    intent = intent_rules.match_intent(user_input)
+    intent_rules.record(local=intent is not None)
+    if intent:
+        return intent
+
     prompt = f"""
     Classify the user input:
     1. DRAFT (User wants a reply written)
@@ -148,17 +266,13 @@ def classify_intent(user_input):
     
     messages = [{"role": "user", "content": prompt}]
     content = call_llm(messages, json_mode=True)
-    if content:
-        try:
-            return json.loads(content).get("intent", "QUESTION")
-        except:
-            return "QUESTION"
-    return "QUESTION"
+    parsed = llm_output.parse_object(content, llm_output.INTENT_SCHEMA)
+    return parsed["intent"] if parsed else "QUESTION"
 
 def chat_with_email(email_body, question):
     prompt = f"""
     Context:
-    \"\"\"{email_body[:2000]}\"\"\"
+    \"\"\"{prepare_for_prompt(email_body, QA_TOKEN_BUDGET, "question")}\"\"\"
     
     Question: "{question}"
     
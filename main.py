@@ -2,7 +2,10 @@ from gmail_fetcher import fetch_emails
 from llm_processor import process_email_with_llm
 from whatsapp_bot import send_whatsapp_message, TO_WHATSAPP
 import time
-from context_store import load_context, save_context
+from context_store import load_user_context, save_user_context
+import session_cache
+from deadline_parser import resolve_deadline, format_deadline
+from email_preprocess import clean_email_text
 
 from models import init_db
 import threading
@@ -22,10 +25,7 @@ def main():
     print("📬 Fetching latest emails...")
     emails = fetch_emails(4)
     sender_number = TO_WHATSAPP.replace("whatsapp:", "")
-    context = load_context()
-
-    if sender_number not in context:
-        context[sender_number] = {}
+    user_ctx = load_user_context(sender_number)
 
     for index, email in enumerate(emails, start=1):
         body = email.get("body", "")
@@ -36,18 +36,24 @@ def main():
         if not parsed:
             continue
 
+        deadline = resolve_deadline(
+            parsed.get("deadline"),
+            f"{email.get('subject', '')}\n{clean_email_text(body)}",
+            email.get("received_at")
+        )
+
         send_whatsapp_message(
             title=parsed.get("title", "No Title"),
-            deadline=parsed.get("deadline", "N/A"),
+            deadline=format_deadline(deadline),
             action=parsed.get("action", "N/A"),
             summary=parsed.get("summary", "N/A"),
             index=index
         )
 
-        context[sender_number][str(index)] = {
+        user_ctx[str(index)] = {
             "summary": parsed.get("summary", ""),
             "title": parsed.get("title", ""),
-            "deadline": parsed.get("deadline", ""),
+            "deadline": deadline,
             "action": parsed.get("action", ""),
             "original_body": body,
             "id": email.get("id"),
@@ -59,7 +65,8 @@ def main():
 
         time.sleep(1.2)
 
-    save_context(context)
+    save_user_context(sender_number, user_ctx)
+    session_cache.invalidate(sender_number, other_processes=True)
 
 if __name__ == "__main__":
     main()
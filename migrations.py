@@ -0,0 +1,169 @@
+import sys
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import text, select, insert, inspect, bindparam
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import Executable, ClauseElement
+from models import Base, SchemaMigration, SessionLocal, engine as default_engine, LLMCacheEntry, ProcessedEmail, Email, EmailBody, EmailArchive
+
+# Versioned schema changes. create_all only creates missing tables, so
+# anything added to an existing table (indexes, columns) is a numbered step
+# here. Applied versions are recorded in schema_migrations and each step
+# runs once per database; init_db() runs pending steps on startup.
+# Steps must work on both Postgres and SQLite, and be safe on fresh
+# databases where create_all already built the object.
+#
+# Usage: python migrations.py [migrate|status|check]
+
+MIGRATION_LOCK_ID = 782301 # Postgres advisory lock, so two processes don't migrate at once
+
+def _create_indexes(*names):
+    def step(conn):
+        indexes = {index.name: index for table in Base.metadata.tables.values() for index in table.indexes}
+        for name in names:
+            indexes[name].create(conn, checkfirst=True)
+    return step
+
+def _move_bodies(conn):
+    from email_bodies import move_legacy_bodies
+    EmailBody.__table__.create(conn, checkfirst=True)
+    moved = move_legacy_bodies(conn)
+    if moved:
+        print(f"   -> Compressed {moved} email bodies into email_bodies")
+
+def _add_email_retention(conn):
+    # Rows that predate the column start aging from the day it was added
+    if "created_at" not in {c["name"] for c in inspect(conn).get_columns("emails")}:
+        conn.execute(text("ALTER TABLE emails ADD COLUMN created_at TIMESTAMP"))
+    conn.execute(Email.__table__.update().where(Email.created_at.is_(None)).values(created_at=datetime.utcnow()))
+    EmailArchive.__table__.create(conn, checkfirst=True)
+
+def _deadlines_to_utc(conn):
+    # Deadlines used to be stored as naive times in the user's timezone;
+    # deadline_parser now stores naive UTC. Rows written by the new code
+    # before this step ran would be shifted twice, so deploy both together.
+    from deadline_parser import user_timezone
+    tz = user_timezone()
+    emails = Email.__table__
+    rows = conn.execute(select(emails.c.id, emails.c.deadline).where(emails.c.deadline.isnot(None))).all()
+    updates = [
+        {"k": row.id, "utc": row.deadline.replace(tzinfo=tz).astimezone(timezone.utc).replace(tzinfo=None)}
+        for row in rows
+    ]
+    if updates:
+        conn.execute(emails.update().where(emails.c.id == bindparam("k")).values(deadline=bindparam("utc")), updates)
+        print(f"   -> Converted {len(updates)} deadline(s) from {tz} to UTC")
+
+MIGRATIONS = [
+    (1, "index emails by user and menu slot", _create_indexes("ix_emails_user_menu")),
+    (2, "partial index on emails waiting for a reminder", _create_indexes("ix_emails_pending_reminders")),
+    (3, "llm_cache eviction indexes", _create_indexes("ix_llm_cache_expires_at", "ix_llm_cache_last_used_at")),
+    (4, "index processed_emails by processed_at", _create_indexes("ix_processed_emails_processed_at")),
+    (5, "move email bodies to compressed email_bodies", _move_bodies),
+    (6, "emails.created_at and the emails_archive table", _add_email_retention),
+    (7, "store email deadlines in UTC", _deadlines_to_utc),
+]
+
+def run_migrations(engine=None):
+    """
+    Applies pending steps in order, in one transaction. Returns the versions applied.
+    """
+    engine = engine or default_engine
+    applied_now = []
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+        SchemaMigration.__table__.create(conn, checkfirst=True)
+        applied = {row[0] for row in conn.execute(select(SchemaMigration.version))}
+
+        for version, name, step in MIGRATIONS:
+            if version in applied:
+                continue
+            print(f"🛠️ Migration {version}: {name}...")
+            step(conn)
+            conn.execute(insert(SchemaMigration).values(version=version, name=name, applied_at=datetime.utcnow()))
+            applied_now.append(version)
+
+    if applied_now:
+        print(f"✅ Applied {len(applied_now)} migration(s).")
+    return applied_now
+
+def status(engine=None):
+    engine = engine or default_engine
+    with engine.connect() as conn:
+        SchemaMigration.__table__.create(conn, checkfirst=True)
+        applied = dict(conn.execute(select(SchemaMigration.version, SchemaMigration.applied_at)).all())
+        conn.commit()
+    for version, name, _ in MIGRATIONS:
+        when = applied.get(version)
+        print(f"{'✅' if when else '⏳'} {version:>3} {name}" + (f" (applied {when:%Y-%m-%d %H:%M})" if when else ""))
+
+class Explain(Executable, ClauseElement):
+    """EXPLAIN for any select, with its bind parameters processed like a normal query."""
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+@compiles(Explain)
+def _compile_explain(element, compiler, **kw):
+    prefix = "EXPLAIN QUERY PLAN " if compiler.dialect.name == "sqlite" else "EXPLAIN "
+    return prefix + compiler.process(element.statement, **kw)
+
+def _plan_checks():
+    from context_store import user_context_query, due_reminders_query
+    now = datetime.utcnow()
+    # (name, query builder, index the plan must mention)
+    return [
+        ("load_user_context", lambda s: user_context_query(s, "0"), "ix_emails_user_menu"),
+        ("load_due_reminders", lambda s: due_reminders_query(s, now, now + timedelta(hours=24)), "ix_emails_pending_reminders"),
+        ("processed_ids lookup", lambda s: s.query(ProcessedEmail.id).filter(ProcessedEmail.id.in_(["a", "b"])), None),
+        ("processed_ids warm-up", lambda s: s.query(ProcessedEmail.id).order_by(ProcessedEmail.processed_at.desc()).limit(10), "ix_processed_emails_processed_at"),
+        ("llm_cache expiry", lambda s: s.query(LLMCacheEntry.key).filter(LLMCacheEntry.expires_at <= now), "ix_llm_cache_expires_at"),
+        ("llm_cache LRU", lambda s: s.query(LLMCacheEntry.key).order_by(LLMCacheEntry.last_used_at.asc()).limit(10), "ix_llm_cache_last_used_at"),
+    ]
+
+def _full_scan(plan, dialect):
+    if dialect == "sqlite":
+        # "SCAN emails" is a full table scan; "SCAN ... USING INDEX" is not
+        return any(line.startswith("SCAN ") and " USING " not in line for line in plan)
+    return any("Seq Scan" in line for line in plan)
+
+def check_query_plans():
+    """
+    EXPLAINs the hot queries and checks each uses its index (and none does
+    a full table scan). On Postgres sequential scans are disabled for the
+    check, since the planner rightly prefers them on small tables; the point
+    is that an index is usable. Returns True if every check passed.
+    """
+    session = SessionLocal()
+    dialect = session.get_bind().dialect.name
+    ok = True
+    try:
+        if dialect == "postgresql":
+            session.execute(text("SET LOCAL enable_seqscan = off"))
+        for name, build, index in _plan_checks():
+            rows = session.execute(Explain(build(session).statement)).all()
+            plan = [str(row[-1]).strip() for row in rows]
+            passed = not _full_scan(plan, dialect) and (index is None or any(index in line for line in plan))
+            ok = ok and passed
+            print(f"{'✅' if passed else '❌'} {name}" + ("" if passed else f" (expected {index or 'an index'})"))
+            for line in plan:
+                print(f"      {line}")
+    finally:
+        session.rollback()
+        session.close()
+    return ok
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "migrate"
+    if command == "migrate":
+        Base.metadata.create_all(default_engine)
+        run_migrations()
+        status()
+    elif command == "status":
+        status()
+    elif command == "check":
+        sys.exit(0 if check_query_plans() else 1)
+    else:
+        print("Usage: python migrations.py [migrate|status|check]")
+        sys.exit(2)
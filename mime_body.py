@@ -0,0 +1,124 @@
+# mime_body.py
+import os
+import re
+import base64
+import codecs
+from html.parser import HTMLParser
+
+# How much body text we keep per email. Classification only reads the first
+# 1000 chars (llm_processor.MAX_BODY_LENGTH) and Q&A the first 2000, so
+# anything past this is never used.
+MAX_TEXT_CHARS = int(os.getenv("EMAIL_BODY_MAX_CHARS", "4000"))
+
+# Encoded chars decoded per step (multiple of 4 so base64 chunks stay aligned)
+CHUNK_SIZE = 64 * 1024
+
+# Tags that should start a new line when converting HTML to text
+BLOCK_TAGS = {'p', 'br', 'div', 'tr', 'li', 'table', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'blockquote'}
+
+_CHARSET_RE = re.compile(r'charset="?([\w.:-]+)"?', re.IGNORECASE)
+_SPACES_RE = re.compile(r'[ \t\r\f\v]+')
+_BLANK_LINES_RE = re.compile(r'\n\s*\n+')
+
+def _charset(part):
+    for header in part.get('headers', []):
+        if header['name'].lower() == 'content-type':
+            match = _CHARSET_RE.search(header['value'])
+            if match:
+                return match.group(1)
+    return 'utf-8'
+
+def _iter_parts(part):
+    yield part
+    for child in part.get('parts', []):
+        yield from _iter_parts(child)
+
+def _is_attachment(part):
+    return bool(part.get('filename')) or 'attachmentId' in part.get('body', {})
+
+def _iter_text(data, charset):
+    """
+    Decodes Gmail's base64url part data chunk by chunk, so callers can stop
+    early without decoding (or holding) the whole part.
+    """
+    try:
+        decoder = codecs.getincrementaldecoder(charset)(errors='ignore')
+    except LookupError:
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+
+    for start in range(0, len(data), CHUNK_SIZE):
+        chunk = data[start:start + CHUNK_SIZE]
+        chunk += '=' * (-len(chunk) % 4)
+        yield decoder.decode(base64.urlsafe_b64decode(chunk))
+    yield decoder.decode(b'', final=True)
+
+def _plain_text(data, charset, limit):
+    text = ""
+    for piece in _iter_text(data, charset):
+        text += piece
+        if len(text) >= limit:
+            break
+    return text[:limit]
+
+class _HTMLTextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.pieces = []
+        self.length = 0
+        self._skip = 0 # Inside <script>/<style>
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ('script', 'style'):
+            self._skip += 1
+        elif tag in BLOCK_TAGS:
+            self.pieces.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in ('script', 'style') and self._skip:
+            self._skip -= 1
+        elif tag in BLOCK_TAGS:
+            self.pieces.append('\n')
+
+    def handle_data(self, data):
+        if self._skip:
+            return
+        data = _SPACES_RE.sub(' ', data)
+        if data.strip():
+            self.pieces.append(data)
+            self.length += len(data)
+
+def _html_text(data, charset, limit):
+    parser = _HTMLTextExtractor()
+    for piece in _iter_text(data, charset):
+        parser.feed(piece)
+        if parser.length >= limit:
+            break
+    text = _BLANK_LINES_RE.sub('\n\n', ''.join(parser.pieces)).strip()
+    return text[:limit]
+
+def extract_body(payload, limit=MAX_TEXT_CHARS):
+    """
+    Extracts up to `limit` chars of body text from a Gmail format='full' payload.
+
+    Prefers the first non-blank text/plain part and falls back to converting
+    the first text/html part (some senders add an empty plain part). Attachments are skipped without being decoded (Gmail only
+    sends an attachmentId for them anyway).
+    """
+    html_part = None
+    for part in _iter_parts(payload):
+        if _is_attachment(part):
+            continue
+        mime_type = part.get('mimeType', '')
+        data = part.get('body', {}).get('data')
+        if not data:
+            continue
+        if mime_type == 'text/plain':
+            text = _plain_text(data, _charset(part), limit)
+            if text.strip():
+                return text
+        if mime_type == 'text/html' and html_part is None:
+            html_part = part
+
+    if html_part is not None:
+        return _html_text(html_part['body']['data'], _charset(html_part), limit)
+    return ""
@@ -0,0 +1,173 @@
+# processed_ids.py
+import os
+import threading
+from collections import OrderedDict
+from models import SessionLocal, ProcessedEmail
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+# Dedupe for Gmail message IDs. A process-local LRU set of IDs known to be
+# in processed_emails sits in front of the table, so repeat polls don't
+# touch the DB for IDs already seen; misses are checked with one IN query
+# and new IDs are claimed with one bulk INSERT ... ON CONFLICT DO NOTHING.
+#
+# The memory layer only ever holds IDs that are in the table. clear_cache.py
+# deletes rows from another process, so it also touches RESET_FILE; every
+# lookup compares its mtime (a stat, not a query) and drops the memory
+# layer when it changed.
+PROCESSED_IDS_MEMORY_ITEMS = int(os.getenv("PROCESSED_IDS_MEMORY_ITEMS", "10000"))
+# Relative paths are resolved against this directory, so every process
+# (server, poller, clear_cache.py) agrees on the file whatever its cwd
+RESET_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    os.getenv("PROCESSED_IDS_RESET_FILE", ".processed_ids_reset")
+)
+
+_seen = OrderedDict() # msg_id -> None, oldest first
+_lock = threading.Lock()
+_warm = False
+_reset_mtime = None
+_stats = {"memory_hits": 0, "db_checked": 0, "claimed": 0}
+
+def _reset_marker():
+    try:
+        return os.path.getmtime(RESET_FILE)
+    except OSError:
+        return None
+
+def _remember(msg_ids):
+    # Caller holds _lock
+    for msg_id in msg_ids:
+        _seen[msg_id] = None
+        _seen.move_to_end(msg_id)
+    while len(_seen) > PROCESSED_IDS_MEMORY_ITEMS:
+        _seen.popitem(last=False)
+
+def _ensure_fresh():
+    """
+    Drops the memory layer after a reset and (re)warms it from the most
+    recently processed rows. Caller holds _lock.
+    """
+    global _warm, _reset_mtime
+    marker = _reset_marker()
+    if _warm and marker == _reset_mtime:
+        return
+    _seen.clear()
+    _reset_mtime = marker
+
+    session = SessionLocal()
+    try:
+        rows = (
+            session.query(ProcessedEmail.id)
+            .order_by(ProcessedEmail.processed_at.desc())
+            .limit(PROCESSED_IDS_MEMORY_ITEMS)
+            .all()
+        )
+        _remember(row[0] for row in reversed(rows)) # Most recent ends up freshest
+        _warm = True
+    except Exception as e:
+        print(f"⚠️ Could not warm processed-ID cache: {e}")
+    finally:
+        session.close()
+
+def _split_known(msg_ids):
+    """Returns (IDs the memory layer has seen, IDs it hasn't), keeping order."""
+    with _lock:
+        _ensure_fresh()
+        known = [msg_id for msg_id in msg_ids if msg_id in _seen]
+        for msg_id in known:
+            _seen.move_to_end(msg_id)
+        _stats["memory_hits"] += len(known)
+    known_set = set(known)
+    return known_set, [msg_id for msg_id in msg_ids if msg_id not in known_set]
+
+def filter_new(msg_ids):
+    """
+    Returns the IDs from msg_ids that have not been processed, in order.
+    """
+    msg_ids = list(dict.fromkeys(msg_ids))
+    _, unknown = _split_known(msg_ids)
+    if not unknown:
+        return []
+
+    session = SessionLocal()
+    try:
+        rows = session.query(ProcessedEmail.id).filter(ProcessedEmail.id.in_(unknown)).all()
+    finally:
+        session.close()
+    found = {row[0] for row in rows}
+
+    with _lock:
+        _stats["db_checked"] += len(unknown)
+        _remember(found)
+    return [msg_id for msg_id in unknown if msg_id not in found]
+
+def claim(msg_ids):
+    """
+    Marks msg_ids as processed and returns the ones that weren't already,
+    in order. Unknown IDs are inserted with one statement; rows that were
+    already there are skipped by the database, not an error. A DB error
+    is raised: returning [] would read as "all seen" and the caller would
+    move on past emails nobody handled.
+    """
+    msg_ids = list(dict.fromkeys(msg_ids))
+    _, unknown = _split_known(msg_ids)
+    if not unknown:
+        return []
+
+    session = SessionLocal()
+    try:
+        dialect = session.get_bind().dialect.name
+        if dialect in ("postgresql", "sqlite"):
+            insert_fn = postgresql_insert if dialect == "postgresql" else sqlite_insert
+            stmt = (
+                insert_fn(ProcessedEmail.__table__)
+                .values([{"id": msg_id} for msg_id in unknown])
+                .on_conflict_do_nothing(index_elements=["id"])
+                .returning(ProcessedEmail.id)
+            )
+            inserted = {row[0] for row in session.execute(stmt)}
+        else:
+            existing = {row[0] for row in session.query(ProcessedEmail.id).filter(ProcessedEmail.id.in_(unknown))}
+            inserted = [msg_id for msg_id in unknown if msg_id not in existing]
+            session.add_all(ProcessedEmail(id=msg_id) for msg_id in inserted)
+            inserted = set(inserted)
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        print(f"❌ DB Error claiming processed IDs: {e}")
+        raise
+    finally:
+        session.close()
+
+    with _lock:
+        _stats["db_checked"] += len(unknown)
+        _stats["claimed"] += len(inserted)
+        _remember(unknown)
+    return [msg_id for msg_id in unknown if msg_id in inserted]
+
+def forget(msg_ids):
+    """
+    Drops msg_ids from this process's memory layer, after retention.py
+    pruned their rows. Other processes may keep them until they age out,
+    which only makes their dedupe stricter.
+    """
+    with _lock:
+        for msg_id in msg_ids:
+            _seen.pop(msg_id, None)
+
+def invalidate():
+    """
+    Forgets everything in memory, here and (via RESET_FILE) in other
+    processes. Call after deleting rows from processed_emails.
+    """
+    global _warm
+    with open(RESET_FILE, "w") as f:
+        f.write("processed_emails cleared\n")
+    with _lock:
+        _seen.clear()
+        _warm = False
+
+def stats():
+    with _lock:
+        return {**_stats, "memory_items": len(_seen)}
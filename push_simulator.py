@@ -0,0 +1,35 @@
+import sys
+import json
+import base64
+import requests
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+
+# Local stand-in for Google Pub/Sub: POSTs a fake Gmail watch notification
+# to the running webhook server (python run.py).
+WEBHOOK_URL = os.getenv("GMAIL_PUSH_URL", "http://localhost:5000/gmail/push")
+
+def send_fake_notification(email_address, history_id):
+    data = json.dumps({"emailAddress": email_address, "historyId": history_id})
+    envelope = {
+        "message": {
+            "data": base64.b64encode(data.encode()).decode(),
+            "messageId": "local-test",
+        },
+        "subscription": "projects/local/subscriptions/gmail-push"
+    }
+
+    push_token = os.getenv("GMAIL_PUSH_TOKEN")
+    if not push_token:
+        sys.exit("❌ Set GMAIL_PUSH_TOKEN (the server rejects pushes without it).")
+
+    res = requests.post(WEBHOOK_URL, json=envelope, params={"token": push_token}, timeout=10)
+    print(f"📨 Sent notification (historyId {history_id}) -> {res.status_code} {res.text}")
+
+if __name__ == "__main__":
+    # Usage: python push_simulator.py [emailAddress] [historyId]
+    address = sys.argv[1] if len(sys.argv) > 1 else os.getenv("GMAIL_ADDRESS", "me@example.com")
+    history = int(sys.argv[2]) if len(sys.argv) > 2 else 2**62 # Larger than any real cursor, so it always syncs
+    send_fake_notification(address, history)
@@ -1,6 +1,11 @@
-from llm_processor import call_llm
+from llm_processor import call_llm, stream_llm, StreamInterrupted
+from email_preprocess import prepare_for_prompt
 
-def generate_reply(email_text, instruction="Reply professionally"):
+# Drafting needs more of the email than classification, but not quoted history or footers
+DRAFT_TOKEN_BUDGET = 800
+
+def _reply_messages(email_text, instruction):
+    email_text = prepare_for_prompt(email_text, DRAFT_TOKEN_BUDGET, "draft")
     prompt = f"""
 You are an assistant that helps generate polite email replies.
 
@@ -12,11 +17,14 @@ User Instruction: "{instruction}"
 Write a professional email reply based on the user's instruction. Do not include placeholders like "[Your Name]". just the body.
 """
 
-    messages = [
+    return [
         {"role": "system", "content": "You generate polite and effective email replies."},
         {"role": "user", "content": prompt}
     ]
 
+def generate_reply(email_text, instruction="Reply professionally"):
+    messages = _reply_messages(email_text, instruction)
+
     try:
         reply = call_llm(messages)
         if reply:
@@ -24,3 +32,15 @@ Write a professional email reply based on the user's instruction. Do not include
         return "❌ Error: LLM returned empty reply."
     except Exception as e:
         return f"❌ Error generating reply: {e}"
+
+def stream_reply(email_text, instruction="Reply professionally"):
+    """
+    Like generate_reply, but yields the draft piece by piece as it is generated.
+    Raises StreamInterrupted if the provider fails partway through.
+    """
+    try:
+        yield from stream_llm(_reply_messages(email_text, instruction))
+    except StreamInterrupted:
+        raise
+    except Exception as e:
+        print(f"❌ Error streaming reply: {e}")
@@ -0,0 +1,249 @@
+# retention.py
+import os
+import sys
+import json
+import time
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import select, insert, func
+from models import SessionLocal, User, Email, EmailBody, EmailArchive, ProcessedEmail, SyncState
+from email_bodies import compress, decompress
+from gmail_fetcher import SYNC_LIST_SIZE
+import processed_ids
+
+# Scheduled cleanup for the two tables that grow with every poll.
+#
+# processed_emails: an ID only matters while its message can still come back
+# from Gmail, and the cutoff is derived from the two ways it can:
+# - Incremental syncs replay history since the stored cursor. Anything they
+#   can return was processed after that cursor was saved, so rows newer
+#   than the oldest sync_state.updated_at are always kept (a cursor held
+#   back by failed polls holds retention back with it).
+# - Full resyncs and the legacy "full" mode list the newest SYNC_LIST_SIZE
+#   messages, however old. The newest PROCESSED_IDS_KEEP_LATEST rows (never
+#   fewer than SYNC_LIST_SIZE) are kept; the default 500 leaves room for
+#   newer messages having been deleted or archived out of the inbox.
+# Rows are pruned once they are outside both windows and also older than
+# PROCESSED_IDS_RETENTION_DAYS.
+#
+# emails: rows older than EMAIL_RETENTION_DAYS that are no longer on a chat
+# menu (menu_index is cleared when a newer email takes the slot) and aren't
+# anyone's active email are archived, then deleted with their body.
+# EMAIL_ARCHIVE picks where they go: "table" (emails_archive, one compressed
+# JSON document per email), "jsonl" (monthly files in EMAIL_ARCHIVE_DIR) or
+# "delete" (not kept). Any other value stops the email job without touching
+# anything, so a typo never deletes emails unarchived.
+#
+# Deletes run RETENTION_CHUNK_SIZE rows per transaction with a short pause in
+# between, so webhook writes never wait long behind the job.
+#
+# Usage: python retention.py [run|dry-run]
+RETENTION_ENABLED = os.getenv("RETENTION_ENABLED", "true").lower() == "true"
+PROCESSED_IDS_RETENTION_DAYS = int(os.getenv("PROCESSED_IDS_RETENTION_DAYS", "30"))
+PROCESSED_IDS_KEEP_LATEST = int(os.getenv("PROCESSED_IDS_KEEP_LATEST", "500"))
+EMAIL_RETENTION_DAYS = int(os.getenv("EMAIL_RETENTION_DAYS", "90"))
+EMAIL_ARCHIVE = os.getenv("EMAIL_ARCHIVE", "table")
+EMAIL_ARCHIVE_MODES = ("table", "jsonl", "delete")
+EMAIL_ARCHIVE_DIR = os.getenv("EMAIL_ARCHIVE_DIR", "archive")
+RETENTION_CHUNK_SIZE = int(os.getenv("RETENTION_CHUNK_SIZE", "500"))
+RETENTION_CHUNK_PAUSE = float(os.getenv("RETENTION_CHUNK_PAUSE", "0.05")) # seconds between chunks
+
+_lock = threading.Lock() # One run at a time
+_stats = {
+    "runs": 0, "failed_runs": 0, "processed_ids_pruned": 0, "emails_archived": 0,
+    "last_run": None, "last_seconds": None, "last_errors": None
+}
+
+def processed_ids_cutoff(session, now):
+    """
+    Rows with processed_at before this can go, or None if nothing can
+    (fewer rows than the listing window keeps).
+    """
+    keep_latest = max(PROCESSED_IDS_KEEP_LATEST, SYNC_LIST_SIZE)
+    boundary = (
+        session.query(ProcessedEmail.processed_at)
+        .order_by(ProcessedEmail.processed_at.desc())
+        .offset(keep_latest - 1)
+        .limit(1)
+        .scalar()
+    )
+    if boundary is None:
+        return None
+    cutoff = min(now - timedelta(days=PROCESSED_IDS_RETENTION_DAYS), boundary)
+    oldest_cursor = session.query(func.min(SyncState.updated_at)).scalar()
+    return min(cutoff, oldest_cursor) if oldest_cursor else cutoff
+
+def _expired_processed_ids(session, cutoff):
+    return session.query(ProcessedEmail.id).filter(ProcessedEmail.processed_at < cutoff)
+
+def _expired_emails(session, cutoff):
+    active = select(User.current_active_email_id).where(User.current_active_email_id.isnot(None))
+    return session.query(Email).filter(
+        Email.created_at < cutoff,
+        Email.menu_index.is_(None),
+        Email.id.notin_(active)
+    )
+
+def prune_processed_ids(now=None, dry_run=False):
+    """
+    Deletes processed IDs outside the retention window. Returns (how many,
+    error message or None); on an error the chunks already deleted stay deleted.
+    """
+    now = now or datetime.utcnow()
+    session = SessionLocal()
+    try:
+        cutoff = processed_ids_cutoff(session, now)
+        if cutoff is None:
+            return 0, None
+        if dry_run:
+            return _expired_processed_ids(session, cutoff).count(), None
+    finally:
+        session.close()
+
+    pruned = 0
+    while True:
+        session = SessionLocal()
+        try:
+            ids = [row[0] for row in _expired_processed_ids(session, cutoff).limit(RETENTION_CHUNK_SIZE)]
+            if ids:
+                session.query(ProcessedEmail).filter(ProcessedEmail.id.in_(ids)).delete(synchronize_session=False)
+                session.commit()
+        except Exception as e:
+            session.rollback()
+            print(f"❌ DB Error pruning processed IDs: {e}")
+            return pruned, f"pruning processed IDs: {e}"
+        finally:
+            session.close()
+
+        processed_ids.forget(ids)
+        pruned += len(ids)
+        if len(ids) < RETENTION_CHUNK_SIZE:
+            return pruned, None
+        time.sleep(RETENTION_CHUNK_PAUSE)
+
+def _archive_document(email, body):
+    doc = {}
+    for column in Email.__table__.columns:
+        if column.key == "original_body":
+            continue
+        value = getattr(email, column.key)
+        doc[column.key] = value.isoformat() if isinstance(value, datetime) else value
+    doc["body"] = body
+    return doc
+
+def _write_jsonl(docs, now):
+    os.makedirs(EMAIL_ARCHIVE_DIR, exist_ok=True)
+    path = os.path.join(EMAIL_ARCHIVE_DIR, f"emails-{now:%Y-%m}.jsonl")
+    with open(path, "a", encoding="utf-8") as f:
+        for doc in docs:
+            f.write(json.dumps(doc, ensure_ascii=False) + "\n")
+
+def archive_old_emails(now=None, dry_run=False):
+    """
+    Moves emails past retention to the configured archive and deletes them
+    (and their bodies). Returns (how many were archived, error message or None).
+    """
+    if EMAIL_ARCHIVE not in EMAIL_ARCHIVE_MODES:
+        print(f"❌ Unknown EMAIL_ARCHIVE '{EMAIL_ARCHIVE}' (expected one of {', '.join(EMAIL_ARCHIVE_MODES)}); not archiving emails.")
+        return 0, f"unknown EMAIL_ARCHIVE '{EMAIL_ARCHIVE}'"
+
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(days=EMAIL_RETENTION_DAYS)
+    if dry_run:
+        session = SessionLocal()
+        try:
+            return _expired_emails(session, cutoff).count(), None
+        finally:
+            session.close()
+
+    archived = 0
+    while True:
+        session = SessionLocal()
+        try:
+            emails = _expired_emails(session, cutoff).limit(RETENTION_CHUNK_SIZE).all()
+            ids = [email.id for email in emails]
+            if ids:
+                bodies = {
+                    row.email_id: decompress(row.encoding, row.body)
+                    for row in session.query(EmailBody).filter(EmailBody.email_id.in_(ids))
+                }
+                legacy = dict(session.query(Email.id, Email.original_body).filter(Email.id.in_(ids), Email.original_body.isnot(None)))
+                docs = [_archive_document(email, bodies.get(email.id, legacy.get(email.id, ""))) for email in emails]
+
+                if EMAIL_ARCHIVE == "table":
+                    session.query(EmailArchive).filter(EmailArchive.id.in_(ids)).delete(synchronize_session=False)
+                    rows = []
+                    for email, doc in zip(emails, docs):
+                        encoding, data, _ = compress(json.dumps(doc, ensure_ascii=False))
+                        rows.append({
+                            "id": email.id, "user_phone": email.user_phone, "created_at": email.created_at,
+                            "archived_at": now, "encoding": encoding, "data": data
+                        })
+                    session.execute(insert(EmailArchive), rows)
+                elif EMAIL_ARCHIVE == "jsonl":
+                    _write_jsonl(docs, now) # Before the delete: a failed commit re-archives, never loses
+                elif EMAIL_ARCHIVE != "delete":
+                    raise ValueError(f"unknown EMAIL_ARCHIVE '{EMAIL_ARCHIVE}'")
+
+                session.query(EmailBody).filter(EmailBody.email_id.in_(ids)).delete(synchronize_session=False)
+                session.query(Email).filter(Email.id.in_(ids)).delete(synchronize_session=False)
+                session.commit()
+        except Exception as e:
+            session.rollback()
+            print(f"❌ DB Error archiving emails: {e}")
+            return archived, f"archiving emails: {e}"
+        finally:
+            session.close()
+
+        archived += len(ids)
+        if len(ids) < RETENTION_CHUNK_SIZE:
+            return archived, None
+        time.sleep(RETENTION_CHUNK_PAUSE)
+
+def load_archived_email(email_id):
+    """Returns an archived email (from the emails_archive table) as a dict, or None."""
+    session = SessionLocal()
+    try:
+        row = session.get(EmailArchive, email_id)
+        return json.loads(decompress(row.encoding, row.data)) if row else None
+    finally:
+        session.close()
+
+def run_retention(dry_run=False):
+    """
+    Runs both jobs. Scheduled daily by scheduler.py. Returns False if either
+    stopped on an error (the other still runs), True otherwise.
+    """
+    if not RETENTION_ENABLED and not dry_run:
+        return True
+    with _lock:
+        started = time.perf_counter()
+        print(f"🧹 Retention{' (dry run)' if dry_run else ''}: processed IDs > {PROCESSED_IDS_RETENTION_DAYS}d, emails > {EMAIL_RETENTION_DAYS}d -> {EMAIL_ARCHIVE}")
+        pruned, prune_error = prune_processed_ids(dry_run=dry_run)
+        archived, archive_error = archive_old_emails(dry_run=dry_run)
+        errors = [error for error in (prune_error, archive_error) if error]
+        elapsed = time.perf_counter() - started
+        verb = "Would remove" if dry_run else "Removed"
+        if errors:
+            print(f"❌ Retention failed after {elapsed:.1f}s ({verb.lower()} {pruned} processed ID(s) and {archived} email(s) first): {'; '.join(errors)}")
+        else:
+            print(f"✅ {verb} {pruned} processed ID(s) and {archived} email(s) in {elapsed:.1f}s")
+        if not dry_run:
+            _stats["runs"] += 1
+            _stats["failed_runs"] += bool(errors)
+            _stats["processed_ids_pruned"] += pruned
+            _stats["emails_archived"] += archived
+            _stats["last_run"] = datetime.utcnow().isoformat()
+            _stats["last_seconds"] = round(elapsed, 2)
+            _stats["last_errors"] = errors or None
+        return not errors
+
+def stats():
+    return dict(_stats)
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "run"
+    if command not in ("run", "dry-run"):
+        print("Usage: python retention.py [run|dry-run]")
+        sys.exit(2)
+    sys.exit(0 if run_retention(dry_run=command == "dry-run") else 1)
@@ -1,13 +1,19 @@
 from webhook_handler import app
 from models import init_db
 from scheduler import start_scheduler
+from gmail_client import warm_up as warm_up_gmail
+from llm_clients import warm_up as warm_up_llm
+from llm_processor import LLM_PROVIDER
 import threading
-import time
 
 def start_background_services():
     # 1. Init DB
     init_db()
     
+    # 1b. Load Gmail credentials + discovery doc before the first webhook needs them
+    warm_up_gmail()
+    warm_up_llm(LLM_PROVIDER)
+    
     # 2. Start Scheduler
     # We run this in a daemon thread so it dies when the main app dies
     t = threading.Thread(target=start_scheduler, daemon=True)
@@ -1,79 +1,81 @@
 import time
 import schedule
 import threading
+import os
 from datetime import datetime, timedelta
-from dateutil import parser
-from context_store import load_context, save_context
-from whatsapp_bot import send_whatsapp_message
+from context_store import load_due_reminders, mark_reminders_sent
+from deadline_parser import format_deadline
+from whatsapp_bot import send_raw_message
 from email_service import process_new_emails # Import the new polling function
+from gmail_fetcher import GMAIL_PUBSUB_TOPIC, start_watch
+from retention import RETENTION_ENABLED, run_retention
+
+# Incremental sync makes empty polls cheap (usually one history().list call).
+# With Gmail push enabled, polling is only a slow safety net. The webhook
+# rejects pushes unless GMAIL_PUSH_TOKEN is set, so push needs both.
+PUSH_ENABLED = bool(GMAIL_PUBSUB_TOPIC and os.getenv("GMAIL_PUSH_TOKEN"))
+EMAIL_POLL_MINUTES = int(os.getenv("EMAIL_POLL_MINUTES", "30" if PUSH_ENABLED else "5"))
+
+def renew_watch():
+    try:
+        start_watch()
+    except Exception as e:
+        print(f"❌ Gmail watch renewal failed: {e}")
 
 def check_deadlines():
     print("⏰ Checking deadlines...")
-    context = load_context()
     
-    now = datetime.now()
+    now = datetime.utcnow() # Deadlines are stored in UTC (see deadline_parser)
     notification_window_hours = 24 # Notify 24 hours before
     
-    updated = False
+    # Only emails due within the window and not yet reminded come back
+    due = load_due_reminders(now, now + timedelta(hours=notification_window_hours))
     
-    if not context: return
-
-    for user_phone, user_data in context.items():
-        if not isinstance(user_data, dict): continue
+    sent = []
+    for reminder in due:
+        print(f"⚠️ Sending Reminder for Email {reminder['index']}")
         
-        for email_idx, email_data in user_data.items():
-            if email_idx in ['current_active_index', 'pending_draft']: continue
-            if not isinstance(email_data, dict): continue
-
-            deadline_str = email_data.get('deadline')
-            reminder_sent = email_data.get('reminder_sent')
-            
-            # Skip if no deadline or already notified
-            if not deadline_str or reminder_sent:
-                continue
-            
-            try:
-                # Parse ISO format
-                deadline_dt = parser.parse(deadline_str)
-                
-                # Check if we are within the window (e.g. 24 hours before)
-                time_diff = deadline_dt - now
-                
-                # Logic: Notify if within 24 hours AND in the future
-                if timedelta(hours=0) < time_diff <= timedelta(hours=notification_window_hours):
-                    print(f"⚠️ Sending Reminder for Email {email_idx}")
-                    
-                    message = (
-                        f"⏰ *Deadline Reminder*\n"
-                        f"📌 *Title:* {email_data.get('title')}\n"
-                        f"⏳ *Due:* {deadline_str}\n"
-                        f"⚠️ Less than 24 hours remaining!\n"
-                        f"Reply *{email_idx}* to take action."
-                    )
-                    
-                    # send_whatsapp_message wraps send_raw_message
-                    from whatsapp_bot import send_raw_message
-                    send_raw_message(message, user_phone)
-                    
-                    email_data['reminder_sent'] = True # Mark as sent
-                    updated = True
-                    
-            except Exception as e:
-                print(f"Error parsing date for {email_idx}: {e}")
+        message = (
+            f"⏰ *Deadline Reminder*\n"
+            f"📌 *Title:* {reminder['title']}\n"
+            f"⏳ *Due:* {format_deadline(reminder['deadline'])}\n"
+            f"⚠️ Less than 24 hours remaining!\n"
+            f"Reply *{reminder['index']}* to take action."
+        )
+        
+        try:
+            send_raw_message(message, reminder['phone'])
+            sent.append(reminder['id']) # Mark as sent
+        except Exception as e:
+            print(f"Error sending reminder for {reminder['index']}: {e}")
                 
-    if updated:
-        save_context(context)
+    mark_reminders_sent(sent)
 
 def start_scheduler():
     # 1. Schedule Deadline Checks (e.g. every hour)
     schedule.every(1).hours.do(check_deadlines)
     
-    # 2. Schedule Email Polling (e.g. every 5 minutes)
-    schedule.every(5).minutes.do(process_new_emails)
+    # 2. Schedule Email Polling (default every 5 minutes, 30 with push)
+    schedule.every(EMAIL_POLL_MINUTES).minutes.do(process_new_emails)
+    
+    # 3. Keep the Gmail push watch alive (it expires after 7 days)
+    if GMAIL_PUBSUB_TOPIC and not PUSH_ENABLED:
+        print(f"⚠️ GMAIL_PUBSUB_TOPIC is set but GMAIL_PUSH_TOKEN isn't; pushes will be rejected, polling every {EMAIL_POLL_MINUTES}m instead.")
+    elif GMAIL_PUBSUB_TOPIC:
+        renew_watch()
+        schedule.every(1).days.do(renew_watch)
+    
+    # 4. Prune processed IDs and archive old emails (chunked, off-peak friendly)
+    if RETENTION_ENABLED:
+        schedule.every(1).days.do(run_retention)
     
     print("✅ Scheduler Jobs Registered:")
     print("   - Deadline Check (1h)")
-    print("   - Email Poll (5m)")
+    print(f"   - Email Poll ({EMAIL_POLL_MINUTES}m)")
+    if PUSH_ENABLED:
+        print("   - Gmail Watch Renewal (1d)")
+    if RETENTION_ENABLED:
+        print("   - Retention (1d)")
     
     # Run immediately for testing startup
     # threading.Thread(target=process_new_emails).start()
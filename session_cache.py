@@ -0,0 +1,165 @@
+# session_cache.py
+import os
+import time
+import threading
+from collections import OrderedDict
+
+# Per-user cache of context dicts in front of load_user_context, so the
+# webhook turns of one conversation (select, ask, draft, send) read the DB
+# once instead of every turn. Saves are write-through: context_store writes
+# the DB first, then refreshes the entry.
+#
+# Consistency across Flask threads:
+# - Callers get copies, never the cached dict itself.
+# - Every phone has a generation number, bumped by each save and
+#   invalidation. A DB read only fills the cache if the generation didn't
+#   move while it ran, and a save only refreshes the entry if the context
+#   was loaded at the current generation (i.e. no other save in between);
+#   otherwise the entry is dropped and the next turn reads the DB.
+# - Saves for the same phone are serialized by save_lock(phone).
+#
+# Other processes (instant_poll.py, main.py) write the DB directly, so the
+# poller also touches RESET_FILE after changing a menu; every lookup
+# compares its mtime and, when it changed, drops the whole cache and moves
+# every phone to a new generation.
+SESSION_CACHE_ENABLED = os.getenv("SESSION_CACHE_ENABLED", "true").lower() == "true"
+SESSION_CACHE_TTL_SECONDS = int(os.getenv("SESSION_CACHE_TTL_SECONDS", "300"))
+SESSION_CACHE_MAX_USERS = int(os.getenv("SESSION_CACHE_MAX_USERS", "1000"))
+# Relative to this module, so processes started from another directory share it
+RESET_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    os.getenv("SESSION_CACHE_RESET_FILE", ".session_cache_reset")
+)
+
+SAVE_LOCK_STRIPES = 64
+
+_entries = OrderedDict() # phone -> (data, exists, generation, expires_at), oldest first
+_generations = {} # phone -> generation, for phones written since the last reset
+_counter = 0
+_base = 0 # Generation of every phone not in _generations; raised by each reset
+_lock = threading.Lock()
+_save_locks = [threading.Lock() for _ in range(SAVE_LOCK_STRIPES)]
+_reset_mtime = None
+_stats = {"hits": 0, "misses": 0, "expired": 0, "writes": 0, "stale_drops": 0, "invalidations": 0, "evictions": 0}
+
+def _reset_marker():
+    try:
+        return os.path.getmtime(RESET_FILE)
+    except OSError:
+        return None
+
+def _copy(data):
+    # Email dicts are copied too (callers edit them); bodies are loaded on demand, not cached
+    return {
+        k: {f: x for f, x in v.items() if f != "original_body"} if isinstance(v, dict) else v
+        for k, v in data.items()
+    }
+
+def _bump(phone):
+    # Caller holds _lock
+    global _counter
+    _counter += 1
+    _generations[phone] = _counter
+    return _counter
+
+def _check_reset():
+    # Caller holds _lock
+    global _reset_mtime, _counter, _base
+    marker = _reset_marker()
+    if marker != _reset_mtime:
+        _reset_mtime = marker
+        _entries.clear()
+        # Moves every phone, including ones whose first read is still running
+        _generations.clear()
+        _counter += 1
+        _base = _counter
+
+def generation(phone):
+    """Current generation for phone; record it before reading the DB."""
+    with _lock:
+        _check_reset()
+        return _generations.get(phone, _base)
+
+def get(phone):
+    """Returns (data copy, exists, generation) or None on a miss."""
+    if not SESSION_CACHE_ENABLED:
+        return None
+    with _lock:
+        _check_reset()
+        entry = _entries.get(phone)
+        if entry is None:
+            _stats["misses"] += 1
+            return None
+        data, exists, gen, expires_at = entry
+        if expires_at <= time.monotonic():
+            del _entries[phone]
+            _stats["expired"] += 1
+            _stats["misses"] += 1
+            return None
+        _entries.move_to_end(phone)
+        _stats["hits"] += 1
+        return _copy(data), exists, gen
+
+def _store(phone, data, exists, gen):
+    # Caller holds _lock
+    _entries[phone] = (_copy(data), exists, gen, time.monotonic() + SESSION_CACHE_TTL_SECONDS)
+    _entries.move_to_end(phone)
+    while len(_entries) > SESSION_CACHE_MAX_USERS:
+        _entries.popitem(last=False)
+        _stats["evictions"] += 1
+
+def put(phone, data, exists, gen):
+    """Caches a DB read, unless phone was saved or invalidated since gen was taken."""
+    if not SESSION_CACHE_ENABLED:
+        return
+    with _lock:
+        _check_reset()
+        if _generations.get(phone, _base) == gen:
+            _store(phone, data, exists, gen)
+
+def save_lock(phone):
+    return _save_locks[hash(phone) % SAVE_LOCK_STRIPES]
+
+def saved(phone, data, loaded_gen):
+    """
+    Write-through after a committed save (call under save_lock(phone)).
+    Returns the new generation if data is now the cached state, None if the
+    entry was dropped because another save happened since data was loaded.
+    """
+    with _lock:
+        _check_reset()
+        current = _generations.get(phone, _base)
+        gen = _bump(phone)
+        if not SESSION_CACHE_ENABLED:
+            return gen
+        if loaded_gen is not None and loaded_gen == current:
+            _store(phone, data, True, gen)
+            _stats["writes"] += 1
+            return gen
+        _entries.pop(phone, None)
+        _stats["stale_drops"] += 1
+        return None
+
+def invalidate(phones, other_processes=False):
+    """
+    Drops the cached context for phones (a phone or a list). With
+    other_processes, running servers drop their whole cache too.
+    """
+    global _reset_mtime
+    if isinstance(phones, str):
+        phones = [phones]
+    if other_processes:
+        with open(RESET_FILE, "w") as f:
+            f.write("session cache invalidated\n")
+    with _lock:
+        for phone in phones:
+            _bump(phone)
+            if _entries.pop(phone, None) is not None:
+                _stats["invalidations"] += 1
+        if other_processes:
+            _reset_mtime = _reset_marker() # Already dropped what changed here
+
+def stats():
+    with _lock:
+        lookups = _stats["hits"] + _stats["misses"]
+        return {**_stats, "hit_rate": round(_stats["hits"] / lookups, 3) if lookups else None, "users": len(_entries)}
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Modules live at the repo root and build their DB engine on import
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
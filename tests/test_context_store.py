@@ -0,0 +1,68 @@
+import pytest
+import session_cache
+from context_store import load_user_context, save_user_context, email_body, _changes
+from models import Base, engine, SessionLocal, User, Email, EmailBody
+
+PHONE = "15550000"
+
+@pytest.fixture(autouse=True)
+def fresh(monkeypatch, tmp_path):
+    monkeypatch.setattr(session_cache, "RESET_FILE", str(tmp_path / "reset"))
+    Base.metadata.create_all(engine)
+    session = SessionLocal()
+    for model in (EmailBody, Email, User):
+        session.query(model).delete()
+    session.commit()
+    session.close()
+    session_cache.invalidate(PHONE)
+
+def _email(msg_id, title="Interview"):
+    return {
+        "id": msg_id, "title": title, "subject": f"Subject {msg_id}", "summary": "", "action": "",
+        "deadline": "2025-03-14 11:30:00", "from": "a@example.com", "original_body": f"Body of {msg_id}",
+        "reminder_sent": False
+    }
+
+def _menu():
+    session = SessionLocal()
+    try:
+        return dict(session.query(Email.id, Email.menu_index).filter(Email.user_phone == PHONE))
+    finally:
+        session.close()
+
+def test_round_trip_without_bodies_in_the_context():
+    save_user_context(PHONE, {"1": _email("a"), "current_active_index": "1", "pending_draft": "Hi"})
+    session_cache.invalidate(PHONE) # Read from the DB, not the write-through entry
+
+    ctx = load_user_context(PHONE)
+    assert ctx["current_active_index"] == "1" and ctx["pending_draft"] == "Hi"
+    assert ctx["1"]["title"] == "Interview" and "original_body" not in ctx["1"]
+    assert email_body(ctx["1"]) == "Body of a"
+
+def test_only_changed_columns_are_written():
+    save_user_context(PHONE, {"1": _email("a")})
+    ctx = load_user_context(PHONE)
+    assert _changes(ctx) == ({}, [], [])
+
+    ctx["pending_draft"] = "Dear team"
+    ctx["1"]["title"] = "Interview (moved)"
+    user_changes, email_rows, body_rows = _changes(ctx)
+    assert user_changes == {"pending_draft": "Dear team"}
+    assert email_rows == [{"id": "a", "title": "Interview (moved)"}]
+    assert body_rows == []
+
+    save_user_context(PHONE, ctx)
+    assert _changes(ctx) == ({}, [], []) # Snapshot moved to the saved state
+    session_cache.invalidate(PHONE)
+    assert load_user_context(PHONE)["1"]["title"] == "Interview (moved)"
+
+def test_new_email_takes_over_its_menu_slot():
+    save_user_context(PHONE, {"1": _email("a"), "2": _email("b")})
+    ctx = load_user_context(PHONE)
+    ctx["1"] = _email("c", title="Offer")
+    save_user_context(PHONE, ctx)
+
+    assert _menu() == {"a": None, "b": 2, "c": 1}
+    session_cache.invalidate(PHONE)
+    ctx = load_user_context(PHONE)
+    assert ctx["1"]["id"] == "c" and ctx["2"]["id"] == "b"
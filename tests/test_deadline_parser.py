@@ -0,0 +1,93 @@
+from datetime import datetime, timezone
+import pytest
+import deadline_parser
+from deadline_parser import extract_deadline, parse_deadline, resolve_deadline, format_deadline
+
+# Wednesday 12 March 2025, 10:00 in Kolkata (04:30 UTC)
+WEDNESDAY = datetime(2025, 3, 12, 4, 30, tzinfo=timezone.utc)
+
+@pytest.fixture(autouse=True)
+def kolkata(monkeypatch):
+    monkeypatch.setattr(deadline_parser, "USER_TIMEZONE", "Asia/Kolkata")
+
+@pytest.mark.parametrize("text,expected_local_day", [
+    ("Submit by Friday", 14),
+    ("Submit by this Friday", 14),
+    ("Submit by coming Friday", 14),
+    ("Submit by next Friday", 21),
+    ("Submit by next Monday", 17),
+    ("Submit by Wednesday", 12),
+    ("Submit by coming Wednesday", 19),
+    ("Submit by next Wednesday", 19),
+    ("Submit by tomorrow", 13),
+    ("Submit in 3 days", 15),
+])
+def test_relative_dates(text, expected_local_day):
+    when = extract_deadline(text, WEDNESDAY)
+    local = when.replace(tzinfo=timezone.utc).astimezone(deadline_parser.user_timezone())
+    assert (local.month, local.day) == (3, expected_local_day)
+
+def test_local_time_stored_as_utc():
+    assert extract_deadline("Deadline: 14 March 2025, 5 PM", WEDNESDAY) == datetime(2025, 3, 14, 11, 30)
+
+def test_explicit_zone_wins():
+    assert extract_deadline("Apply by March 14, 2025 at 5pm PST", WEDNESDAY) == datetime(2025, 3, 15, 1, 0)
+
+@pytest.mark.parametrize("text", [
+    "We met in March and you may 3 times apply",
+    "Option 3 may be better for the team",
+])
+def test_modal_may_is_not_a_month(text):
+    assert extract_deadline(text, WEDNESDAY) is None
+
+@pytest.mark.parametrize("text", [
+    "Apply by 3 May",
+    "Apply by May 3rd",
+    "Apply by may 3, 2025",
+    "Apply by May 3 at 11:59 pm",
+])
+def test_may_dates(text):
+    local = extract_deadline(text, WEDNESDAY).replace(tzinfo=timezone.utc).astimezone(deadline_parser.user_timezone())
+    assert (local.month, local.day) == (5, 3)
+
+def test_system_timezone_is_a_named_zone(monkeypatch):
+    monkeypatch.setattr(deadline_parser, "USER_TIMEZONE", None)
+    monkeypatch.setattr(deadline_parser, "_system_zone", None)
+    monkeypatch.setenv("TZ", "Europe/Berlin")
+    zone = deadline_parser.user_timezone()
+    # Follows DST instead of a fixed offset
+    assert datetime(2025, 1, 15, tzinfo=zone).utcoffset() != datetime(2025, 7, 15, tzinfo=zone).utcoffset()
+
+def test_parse_deadline_iso_with_and_without_offset():
+    assert parse_deadline("2025-03-14 17:00:00", WEDNESDAY) == datetime(2025, 3, 14, 11, 30)
+    assert parse_deadline("2025-03-14 11:30:00+00:00", WEDNESDAY) == datetime(2025, 3, 14, 11, 30)
+
+def test_parse_deadline_free_text_fallback():
+    assert parse_deadline("next Friday 5pm", WEDNESDAY) == datetime(2025, 3, 21, 11, 30)
+
+def test_resolve_prefers_local_date_next_to_keyword():
+    text = "The deadline is 20 March 2025."
+    assert resolve_deadline("2025-03-25 00:00:00", text, WEDNESDAY) == "2025-03-20 18:29:00" # End of day, Kolkata
+
+def test_resolve_llm_only_and_none():
+    assert resolve_deadline("2025-03-14 17:00:00", "No dates here.", WEDNESDAY) == "2025-03-14 11:30:00"
+    assert resolve_deadline(None, "No dates here.", WEDNESDAY) is None
+
+def test_format_deadline_in_user_timezone():
+    assert format_deadline("2025-03-14 11:30:00") == "Fri 14 Mar 2025, 17:00"
+
+def test_migration_converts_stored_local_deadlines(monkeypatch):
+    from sqlalchemy import create_engine
+    from sqlalchemy.pool import StaticPool
+    from models import Base, Email
+    import migrations
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(Email.__table__.insert(), [
+            {"id": "a", "user_phone": "1", "deadline": datetime(2025, 3, 14, 17, 0)},
+            {"id": "b", "user_phone": "1", "deadline": None},
+        ])
+        migrations._deadlines_to_utc(conn)
+        rows = dict(conn.execute(Email.__table__.select().with_only_columns(Email.id, Email.deadline)).all())
+    assert rows == {"a": datetime(2025, 3, 14, 11, 30), "b": None}
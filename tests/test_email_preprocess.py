@@ -0,0 +1,71 @@
+from email_preprocess import clean_email_text
+
+BODY = (
+    "Hi Priya,\n\n"
+    "Thanks for applying to the summer analyst programme. We'd like to invite you "
+    "to the next round, a 45 minute video interview with the team.\n\n"
+)
+LEGAL = (
+    "This email and any attachments are confidential and intended solely for the "
+    "addressee. If you received it in error, please delete it.\n\n"
+    "© 2025 Acme Corp. All rights reserved. Unsubscribe | Privacy Policy"
+)
+
+def test_trailing_disclaimer_and_footer_removed():
+    cleaned = clean_email_text(BODY + "Best,\nRecruiting\n\n" + LEGAL)
+    assert "video interview" in cleaned
+    assert "confidential" not in cleaned
+    assert "Unsubscribe" not in cleaned
+
+def test_mid_body_confidential_paragraph_with_deadline_kept():
+    body = (
+        BODY
+        + "Please keep the case study confidential and submit your answers by March 14.\n\n"
+        + "Best,\nRecruiting\n\n"
+        + LEGAL
+    )
+    cleaned = clean_email_text(body)
+    assert "submit your answers by March 14" in cleaned
+    assert "All rights reserved" not in cleaned
+
+def test_mid_body_disclaimer_paragraph_kept():
+    body = (
+        "Your offer letter is attached. It is confidential, so please don't forward it.\n\n"
+        + BODY
+        + "Best,\nRecruiting"
+    )
+    assert "offer letter is attached" in clean_email_text(body)
+
+def test_about_heading_with_deadline_not_cut():
+    body = (
+        BODY * 2
+        + "About the role\n"
+        + "Applications close on 30 June 2025 at 5pm IST. "
+        + "Questions? Email us; we treat every application as confidential."
+    )
+    cleaned = clean_email_text(body)
+    assert "Applications close on 30 June 2025" in cleaned
+
+def test_trailing_footer_with_deadline_kept():
+    body = BODY * 2 + "You are receiving this because you applied. Register for the info session by Friday 5pm. Unsubscribe"
+    assert "info session by Friday 5pm" in clean_email_text(body)
+
+def test_message_that_is_only_a_disclaimer_is_kept():
+    text = "This message is confidential."
+    assert clean_email_text(text) == text
+
+def test_mid_body_separator_is_not_a_signature():
+    ticket = (
+        "Ticket #4821 updated\n--\n"
+        + "".join(f"Step {n}: see the attached checklist for this part of the onboarding.\n" for n in range(1, 12))
+        + "Please submit the completed forms by 14 March 2025.\n\n"
+        "Thanks,\nPeople Team\n--\nAcme Corp, 1 Main St"
+    )
+    cleaned = clean_email_text(ticket)
+    assert "submit the completed forms by 14 March 2025" in cleaned
+    assert "Acme Corp, 1 Main St" not in cleaned
+
+def test_trailing_signature_removed():
+    cleaned = clean_email_text(BODY + "--\nPriya Shah\nRecruiter, Acme")
+    assert "video interview" in cleaned
+    assert "Recruiter" not in cleaned
@@ -0,0 +1,173 @@
+import base64
+import pytest
+from httplib2 import Response
+from googleapiclient.errors import HttpError
+import gmail_fetcher
+import processed_ids
+from gmail_fetcher import _take_oldest, sync_emails
+from context_store import load_history_id, save_history_id
+from models import Base, engine, SessionLocal, ProcessedEmail, SyncState
+
+def _http_error(status):
+    return HttpError(Response({"status": status}), b"error")
+
+class _Request:
+    def __init__(self, result):
+        self.result = result
+
+    def execute(self):
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+class _Batch:
+    def __init__(self, callback):
+        self.callback, self.requests = callback, []
+
+    def add(self, request, request_id):
+        self.requests.append((request_id, request))
+
+    def execute(self):
+        for request_id, request in self.requests:
+            try:
+                self.callback(request_id, request.execute(), None)
+            except HttpError as e:
+                self.callback(request_id, None, e)
+
+class FakeService:
+    """The slice of the Gmail API that sync_emails uses."""
+
+    def __init__(self, history=None, inbox=(), profile_history_id="900"):
+        self.history_result = history # dict, or an exception to raise
+        self.inbox = list(inbox)
+        self.profile_history_id = profile_history_id
+        self.broken = set() # IDs whose get fails with a 500
+
+    def users(self):
+        return self
+
+    def history(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def list(self, **kwargs):
+        if "startHistoryId" in kwargs:
+            return _Request(self.history_result)
+        return _Request({"messages": [{"id": i, "threadId": f"t-{i}"} for i in self.inbox]})
+
+    def get(self, userId, id, **params):
+        if id in self.broken:
+            return _Request(_http_error(500))
+        body = base64.urlsafe_b64encode(f"Body of {id}".encode()).decode()
+        return _Request({
+            "id": id, "threadId": f"t-{id}", "labelIds": ["INBOX"], "internalDate": "1741750000000",
+            "payload": {
+                "mimeType": "text/plain", "body": {"data": body},
+                "headers": [{"name": "Subject", "value": f"Subject {id}"}, {"name": "From", "value": "a@example.com"}]
+            }
+        })
+
+    def getProfile(self, userId):
+        return _Request({"historyId": self.profile_history_id})
+
+    def new_batch_http_request(self, callback):
+        return _Batch(callback)
+
+def _history(*records, latest="500"):
+    return {
+        "historyId": latest,
+        "history": [
+            {"id": record_id, "messagesAdded": [{"message": {"id": msg_id, "threadId": f"t-{msg_id}"}} for msg_id in ids]}
+            for record_id, ids in records
+        ]
+    }
+
+@pytest.fixture(autouse=True)
+def fresh(monkeypatch, tmp_path):
+    monkeypatch.setattr(processed_ids, "RESET_FILE", str(tmp_path / "reset"))
+    monkeypatch.setattr(gmail_fetcher, "GMAIL_FETCH_MODE", "batch")
+    Base.metadata.create_all(engine)
+    session = SessionLocal()
+    session.query(ProcessedEmail).delete()
+    session.query(SyncState).delete()
+    session.commit()
+    session.close()
+    processed_ids.invalidate()
+
+@pytest.fixture
+def service(monkeypatch):
+    fake = FakeService()
+    monkeypatch.setattr(gmail_fetcher, "get_service", lambda: fake)
+    return fake
+
+def _msg(msg_id):
+    return {"id": msg_id}
+
+def test_take_oldest_takes_everything_that_fits():
+    added = [("1", _msg("a")), ("2", _msg("b"))]
+    assert _take_oldest(added, 3, "9") == ([_msg("b"), _msg("a")], "9")
+
+def test_take_oldest_stops_the_cursor_after_the_oldest_n():
+    added = [("1", _msg("a")), ("2", _msg("b")), ("3", _msg("c")), ("4", _msg("d"))]
+    assert _take_oldest(added, 3, "9") == ([_msg("c"), _msg("b"), _msg("a")], "3")
+
+def test_take_oldest_never_splits_a_history_record():
+    added = [("1", _msg("a")), ("2", _msg("b")), ("3", _msg("c")), ("3", _msg("d"))]
+    assert _take_oldest(added, 3, "9") == ([_msg("b"), _msg("a")], "2")
+
+def test_take_oldest_takes_an_oversized_first_record_whole():
+    added = [("5", _msg(x)) for x in "abcd"] + [("6", _msg("e"))]
+    messages, cursor = _take_oldest(added, 3, "9")
+    assert [m["id"] for m in messages] == ["d", "c", "b", "a"] and cursor == "5"
+
+def test_incremental_sync_saves_the_cursor_only_when_asked(service):
+    save_history_id("me", "100")
+    service.history_result = _history(("101", ["a"]), ("102", ["b"]), ("103", ["c"]), ("104", ["d"]))
+
+    emails, save_cursor = sync_emails(n=3)
+    assert [e["id"] for e in emails] == ["c", "b", "a"]
+    assert load_history_id("me") == "100"
+    save_cursor()
+    assert load_history_id("me") == "103" # "d" is left for the next sync
+
+def test_expired_cursor_falls_back_to_a_full_resync(service):
+    save_history_id("me", "100")
+    service.history_result = _http_error(404)
+    service.inbox = ["x", "y", "z", "w"]
+
+    emails, save_cursor = sync_emails(n=3, resync_n=2)
+    assert [e["id"] for e in emails] == ["x", "y"]
+    save_cursor()
+    assert load_history_id("me") == "900"
+
+def test_fetch_failure_keeps_the_cursor(service):
+    save_history_id("me", "100")
+    service.history_result = _history(("101", ["a"]), ("102", ["b"]))
+    service.broken = {"b"}
+
+    emails, save_cursor = sync_emails(n=3)
+    assert [e["id"] for e in emails] == ["a"]
+    save_cursor()
+    assert load_history_id("me") == "100"
+
+def test_poll_saves_the_cursor_after_the_claim(monkeypatch):
+    import email_service
+    saved = []
+    emails = [{"id": "a", "body": "Hello"}]
+    monkeypatch.setattr(email_service, "GMAIL_SYNC_MODE", "incremental")
+    monkeypatch.setattr(email_service, "TO_WHATSAPP", "whatsapp:+15550000")
+    monkeypatch.setattr(email_service, "sync_emails", lambda: (emails, lambda: saved.append(True)))
+    monkeypatch.setattr(email_service, "load_user_context", lambda phone: {})
+    monkeypatch.setattr(email_service, "triage", lambda pending: ([], pending))
+
+    def broken_claim(ids):
+        raise RuntimeError("database is locked")
+    monkeypatch.setattr(email_service.processed_ids, "claim", broken_claim)
+    email_service.process_new_emails()
+    assert saved == []
+
+    monkeypatch.setattr(email_service.processed_ids, "claim", lambda ids: list(ids))
+    email_service.process_new_emails()
+    assert saved == [True]
@@ -0,0 +1,46 @@
+import pytest
+from intent_rules import match_intent
+
+# (message, expected intent); None means the LLM decides
+CORPUS = [
+    ("send", "SEND"),
+    ("Send it", "SEND"),
+    ("yes send it", "SEND"),
+    ("ok, send it now!", "SEND"),
+    ("Can you send it?", "SEND"),
+    ("could you send it now", "SEND"),
+    ("please send the reply", "SEND"),
+    ("looks good, go ahead", "SEND"),
+    ("👍", "SEND"),
+    ("cancel", "CANCEL"),
+    ("Do not send it", "CANCEL"),
+    ("don't send it yet", "CANCEL"),
+    ("No, don't reply", "CANCEL"),
+    ("nevermind", "CANCEL"),
+    ("discard the draft", "CANCEL"),
+    ("thank you", "QUESTION"),
+    ("Thanks!", "QUESTION"),
+    ("ok thanks", "QUESTION"),
+    ("thx 🙏", "QUESTION"),
+    ("Reply that I'll attend", "DRAFT"),
+    ("accept the interview", "DRAFT"),
+    ("can you reply saying yes?", "DRAFT"),
+    ("reply that I cannot attend on Monday", "DRAFT"),
+    ("thank them for the invite", "DRAFT"),
+    ("make it shorter", "DRAFT"),
+    ("When is the deadline?", "QUESTION"),
+    ("Can you tell me the deadline?", "QUESTION"),
+    ("who sent this", "QUESTION"),
+    ("Say nothing, just tell me the deadline", None),
+    ("no, send it", None),
+    ("send it to HR instead?", None),
+    ("What should I reply?", None),
+    ("reply and tell me when they answer", None),
+    ("don't reply, just summarize it", None),
+    ("hmm", None),
+    ("", None),
+]
+
+@pytest.mark.parametrize("message,expected", CORPUS)
+def test_corpus(message, expected):
+    assert match_intent(message) == expected
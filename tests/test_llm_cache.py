@@ -0,0 +1,52 @@
+import llm_cache
+from models import Base, engine, SessionLocal, LLMCacheEntry
+
+def setup_function():
+    Base.metadata.create_all(engine)
+    session = SessionLocal()
+    session.query(LLMCacheEntry).delete()
+    session.commit()
+    session.close()
+    llm_cache._memory.clear()
+    llm_cache._touched.clear()
+
+def _row(key):
+    session = SessionLocal()
+    try:
+        return session.get(LLMCacheEntry, key)
+    finally:
+        session.close()
+
+def test_memory_hits_write_recency_through_in_batches(monkeypatch):
+    monkeypatch.setattr(llm_cache, "TOUCH_FLUSH_EVERY", 2)
+    llm_cache.put("a", "answer a", 1.0)
+    llm_cache.put("b", "answer b", 1.0)
+    stored = _row("a").last_used_at
+
+    assert llm_cache.get("a") == "answer a" # Memory hit, queued
+    assert _row("a").hits == 0
+    assert llm_cache.get("b") == "answer b" # Second key: flushed
+    assert _row("a").hits == 1 and _row("b").hits == 1
+    assert _row("a").last_used_at >= stored
+    assert not llm_cache._touched
+
+def test_flush_before_evict_keeps_memory_hot_rows(monkeypatch):
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_MAX_ROWS", 1)
+    llm_cache.put("old", "x", 1.0)
+    llm_cache.put("new", "y", 1.0)
+    llm_cache.get("old") # Only in memory so far
+    session = SessionLocal()
+    try:
+        llm_cache._evict(session, llm_cache.datetime.utcnow())
+    finally:
+        session.close()
+    assert _row("old") is not None
+    assert _row("new") is None
+
+def test_key_depends_only_on_the_providers_own_params(monkeypatch):
+    import llm_processor
+    messages = [{"role": "user", "content": "hi"}]
+    gemini, groq = llm_processor._cache_key(messages, False, "gemini"), llm_processor._cache_key(messages, False, "groq")
+    monkeypatch.setitem(llm_processor.REQUEST_PARAMS, "groq", {"temperature": 0.9})
+    assert llm_processor._cache_key(messages, False, "gemini") == gemini
+    assert llm_processor._cache_key(messages, False, "groq") != groq
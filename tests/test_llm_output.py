@@ -0,0 +1,61 @@
+from llm_output import parse_object, parse_list, CLASSIFICATION_SCHEMA, BATCH_ITEM_SCHEMA, INTENT_SCHEMA
+from deadline_parser import parse_deadline
+
+def test_fenced_json_with_prose():
+    text = 'Sure:\n```json\n{"is_important": true, "title": "Offer", "deadline": "2025-04-01 12:00:00"}\n```'
+    assert parse_object(text, CLASSIFICATION_SCHEMA) == {
+        "is_important": True, "title": "Offer", "deadline": "2025-04-01 12:00:00"
+    }
+
+def test_aware_deadline_converted_to_utc():
+    parsed = parse_object('{"is_important": true, "deadline": "2025-04-01T17:30:00+05:30"}', CLASSIFICATION_SCHEMA)
+    assert parsed["deadline"] == "2025-04-01 12:00:00+00:00"
+    assert str(parse_deadline(parsed["deadline"])) == "2025-04-01 12:00:00"
+
+def test_zulu_deadline():
+    parsed = parse_object('{"is_important": true, "deadline": "2025-04-01T09:00:00Z"}', CLASSIFICATION_SCHEMA)
+    assert parsed["deadline"] == "2025-04-01 09:00:00+00:00"
+
+def test_naive_deadline_normalized():
+    parsed = parse_object('{"is_important": true, "deadline": "2025-06-30"}', CLASSIFICATION_SCHEMA)
+    assert parsed["deadline"] == "2025-06-30 00:00:00"
+
+def test_free_text_deadline_passed_through():
+    parsed = parse_object('{"is_important": "yes", "deadline": "next Friday"}', CLASSIFICATION_SCHEMA)
+    assert parsed == {"is_important": True, "deadline": "next Friday"}
+
+def test_missing_and_null_optional_fields_left_out():
+    parsed = parse_object('{"is_important": false, "title": null, "summary": 42}', CLASSIFICATION_SCHEMA)
+    assert parsed == {"is_important": False, "summary": "42"}
+    assert parsed.get("title", "No Title") == "No Title"
+
+def test_invalid_optional_field_left_out():
+    parsed = parse_object('{"is_important": true, "title": ["a", "b"]}', CLASSIFICATION_SCHEMA)
+    assert parsed == {"is_important": True}
+
+def test_missing_required_field_rejected():
+    assert parse_object('{"title": "No flag"}', CLASSIFICATION_SCHEMA) is None
+
+def test_python_literals_and_smart_quotes_repaired():
+    assert parse_object("{'is_important': True, 'deadline': None}", CLASSIFICATION_SCHEMA) == {"is_important": True}
+    assert parse_object('{“is_important”: false}', CLASSIFICATION_SCHEMA) == {"is_important": False}
+
+def test_python_literal_inside_string_untouched():
+    parsed = parse_object("{'is_important': True, 'summary': 'None of the dates work'}", CLASSIFICATION_SCHEMA)
+    assert parsed["summary"] == "None of the dates work"
+
+def test_nested_object():
+    parsed = parse_object('{"result": {"is_important": true, "title": "Scholarship"}}', CLASSIFICATION_SCHEMA)
+    assert parsed == {"is_important": True, "title": "Scholarship"}
+
+def test_refusal_and_truncated():
+    assert parse_object("I'm sorry, I can't tell.", CLASSIFICATION_SCHEMA) is None
+    assert parse_object('{"is_important": true, "title": "Cut off', CLASSIFICATION_SCHEMA) is None
+
+def test_batch_list_drops_invalid_items():
+    text = '{"results": [{"id": "E1", "is_important": true}, {"id": "E2"}, {"is_important": false}]}'
+    assert parse_list(text, BATCH_ITEM_SCHEMA) == [{"id": "E1", "is_important": True}, {"is_important": False}]
+
+def test_intent_enum():
+    assert parse_object('{"intent": "send"}', INTENT_SCHEMA) == {"intent": "SEND"}
+    assert parse_object('{"intent": "maybe"}', INTENT_SCHEMA) is None
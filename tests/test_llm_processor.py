@@ -0,0 +1,62 @@
+import json
+import pytest
+import llm_processor
+from llm_processor import _map_batch_results
+
+BATCH = [("m1", "first body"), ("m2", "second body"), ("m3", "third body")]
+
+@pytest.fixture
+def retried(monkeypatch):
+    calls = []
+    def single(text):
+        calls.append(text)
+        return {"is_important": True, "title": f"retried {text}"}
+    monkeypatch.setattr(llm_processor, "process_email_with_llm", single)
+    return calls
+
+def _response(*items):
+    return json.dumps({"results": list(items)})
+
+def test_labels_map_back_to_message_ids(retried):
+    content = _response(
+        {"id": "E2", "is_important": True, "title": "Interview"},
+        {"id": "[E1]", "is_important": False},
+        {"id": "e3", "is_important": False},
+    )
+    results = _map_batch_results(BATCH, content)
+    assert results == {"m1": None, "m2": {"id": "E2", "is_important": True, "title": "Interview"}, "m3": None}
+    assert retried == []
+
+def test_garbled_labels_fall_back_to_position(retried):
+    content = _response(
+        {"id": "first", "is_important": True, "title": "Offer"},
+        {"is_important": False},
+        {"id": "E9", "is_important": False},
+    )
+    results = _map_batch_results(BATCH, content)
+    assert results["m1"]["title"] == "Offer"
+    assert results["m2"] is None and results["m3"] is None
+    assert retried == []
+
+def test_no_position_fallback_when_items_are_missing(retried):
+    content = _response({"id": "first", "is_important": True, "title": "Offer"}, {"id": "E3", "is_important": False})
+    results = _map_batch_results(BATCH, content)
+    # Only E3 is certain; the other two are retried one by one
+    assert results["m3"] is None
+    assert retried == ["first body", "second body"]
+    assert results["m1"]["title"] == "retried first body"
+
+def test_duplicate_labels_keep_the_first(retried):
+    content = _response(
+        {"id": "E1", "is_important": False},
+        {"id": "E1", "is_important": True, "title": "Duplicate"},
+        {"id": "E2", "is_important": False},
+        {"id": "E3", "is_important": False},
+    )
+    assert _map_batch_results(BATCH, content)["m1"] is None
+    assert retried == []
+
+def test_unparseable_batch_retries_everything(retried):
+    results = _map_batch_results(BATCH, "Sorry, I can't help with that.")
+    assert retried == ["first body", "second body", "third body"]
+    assert set(results) == {"m1", "m2", "m3"}
@@ -0,0 +1,17 @@
+import base64
+from mime_body import extract_body
+
+def _part(mime_type, text):
+    return {"mimeType": mime_type, "body": {"data": base64.urlsafe_b64encode(text.encode()).decode()}}
+
+def test_plain_text_preferred():
+    payload = {"mimeType": "multipart/alternative", "parts": [
+        _part("text/plain", "Interview on Friday"), _part("text/html", "<p>HTML version</p>")
+    ]}
+    assert extract_body(payload) == "Interview on Friday"
+
+def test_blank_plain_part_falls_back_to_html():
+    payload = {"mimeType": "multipart/alternative", "parts": [
+        _part("text/plain", " \r\n "), _part("text/html", "<p>Interview on <b>Friday</b></p>")
+    ]}
+    assert extract_body(payload) == "Interview on Friday"
@@ -0,0 +1,72 @@
+import os
+import pytest
+import processed_ids
+from models import Base, engine, SessionLocal, ProcessedEmail
+
+@pytest.fixture(autouse=True)
+def fresh(monkeypatch, tmp_path):
+    monkeypatch.setattr(processed_ids, "RESET_FILE", str(tmp_path / "reset"))
+    Base.metadata.create_all(engine)
+    session = SessionLocal()
+    session.query(ProcessedEmail).delete()
+    session.commit()
+    session.close()
+    processed_ids.invalidate()
+
+def test_claim_returns_only_new_ids_in_order():
+    assert processed_ids.claim(["b", "a", "b"]) == ["b", "a"]
+    assert processed_ids.claim(["a", "c", "b"]) == ["c"]
+    assert processed_ids.filter_new(["a", "d"]) == ["d"]
+
+def test_claim_skips_rows_another_process_inserted():
+    session = SessionLocal()
+    session.add(ProcessedEmail(id="x"))
+    session.commit()
+    session.close()
+    assert processed_ids.claim(["x", "y"]) == ["y"]
+
+def test_claim_raises_on_db_error(monkeypatch):
+    class BrokenSession:
+        def get_bind(self):
+            raise RuntimeError("database is locked")
+        def rollback(self):
+            pass
+        def close(self):
+            pass
+    monkeypatch.setattr(processed_ids, "SessionLocal", BrokenSession)
+    monkeypatch.setattr(processed_ids, "_warm", True)
+    monkeypatch.setattr(processed_ids, "_reset_mtime", processed_ids._reset_marker())
+    with pytest.raises(RuntimeError):
+        processed_ids.claim(["new-id"])
+    assert "new-id" not in processed_ids._seen
+
+def test_reset_from_another_process_drops_memory_layer():
+    processed_ids.claim(["a"])
+    session = SessionLocal()
+    session.query(ProcessedEmail).delete()
+    session.commit()
+    session.close()
+    assert processed_ids.filter_new(["a"]) == [] # Still remembered
+    with open(processed_ids.RESET_FILE, "w") as f:
+        f.write("cleared\n")
+    os.utime(processed_ids.RESET_FILE, (1, 1))
+    assert processed_ids.filter_new(["a"]) == ["a"]
+
+def test_default_reset_file_is_next_to_the_module():
+    import importlib
+    module = importlib.reload(processed_ids)
+    assert os.path.dirname(module.RESET_FILE) == os.path.dirname(os.path.abspath(module.__file__))
+
+def test_poll_does_not_advance_cursor_when_claim_fails(monkeypatch):
+    import email_service
+    saved = []
+    email = {"id": "m1", "body": "Interview on Friday", "subject": "Hi", "from": "a@b.c"}
+    monkeypatch.setattr(email_service, "GMAIL_SYNC_MODE", "incremental")
+    monkeypatch.setattr(email_service, "sync_emails", lambda: ([email], lambda: saved.append(True)))
+    monkeypatch.setattr(email_service, "TO_WHATSAPP", "whatsapp:+15550000000")
+    monkeypatch.setattr(email_service, "load_user_context", lambda phone: {})
+    def broken_claim(ids):
+        raise RuntimeError("database is locked")
+    monkeypatch.setattr(email_service.processed_ids, "claim", broken_claim)
+    email_service.process_new_emails()
+    assert saved == []
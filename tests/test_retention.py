@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+import pytest
+import processed_ids
+import retention
+from models import Base, engine, SessionLocal, ProcessedEmail, SyncState, Email, EmailBody
+
+NOW = datetime(2025, 6, 1, 12, 0)
+
+@pytest.fixture(autouse=True)
+def fresh(monkeypatch, tmp_path):
+    monkeypatch.setattr(processed_ids, "RESET_FILE", str(tmp_path / "reset"))
+    monkeypatch.setattr(retention, "RETENTION_ENABLED", True)
+    monkeypatch.setattr(retention, "PROCESSED_IDS_KEEP_LATEST", 2)
+    monkeypatch.setattr(retention, "SYNC_LIST_SIZE", 2)
+    monkeypatch.setattr(retention, "_stats", {**retention._stats, "runs": 0, "failed_runs": 0, "last_errors": None})
+    Base.metadata.create_all(engine)
+    session = SessionLocal()
+    session.query(ProcessedEmail).delete()
+    session.query(SyncState).delete()
+    session.query(EmailBody).delete()
+    session.query(Email).delete()
+    session.commit()
+    session.close()
+    processed_ids.invalidate()
+
+def _add_processed(days_ago):
+    session = SessionLocal()
+    for n, days in enumerate(days_ago):
+        session.add(ProcessedEmail(id=f"m{n}", processed_at=NOW - timedelta(days=days)))
+    session.commit()
+    session.close()
+
+def _cutoff():
+    session = SessionLocal()
+    try:
+        return retention.processed_ids_cutoff(session, NOW)
+    finally:
+        session.close()
+
+def test_cutoff_keeps_the_listing_window():
+    _add_processed([100, 90, 80])
+    assert _cutoff() == NOW - timedelta(days=90)
+    assert retention.prune_processed_ids(now=NOW) == (1, None)
+
+def test_cutoff_never_passes_the_oldest_sync_cursor():
+    _add_processed([100, 90, 80, 1])
+    session = SessionLocal()
+    session.add(SyncState(account="me", history_id="1", updated_at=NOW - timedelta(days=95)))
+    session.commit()
+    session.close()
+    assert _cutoff() == NOW - timedelta(days=95)
+
+def test_too_few_rows_prunes_nothing():
+    _add_processed([100])
+    assert _cutoff() is None
+    assert retention.prune_processed_ids(now=NOW) == (0, None)
+
+def test_chunk_error_is_reported(monkeypatch):
+    _add_processed([100, 90, 80])
+    def broken(session, cutoff):
+        raise RuntimeError("database is locked")
+    monkeypatch.setattr(retention, "_expired_processed_ids", broken)
+    monkeypatch.setattr(retention, "processed_ids_cutoff", lambda session, now: NOW)
+
+    assert retention.run_retention() is False
+    stats = retention.stats()
+    assert stats["runs"] == 1 and stats["failed_runs"] == 1
+    assert stats["last_errors"] == ["pruning processed IDs: database is locked"]
+
+def test_unknown_archive_mode_keeps_emails(monkeypatch):
+    monkeypatch.setattr(retention, "EMAIL_ARCHIVE", "tabel")
+    session = SessionLocal()
+    session.add(Email(id="old", created_at=NOW - timedelta(days=400)))
+    session.commit()
+    session.close()
+
+    archived, error = retention.archive_old_emails(now=NOW)
+    assert archived == 0 and "tabel" in error
+    session = SessionLocal()
+    assert session.get(Email, "old") is not None
+    session.close()
@@ -0,0 +1,48 @@
+import pytest
+import session_cache
+
+@pytest.fixture(autouse=True)
+def fresh(monkeypatch, tmp_path):
+    monkeypatch.setattr(session_cache, "RESET_FILE", str(tmp_path / "reset"))
+    monkeypatch.setattr(session_cache, "SESSION_CACHE_ENABLED", True)
+    monkeypatch.setattr(session_cache, "_entries", session_cache.OrderedDict())
+    monkeypatch.setattr(session_cache, "_generations", {})
+    monkeypatch.setattr(session_cache, "_reset_mtime", None)
+
+def test_read_is_cached_and_copied():
+    gen = session_cache.generation("p")
+    session_cache.put("p", {"step": "menu"}, True, gen)
+    data, exists, cached_gen = session_cache.get("p")
+    assert data == {"step": "menu"} and exists and cached_gen == gen
+    data["step"] = "changed"
+    assert session_cache.get("p")[0] == {"step": "menu"}
+
+def test_read_is_dropped_if_saved_meanwhile():
+    gen = session_cache.generation("p")
+    assert session_cache.saved("p", {"step": "new"}, gen) is not None
+    session_cache.put("p", {"step": "old"}, True, gen)
+    assert session_cache.get("p")[0] == {"step": "new"}
+
+def test_read_is_dropped_if_invalidated_meanwhile():
+    gen = session_cache.generation("p")
+    session_cache.invalidate("p")
+    session_cache.put("p", {"step": "old"}, True, gen)
+    assert session_cache.get("p") is None
+
+def test_save_from_stale_load_drops_the_entry():
+    gen = session_cache.generation("p")
+    session_cache.saved("p", {"step": "first"}, gen)
+    assert session_cache.saved("p", {"step": "second"}, gen) is None
+    assert session_cache.get("p") is None
+
+def test_reset_file_drops_everything():
+    gen = session_cache.generation("p")
+    session_cache.put("p", {"step": "menu"}, True, gen)
+    session_cache.invalidate([], other_processes=True)
+    assert session_cache.get("p") is not None # Our own reset is already applied
+
+    # Another process touching the file
+    session_cache._reset_mtime = -1
+    assert session_cache.get("p") is None
+    session_cache.put("p", {"step": "menu"}, True, gen)
+    assert session_cache.get("p") is None
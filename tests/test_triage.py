@@ -0,0 +1,59 @@
+import pytest
+import triage
+from models import Base, engine, SessionLocal, TriageLog
+
+PROMO = {
+    "id": "promo", "from": "Deals <noreply@shop.example>", "subject": "Weekend sale: 40% off everything",
+    "list_unsubscribe": "<mailto:unsub@shop.example>", "body": "Limited time. Unsubscribe here."
+}
+INTERVIEW = {
+    "id": "interview", "from": "Recruiting <noreply@acme.example>", "subject": "Interview invitation",
+    "list_unsubscribe": "", "body": "Please confirm your interview slot by 14 March 2025."
+}
+
+@pytest.fixture(autouse=True)
+def fresh(monkeypatch):
+    monkeypatch.setattr(triage, "TRIAGE_ENABLED", True)
+    monkeypatch.setattr(triage, "TRIAGE_THRESHOLD", 0.7)
+    Base.metadata.create_all(engine)
+    session = SessionLocal()
+    session.query(TriageLog).delete()
+    session.commit()
+    session.close()
+
+def _logged(msg_id):
+    session = SessionLocal()
+    try:
+        return session.get(TriageLog, msg_id)
+    finally:
+        session.close()
+
+def test_scores_promotions_high_and_actionable_mail_low():
+    promo_score, _ = triage.score_email(PROMO)
+    interview_score, reasons = triage.score_email(INTERVIEW)
+    assert promo_score >= triage.TRIAGE_THRESHOLD > interview_score
+    assert "actionable_keywords" in reasons
+
+def test_skips_at_or_above_the_threshold(monkeypatch):
+    monkeypatch.setattr(triage, "TRIAGE_AUDIT_SAMPLE", 0.0)
+    to_llm, skipped = triage.triage([PROMO, INTERVIEW])
+    assert to_llm == [INTERVIEW] and skipped == [PROMO]
+    assert _logged("promo").skipped and not _logged("interview").skipped
+
+    score, _ = triage.score_email(PROMO)
+    monkeypatch.setattr(triage, "TRIAGE_THRESHOLD", score + 0.01)
+    to_llm, skipped = triage.triage([PROMO])
+    assert to_llm == [PROMO] and skipped == []
+
+def test_audit_sample_still_reaches_the_llm(monkeypatch):
+    monkeypatch.setattr(triage, "TRIAGE_AUDIT_SAMPLE", 1.0)
+    to_llm, skipped = triage.triage([PROMO])
+    assert to_llm == [PROMO] and skipped == []
+    assert not _logged("promo").skipped # Logged as sent, so evaluate() gets its verdict
+
+    triage.record_verdicts({"promo": None})
+    assert _logged("promo").llm_important is False
+
+def test_disabled_sends_everything(monkeypatch):
+    monkeypatch.setattr(triage, "TRIAGE_ENABLED", False)
+    assert triage.triage([PROMO]) == ([PROMO], [])
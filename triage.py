@@ -0,0 +1,153 @@
+# triage.py
+import os
+import re
+import sys
+import random
+from datetime import datetime
+from email_parser import extract_dates, CATEGORY_KEYWORDS
+from models import SessionLocal, TriageLog
+
+# Local pre-filter: scores how likely an email is a promotion/notification
+# (0 = actionable, 1 = clearly noise). Emails scoring >= TRIAGE_THRESHOLD are
+# marked "not important" without an LLM call.
+TRIAGE_ENABLED = os.getenv("TRIAGE_ENABLED", "true").lower() == "true"
+TRIAGE_THRESHOLD = float(os.getenv("TRIAGE_THRESHOLD", "0.7"))
+# Fraction of would-be-skipped emails still sent to the LLM, so `evaluate`
+# has verdicts to compare against
+TRIAGE_AUDIT_SAMPLE = float(os.getenv("TRIAGE_AUDIT_SAMPLE", "0.1"))
+
+SENDER_PATTERN = re.compile(r'no-?reply|newsletter|marketing|notifications?@|promo|deals|offers|mailer|digest', re.IGNORECASE)
+SUBJECT_PATTERN = re.compile(
+    r'\b(?:sale|\d+% off|discount|deal|offer ends|newsletter|digest|receipt|your order|order confirmation|'
+    r'shipped|delivered|weekly|monthly|top picks|recommended for you|sign-?in|security alert)\b',
+    re.IGNORECASE
+)
+BODY_PATTERN = re.compile(r'unsubscribe|view (?:this email )?in (?:your )?browser|manage (?:your )?preferences|limited time', re.IGNORECASE)
+ACTIONABLE_PATTERN = re.compile(
+    r'\b(?:' + '|'.join(re.escape(kw) for kws in CATEGORY_KEYWORDS.values() for kw in kws) + r'|deadline|due|rsvp|confirm)\b',
+    re.IGNORECASE
+)
+
+WEIGHTS = {
+    "list_unsubscribe": 0.35,
+    "bulk_sender": 0.2,
+    "promo_subject": 0.25,
+    "promo_body": 0.15,
+    "actionable_keywords": -0.35,
+    "mentions_date": -0.15,
+}
+
+def score_email(email):
+    """
+    Returns (score, reasons) for an email dict from gmail_fetcher.
+    """
+    subject = email.get("subject", "") or ""
+    sender = email.get("from", "") or ""
+    body = email.get("body", "") or ""
+
+    reasons = []
+    if email.get("list_unsubscribe"):
+        reasons.append("list_unsubscribe")
+    if SENDER_PATTERN.search(sender):
+        reasons.append("bulk_sender")
+    if SUBJECT_PATTERN.search(subject):
+        reasons.append("promo_subject")
+    if BODY_PATTERN.search(body):
+        reasons.append("promo_body")
+    if ACTIONABLE_PATTERN.search(subject) or ACTIONABLE_PATTERN.search(body[:2000]):
+        reasons.append("actionable_keywords")
+    if extract_dates(subject + " " + body[:2000]):
+        reasons.append("mentions_date")
+
+    score = sum(WEIGHTS[r] for r in reasons)
+    return round(min(max(score, 0.0), 1.0), 3), reasons
+
+def triage(emails):
+    """
+    Splits emails into (to_llm, skipped) and writes every decision to triage_log.
+    """
+    if not TRIAGE_ENABLED:
+        return list(emails), []
+
+    to_llm, skipped = [], []
+    session = SessionLocal()
+    try:
+        for email in emails:
+            score, reasons = score_email(email)
+            skip = score >= TRIAGE_THRESHOLD
+            sampled = skip and random.random() < TRIAGE_AUDIT_SAMPLE
+            if skip and not sampled:
+                print(f"   -> Skipping without LLM (score {score}, {', '.join(reasons)}): {email.get('subject', '')[:60]}")
+                skipped.append(email)
+            else:
+                to_llm.append(email)
+
+            session.merge(TriageLog(
+                id=email["id"],
+                sender=email.get("from"),
+                subject=email.get("subject"),
+                score=score,
+                reasons=",".join(reasons),
+                skipped=skip and not sampled,
+                created_at=datetime.utcnow()
+            ))
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        print(f"⚠️ Triage log write failed: {e}")
+    finally:
+        session.close()
+
+    return to_llm, skipped
+
+def record_verdicts(verdicts):
+    """
+    Stores the LLM's important / not important verdict (msg_id -> parsed or None)
+    next to the triage score, for evaluate().
+    """
+    if not verdicts:
+        return
+    session = SessionLocal()
+    try:
+        for msg_id, parsed in verdicts.items():
+            session.query(TriageLog).filter_by(id=msg_id).update({"llm_important": bool(parsed)})
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        print(f"⚠️ Triage verdict write failed: {e}")
+    finally:
+        session.close()
+
+def evaluate(thresholds=None):
+    """
+    Offline check of the pre-filter against stored LLM verdicts.
+    "Positive" = triage would skip the email; it is correct when the LLM
+    also said not important.
+    """
+    session = SessionLocal()
+    try:
+        rows = session.query(TriageLog.score, TriageLog.llm_important).filter(TriageLog.llm_important.isnot(None)).all()
+    finally:
+        session.close()
+
+    if not rows:
+        print("No emails with LLM verdicts in triage_log yet.")
+        return
+
+    print(f"📊 Evaluating triage on {len(rows)} emails with LLM verdicts")
+    print(f"{'threshold':>10} {'skipped':>8} {'precision':>10} {'recall':>8} {'wrongly skipped':>16}")
+    for threshold in thresholds or sorted({0.5, 0.6, TRIAGE_THRESHOLD, 0.8, 0.9}):
+        tp = sum(1 for score, important in rows if score >= threshold and not important)
+        fp = sum(1 for score, important in rows if score >= threshold and important)
+        fn = sum(1 for score, important in rows if score < threshold and not important)
+        precision = tp / (tp + fp) if tp + fp else 1.0
+        recall = tp / (tp + fn) if tp + fn else 0.0
+        marker = " <- current" if threshold == TRIAGE_THRESHOLD else ""
+        print(f"{threshold:>10.2f} {tp + fp:>8} {precision:>10.2%} {recall:>8.2%} {fp:>16}{marker}")
+
+if __name__ == "__main__":
+    # Usage: python triage.py evaluate [threshold ...]
+    if len(sys.argv) > 1 and sys.argv[1] == "evaluate":
+        evaluate([float(t) for t in sys.argv[2:]] or None)
+    else:
+        print("Usage: python triage.py evaluate [threshold ...]")
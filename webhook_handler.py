@@ -1,21 +1,118 @@
-from flask import Flask, request
+from flask import Flask, request, jsonify
 from whatsapp_bot import send_raw_message
-from reply_generator import generate_reply
-from context_store import load_context, save_context
-from llm_processor import classify_intent, chat_with_email
+from reply_generator import generate_reply, stream_reply
+from context_store import load_user_context, save_user_context, email_body, load_history_id
+from llm_processor import classify_intent, chat_with_email, StreamInterrupted
 from gmail_sender import send_email
+from gmail_fetcher import GMAIL_ACCOUNT, GMAIL_ADDRESS
+from email_service import trigger_sync
+import llm_cache
+import intent_rules
+import llm_executor
+import email_preprocess
+import deadline_parser
+import processed_ids
+import retention
+import session_cache
 import re
 import os
+import json
+import base64
 from dotenv import load_dotenv
 
 load_dotenv()
 
 app = Flask(__name__)
 
+# Send drafts to WhatsApp paragraph by paragraph while they are generated
+DRAFT_STREAMING = os.getenv("DRAFT_STREAMING", "true").lower() == "true"
+# Short paragraphs (e.g. "Dear Ms. Rao,") are held back and merged with the next one
+DRAFT_CHUNK_MIN_CHARS = 120
+
+def stream_draft_to_whatsapp(email_body, instruction, sender):
+    """
+    Streams a reply draft and sends each completed paragraph to WhatsApp as
+    soon as it is ready. Returns the full draft text; raises
+    StreamInterrupted if generation broke off after paragraphs were sent.
+    """
+    draft, buffer, sent_any = "", "", False
+
+    def _send(chunk):
+        nonlocal sent_any
+        send_raw_message(("📝 *Draft:*\n\n" if not sent_any else "") + chunk, sender)
+        sent_any = True
+
+    for piece in stream_reply(email_body, instruction):
+        draft += piece
+        buffer += piece
+        cut = buffer.rfind("\n\n")
+        if cut >= DRAFT_CHUNK_MIN_CHARS:
+            _send(buffer[:cut].strip())
+            buffer = buffer[cut + 2:]
+
+    if buffer.strip():
+        _send(buffer.strip())
+    return draft.strip()
+
 @app.route("/")
 def home():
     return "Email Bot Running. Use /whatsapp for webhook.", 200
 
+@app.route("/stats")
+def stats():
+    # Off unless STATS_TOKEN is set; then expected as ?token=, like /gmail/push
+    stats_token = os.getenv("STATS_TOKEN")
+    if not stats_token or request.args.get("token") != stats_token:
+        return "Not Found", 404
+
+    return jsonify({
+        "llm_cache": llm_cache.stats(),
+        "intent": intent_rules.stats(),
+        "llm": llm_executor.stats(),
+        "prompt_tokens": email_preprocess.stats(),
+        "deadlines": deadline_parser.stats(),
+        "processed_ids": processed_ids.stats(),
+        "retention": retention.stats(),
+        "sessions": session_cache.stats()
+    }), 200
+
+@app.route("/gmail/push", methods=["POST"])
+def gmail_push():
+    """
+    Gmail watch notifications, delivered by a Pub/Sub push subscription:
+    {"message": {"data": base64({"emailAddress": ..., "historyId": ...})}, "subscription": ...}
+    """
+    # Off unless GMAIL_PUSH_TOKEN is set: each push starts a sync and its LLM calls
+    push_token = os.getenv("GMAIL_PUSH_TOKEN")
+    if not push_token:
+        return "Not Found", 404
+    if request.args.get("token") != push_token:
+        return "Forbidden", 403
+
+    envelope = request.get_json(silent=True) or {}
+    try:
+        notification = json.loads(base64.b64decode(envelope['message']['data']))
+        email_address = notification['emailAddress']
+        history_id = int(notification['historyId'])
+    except Exception:
+        print("⚠️ Ignoring malformed Gmail push notification.")
+        return "OK", 200 # Ack anyway, or Pub/Sub keeps redelivering it
+
+    print(f"📨 Gmail push for {email_address} (historyId {history_id})")
+
+    if GMAIL_ADDRESS and email_address.lower() != GMAIL_ADDRESS.lower():
+        print(f"   -> Not our mailbox ({GMAIL_ADDRESS}), ignoring.")
+        return "OK", 200
+
+    last_history_id = load_history_id(GMAIL_ACCOUNT)
+    if last_history_id and history_id <= int(last_history_id):
+        print("   -> Already synced past this point.")
+        return "OK", 200
+
+    # Sync in the background: Pub/Sub expects a fast ack
+    trigger_sync()
+    return "OK", 200
+
 @app.route("/whatsapp", methods=["POST", "GET"])
 def whatsapp_reply():
     # 0. Verification (For Meta Cloud API)
@@ -65,9 +162,8 @@ def whatsapp_reply():
     sender = str(sender).replace("+", "") # Remove + to match Meta/DB format
     print(f"📩 Incoming message from {sender}: {incoming_msg}")
 
-    context = load_context()
-    print(f"DEBUG: Known Users in DB: {list(context.keys())}") # Debug Key Match
-    user_ctx = context.get(sender, {})
+    # Only this sender's row and menu emails (one query)
+    user_ctx = load_user_context(sender)
 
     # 2. Check for Direct Email Selection (e.g., "1", "2")
     match = re.match(r"^(\d+)$", incoming_msg)
@@ -89,8 +185,7 @@ def whatsapp_reply():
         else:
             reply = f"⚠️ Email {email_idx} not found in recent context."
         
-        context[sender] = user_ctx
-        save_context(context)
+        save_user_context(sender, user_ctx)
         send_raw_message(reply, sender)
         return "OK", 200
 
@@ -142,22 +237,38 @@ def whatsapp_reply():
     elif intent == "DRAFT":
         # Generate a draft
         send_raw_message("✍️ Drafting your reply...", sender) # Ack
-        draft = generate_reply(email_data['original_body'], instruction=incoming_msg)
-        user_ctx['pending_draft'] = draft
-        reply = (
-            f"📝 *Draft Generated:*\n\n"
-            f"{draft}\n\n"
-            "-----------------------------\n"
-            "Reply *Send* to confirm, or give me feedback to change it."
-        )
+        if DRAFT_STREAMING:
+            try:
+                draft = stream_draft_to_whatsapp(email_body(email_data), incoming_msg, sender)
+            except StreamInterrupted:
+                draft = None
+                user_ctx.pop('pending_draft', None) # Never keep a partial draft
+                reply = "⚠️ The draft was cut off, so nothing was saved. Please send your instruction again."
+            if draft:
+                user_ctx['pending_draft'] = draft
+                reply = (
+                    "-----------------------------\n"
+                    "Reply *Send* to confirm, or give me feedback to change it."
+                )
+            elif draft is not None:
+                user_ctx.pop('pending_draft', None) # Don't let "Send" pick up the previous draft
+                reply = "❌ Error: LLM returned empty reply."
+        else:
+            draft = generate_reply(email_body(email_data), instruction=incoming_msg)
+            user_ctx['pending_draft'] = draft
+            reply = (
+                f"📝 *Draft Generated:*\n\n"
+                f"{draft}\n\n"
+                "-----------------------------\n"
+                "Reply *Send* to confirm, or give me feedback to change it."
+            )
         
     else: # QUESTION or general chat
-        answer = chat_with_email(email_data['original_body'], incoming_msg)
+        answer = chat_with_email(email_body(email_data), incoming_msg)
         reply = f"🤖 {answer}"
 
     # Save state
-    context[sender] = user_ctx
-    save_context(context)
+    save_user_context(sender, user_ctx)
     
     send_raw_message(reply, sender)
     return "OK", 200